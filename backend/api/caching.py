@@ -0,0 +1,75 @@
+"""
+接口响应缓存
+缓存中保存预先序列化好的数据和软过期时间：
+- 未过期时直接返回
+- 过期或缺失时，只有抢到缓存锁的调用方重建（singleflight），
+  其余调用方返回旧数据；没有旧数据时短暂等待重建结果
+数据和缓存锁都放在 RESPONSE_CACHE 指定的共享缓存中，缓存锁使用 cache.add，对所有 worker 生效
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+
+POPULAR_DESTINATIONS_KEY = 'api:popular_destinations'
+
+# 重建锁的超时时间（秒），也是等待重建结果的最长时间
+BUILD_LOCK_TIMEOUT = 10
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE', 'default')]
+
+
+def cache_call(method, *args, **kwargs):
+    """访问缓存，缓存不可用（如数据库缓存表被锁）时当作未命中，不影响接口返回"""
+    try:
+        return method(*args, **kwargs)
+    except DatabaseError as e:
+        print(f'访问缓存时出错: {str(e)}')
+        return None
+
+
+def get_or_build(key, build, timeout):
+    """返回 key 对应的缓存数据，过期时由单个调用方执行 build() 重建"""
+    cache = get_cache()
+    entry = cache_call(cache.get, key)
+    if entry is not None and entry['expires_at'] > time.time():
+        return entry['payload']
+
+    lock_key = f'{key}:lock'
+    if cache_call(cache.add, lock_key, 1, timeout=BUILD_LOCK_TIMEOUT):
+        try:
+            payload = build()
+            # 硬过期时间是软过期的两倍，重建期间其他调用方仍可返回旧数据
+            cache_call(
+                cache.set,
+                key,
+                {'payload': payload, 'expires_at': time.time() + timeout},
+                timeout=timeout * 2
+            )
+            return payload
+        finally:
+            cache_call(cache.delete, lock_key)
+
+    if entry is not None:
+        return entry['payload']
+
+    deadline = time.time() + BUILD_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache_call(cache.get, key)
+        if entry is not None:
+            return entry['payload']
+    return build()
+
+
+def get_popular_destinations(build):
+    """热门目的地的缓存数据"""
+    timeout = getattr(settings, 'POPULAR_DESTINATIONS_CACHE_TIMEOUT', 300)
+    return get_or_build(POPULAR_DESTINATIONS_KEY, build, timeout)
+
+
+def invalidate_popular_destinations():
+    cache_call(get_cache().delete, POPULAR_DESTINATIONS_KEY)
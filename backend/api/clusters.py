@@ -0,0 +1,167 @@
+"""
+地图聚合
+MapCell 表为每一级 geohash 精度预先保存网格内的景点数量、坐标和以及评分最高的景点：
+- 景点保存或删除时按差量更新所在的各级网格，各级网格合并为同一条查询
+- rebuild_map_cells 命令一次遍历全部景点重建整张表（批量导入后或定期执行）
+查询时按缩放级别选择精度，只返回视口内的网格，返回数量与数据密度无关
+"""
+from django.db import transaction
+from django.db.models import F, Q
+
+from .geo import cell_size, encode_geohash
+from .models import Attraction, MapCell
+from .renditions import rendition_prefetch
+
+CLUSTER_PRECISIONS = range(1, 9)
+MAX_CELLS = 900
+
+
+def zoom_to_precision(zoom):
+    """地图缩放级别对应的网格精度，网格宽度约为 1/4 瓦片"""
+    precision = round((zoom + 2) * 2 / 5)
+    return min(max(precision, CLUSTER_PRECISIONS[0]), CLUSTER_PRECISIONS[-1])
+
+
+def cells_in_bbox(west, south, east, north, precision):
+    """覆盖视口的网格编码集合"""
+    lat_span, lng_span = cell_size(precision)
+    cells = set()
+    lat = south
+    while True:
+        lng = west
+        while True:
+            cells.add(encode_geohash(min(lat, north), min(lng, east), precision))
+            if lng >= east:
+                break
+            lng += lng_span
+        if lat >= north:
+            break
+        lat += lat_span
+    return cells
+
+
+def visible_cells(west, south, east, north, zoom):
+    """视口内的非空网格；网格数超过 MAX_CELLS 时自动降低精度"""
+    precision = zoom_to_precision(zoom)
+    while True:
+        lat_span, lng_span = cell_size(precision)
+        estimated = ((north - south) / lat_span + 2) * ((east - west) / lng_span + 2)
+        if estimated <= MAX_CELLS or precision == CLUSTER_PRECISIONS[0]:
+            break
+        precision -= 1
+    cells = cells_in_bbox(west, south, east, north, precision)
+    return MapCell.objects.filter(
+        precision=precision, cell__in=cells, count__gt=0
+    ).select_related('top_attraction__cover_image').prefetch_related(
+        rendition_prefetch('top_attraction__cover_image__')
+    )
+
+
+def cell_prefixes(geohash):
+    """景点所在各级网格的编码，编码长度即精度"""
+    return [geohash[:precision] for precision in CLUSTER_PRECISIONS]
+
+
+def cells_of(geohash):
+    """景点所在的各级网格，一条查询取全"""
+    return MapCell.objects.filter(precision__in=CLUSTER_PRECISIONS, cell__in=cell_prefixes(geohash))
+
+
+def outranked_by(pk, rating):
+    """
+    最高评分景点应被 (rating, pk) 取代的网格
+    评分相同时取 id 较大的景点，与 rebuild_map_cells 和重新挑选时的排序一致
+    """
+    return (Q(top_attraction_id__isnull=True) | Q(top_rating__lt=rating)
+            | Q(top_rating=rating, top_attraction_id__lt=pk))
+
+
+def add_to_cells(attraction):
+    """把景点计入各级网格：补建缺少的网格后，各级合并为一条 UPDATE"""
+    if not attraction.geohash:
+        return
+    MapCell.objects.bulk_create([
+        MapCell(precision=len(prefix), cell=prefix) for prefix in cell_prefixes(attraction.geohash)
+    ], ignore_conflicts=True)
+    cells = cells_of(attraction.geohash)
+    cells.update(
+        count=F('count') + 1,
+        latitude_sum=F('latitude_sum') + attraction.latitude,
+        longitude_sum=F('longitude_sum') + attraction.longitude,
+    )
+    cells.filter(outranked_by(attraction.pk, attraction.rating)).update(
+        top_attraction=attraction, top_rating=attraction.rating
+    )
+
+
+def remove_from_cells(pk, geohash, latitude, longitude):
+    """把景点从各级网格中移除；移除的正好是网格的最高评分景点时重新挑选"""
+    if not geohash:
+        return
+    cells = cells_of(geohash)
+    cells.update(
+        count=F('count') - 1,
+        latitude_sum=F('latitude_sum') - latitude,
+        longitude_sum=F('longitude_sum') - longitude,
+    )
+    # 删除景点时级联已先把 top_attraction 置空
+    vacated = cells.filter(Q(top_attraction_id=pk) | Q(top_attraction_id__isnull=True, count__gt=0))
+    for precision, prefix in list(vacated.values_list('precision', 'cell')):
+        pick_top(MapCell.objects.filter(precision=precision, cell=prefix), prefix, exclude=pk)
+
+
+def pick_top(cells, prefix, exclude=None):
+    """重新挑选网格内评分最高的景点（由 (geohash, -rating, -id) 索引支持，只扫描索引）"""
+    attractions = Attraction.objects.filter(geohash__gte=prefix, geohash__lt=prefix + '~')
+    if exclude is not None:
+        attractions = attractions.exclude(pk=exclude)
+    top = attractions.order_by('-rating', '-id').values_list('pk', 'rating').first()
+    top_attraction_id, top_rating = top if top else (None, 0)
+    cells.update(top_attraction_id=top_attraction_id, top_rating=top_rating)
+
+
+def update_cells_rating(pk, geohash, rating):
+    """景点评分变化后更新各级网格的最高评分景点（数量和坐标和不变）"""
+    if not geohash:
+        return
+    cells = cells_of(geohash)
+    # 原来的最高评分景点降分后可能被超过，重新挑选
+    current_top = list(cells.filter(top_attraction_id=pk).values_list('precision', 'cell'))
+    cells.exclude(top_attraction_id=pk).filter(outranked_by(pk, rating)).update(
+        top_attraction_id=pk, top_rating=rating
+    )
+    for precision, prefix in current_top:
+        pick_top(MapCell.objects.filter(precision=precision, cell=prefix), prefix)
+
+
+def rebuild_map_cells():
+    """遍历全部景点重建 MapCell 表，返回网格数"""
+    aggregates = {}
+    rows = Attraction.objects.exclude(geohash='').values_list(
+        'pk', 'geohash', 'latitude', 'longitude', 'rating'
+    )
+    for pk, geohash, latitude, longitude, rating in rows.iterator(chunk_size=2000):
+        for precision in CLUSTER_PRECISIONS:
+            key = (precision, geohash[:precision])
+            entry = aggregates.get(key)
+            if entry is None:
+                entry = aggregates[key] = [0, 0.0, 0.0, None, 0.0]
+            entry[0] += 1
+            entry[1] += latitude
+            entry[2] += longitude
+            if entry[3] is None or (rating, pk) > (entry[4], entry[3]):
+                entry[3], entry[4] = pk, rating
+
+    cells = [
+        MapCell(
+            precision=precision, cell=cell, count=count,
+            latitude_sum=latitude_sum, longitude_sum=longitude_sum,
+            top_attraction_id=top_id, top_rating=top_rating
+        )
+        for (precision, cell), (count, latitude_sum, longitude_sum, top_id, top_rating)
+        in aggregates.items()
+    ]
+    with transaction.atomic():
+        MapCell.objects.all().delete()
+        MapCell.objects.bulk_create(cells, batch_size=1000)
+    return len(cells)
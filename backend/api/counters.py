@@ -0,0 +1,302 @@
+"""
+浏览量缓冲计数
+详情接口只在进程内累加浏览量，由后台线程每隔 VIEW_COUNT_FLUSH_INTERVAL 秒批量写回数据库
+（wsgi/asgi 入口调用 enable_background_flush 开启），读请求本身不写库：
+每批只执行一条 UPDATE ... SET views_count = views_count + CASE ... END，
+不再逐条保存整行（Destination 作为 Wagtail Page 尤其昂贵）
+进程退出时最多丢失最后一个间隔内尚未写回的计数，不在解释器退出过程中写库
+写库失败（如 SQLite 被锁）时，计数暂存到 VIEW_COUNT_CACHE 指定的共享缓存，
+由下一次任意进程的写回（包括 flush_view_counts 命令）合并
+
+同时按天记录独立访客的 HyperLogLog 草图：写回时与数据库中当天的草图合并，
+再合并最近 UNIQUE_VISITOR_WINDOW_DAYS 天的草图刷新 unique_visitors 字段；
+flush_view_counts 命令定时重新计算全部对象的窗口（不再有访问的对象也随窗口后移），并删除窗口外的草图
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .hyperloglog import HyperLogLog
+from .models import Attraction, Destination, VisitorSketch
+
+# SQLite 单条语句的参数上限为 999，分批写回
+FLUSH_BATCH_SIZE = 400
+
+
+def get_client_ip(request):
+    """
+    客户端 IP
+    X-Forwarded-For 可由客户端任意伪造，只在配置了 TRUSTED_PROXY_COUNT（前面的可信代理层数）时使用：
+    REMOTE_ADDR 为最后一层代理，从右往左跳过各层代理追加的地址
+    """
+    trusted = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    if not trusted:
+        return remote_addr
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    chain = [ip.strip() for ip in forwarded.split(',') if ip.strip()] + [remote_addr]
+    return chain[max(len(chain) - 1 - trusted, 0)]
+
+
+def get_visitor_key(request):
+    """访客标识：登录用户用用户ID，匿名用户用 IP + User-Agent 的指纹"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    ip = get_client_ip(request)
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    fingerprint = hashlib.sha256(f'{ip}|{user_agent}'.encode('utf-8')).hexdigest()
+    return f'anon:{fingerprint}'
+
+
+class ViewCountBuffer:
+    """单个模型的浏览量缓冲区"""
+
+    def __init__(self, model, sketch_field, field='views_count'):
+        self.model = model
+        self.sketch_field = sketch_field
+        self.field = field
+        self.pending = Counter()
+        # (pk, 日期) -> 当天尚未写回的访客草图
+        self.sketches = {}
+        self.lock = threading.Lock()
+        self.cache_key = f'view_counts:{model._meta.label_lower}'
+
+    @property
+    def cache(self):
+        """暂存计数的缓存，须为各进程共享的缓存"""
+        return caches[getattr(settings, 'VIEW_COUNT_CACHE', 'default')]
+
+    @property
+    def window_days(self):
+        return getattr(settings, 'UNIQUE_VISITOR_WINDOW_DAYS', 30)
+
+    def incr(self, pk, visitor=None, amount=1):
+        """记录一次浏览（visitor 为访客标识），只在进程内累加，由后台线程或命令写回"""
+        ensure_flush_thread()
+        with self.lock:
+            self.pending[pk] += amount
+            if visitor is not None:
+                key = (pk, timezone.localdate())
+                if key not in self.sketches:
+                    self.sketches[key] = HyperLogLog()
+                self.sketches[key].add(visitor)
+
+    def flush(self):
+        """将进程内和缓存中暂存的计数写回数据库，返回写回的对象数"""
+        with self.lock:
+            counts, self.pending = self.pending, Counter()
+            sketches, self.sketches = self.sketches, {}
+        counts.update(self._drain_parked())
+
+        if sketches:
+            try:
+                self._write_sketches(sketches)
+            except DatabaseError as e:
+                print(f'写回访客草图时出错: {str(e)}')
+                self._restore_sketches(sketches)
+
+        if not counts:
+            return 0
+        try:
+            self._write(counts)
+        except DatabaseError as e:
+            print(f'写回浏览量时出错，暂存到缓存: {str(e)}')
+            self._park(counts)
+            return 0
+        return len(counts)
+
+    def _write(self, counts):
+        items = list(counts.items())
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            increment = Case(
+                *[When(pk=pk, then=Value(amount)) for pk, amount in batch],
+                default=Value(0),
+                output_field=PositiveIntegerField(),
+            )
+            self.model.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                **{self.field: F(self.field) + increment}
+            )
+
+    def _write_sketches(self, sketches):
+        """与数据库中当天的草图按寄存器取最大值合并，再刷新窗口内的独立访客数"""
+        by_date = {}
+        for (pk, date), sketch in sketches.items():
+            by_date.setdefault(date, {})[pk] = sketch
+
+        with transaction.atomic():
+            for date, day_sketches in by_date.items():
+                existing = {
+                    getattr(row, f'{self.sketch_field}_id'): row
+                    for row in VisitorSketch.objects.select_for_update().filter(
+                        date=date, **{f'{self.sketch_field}_id__in': list(day_sketches)}
+                    )
+                }
+                created, updated = [], []
+                for pk, sketch in day_sketches.items():
+                    row = existing.get(pk)
+                    if row is None:
+                        created.append(VisitorSketch(
+                            date=date, registers=sketch.to_bytes(),
+                            **{f'{self.sketch_field}_id': pk}
+                        ))
+                    else:
+                        row.registers = sketch.merge(
+                            HyperLogLog.from_bytes(row.registers)
+                        ).to_bytes()
+                        updated.append(row)
+                VisitorSketch.objects.bulk_create(created)
+                VisitorSketch.objects.bulk_update(updated, ['registers'])
+
+            self._refresh_unique_visitors({pk for pk, _ in sketches})
+
+    def window_start(self):
+        return timezone.localdate() - timedelta(days=self.window_days - 1)
+
+    def refresh_window(self):
+        """
+        删除窗口外的草图，并重新计算全部对象窗口期内的独立访客数，返回删除的草图数
+        写回时只刷新本批被访问的对象，不再有访问的对象要靠这里随窗口后移
+        """
+        since = self.window_start()
+        field = f'{self.sketch_field}_id'
+        sketches = VisitorSketch.objects.filter(**{f'{field}__isnull': False})
+        deleted, _ = sketches.filter(date__lt=since).delete()
+
+        in_window = sketches.filter(date__gte=since)
+        pks = list(in_window.values_list(field, flat=True).distinct())
+        for start in range(0, len(pks), FLUSH_BATCH_SIZE):
+            self._refresh_unique_visitors(pks[start:start + FLUSH_BATCH_SIZE])
+        # 窗口内已没有草图的对象
+        self.model.objects.filter(unique_visitors__gt=0).exclude(
+            pk__in=in_window.values(field)
+        ).update(unique_visitors=0)
+        return deleted
+
+    def _refresh_unique_visitors(self, pks):
+        """合并窗口期内每天的草图，得到各对象的独立访客数"""
+        since = self.window_start()
+        merged = {}
+        rows = VisitorSketch.objects.filter(
+            date__gte=since, **{f'{self.sketch_field}_id__in': list(pks)}
+        ).values_list(f'{self.sketch_field}_id', 'registers')
+        for pk, registers in rows.iterator():
+            sketch = HyperLogLog.from_bytes(registers)
+            if pk in merged:
+                merged[pk].merge(sketch)
+            else:
+                merged[pk] = sketch
+
+        items = [(pk, sketch.count()) for pk, sketch in merged.items()]
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            self.model.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                unique_visitors=Case(
+                    *[When(pk=pk, then=Value(count)) for pk, count in batch],
+                    output_field=PositiveIntegerField(),
+                )
+            )
+
+    def _restore_sketches(self, sketches):
+        """写回失败时把草图合并回进程内，等下次写回"""
+        with self.lock:
+            for key, sketch in sketches.items():
+                if key in self.sketches:
+                    self.sketches[key].merge(sketch)
+                else:
+                    self.sketches[key] = sketch
+
+    def _with_cache_lock(self, func):
+        """在缓存锁内执行 func；拿不到锁时返回 None"""
+        lock_key = f'{self.cache_key}:lock'
+        if not self.cache.add(lock_key, 1, timeout=5):
+            return None
+        try:
+            return func()
+        finally:
+            self.cache.delete(lock_key)
+
+    def _park(self, counts):
+        def park():
+            parked = Counter(self.cache.get(self.cache_key, {}))
+            parked.update(counts)
+            self.cache.set(self.cache_key, dict(parked), timeout=None)
+            return True
+
+        if self._with_cache_lock(park) is None:
+            # 缓存被其他进程占用，留在进程内等下次写回
+            with self.lock:
+                self.pending.update(counts)
+
+    def _drain_parked(self):
+        def drain():
+            parked = self.cache.get(self.cache_key, {})
+            self.cache.delete(self.cache_key)
+            return parked
+
+        return self._with_cache_lock(drain) or {}
+
+
+destination_views = ViewCountBuffer(Destination, 'destination')
+attraction_views = ViewCountBuffer(Attraction, 'attraction')
+
+VIEW_COUNT_BUFFERS = [destination_views, attraction_views]
+
+
+def flush_view_counts():
+    """写回所有模型的浏览量缓冲"""
+    return sum(buffer.flush() for buffer in VIEW_COUNT_BUFFERS)
+
+
+def refresh_visitor_windows():
+    """重新计算所有模型的独立访客窗口并删除过期草图，返回删除的草图数"""
+    return sum(buffer.refresh_window() for buffer in VIEW_COUNT_BUFFERS)
+
+
+# 后台写回线程：只在处理请求的进程中开启；按进程号记录，fork 出的子进程各自启动
+_background_flush = False
+_flush_thread_pid = None
+_flush_thread_lock = threading.Lock()
+
+
+def flush_interval():
+    return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+
+def enable_background_flush(enabled=True):
+    """由 wsgi/asgi 入口调用；测试和管理命令不开启，计数由 flush_view_counts 写回"""
+    global _background_flush
+    _background_flush = enabled
+
+
+def ensure_flush_thread():
+    """开启后，本进程第一次计数时启动后台写回线程"""
+    global _flush_thread_pid
+    pid = os.getpid()
+    if not _background_flush or _flush_thread_pid == pid:
+        return
+    with _flush_thread_lock:
+        if _flush_thread_pid != pid:
+            threading.Thread(target=_flush_loop, name='view-count-flush', daemon=True).start()
+            _flush_thread_pid = pid
+
+
+def _flush_loop():
+    while _background_flush:
+        time.sleep(flush_interval())
+        try:
+            flush_view_counts()
+        except Exception as e:
+            print(f'定时写回浏览量时出错: {str(e)}')
+        finally:
+            # 线程自己的数据库连接，每轮用完即关闭
+            connection.close()
@@ -1,121 +1,185 @@
-import requests
-import time
-from typing import List, Dict, Any, Optional
-from django.core.files.base import ContentFile
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 import io
 from PIL import Image as PILImage
 from wagtail.images import get_image_model
 from .poi_types import POI_TYPE_MAPPING
 from django.conf import settings
-import hashlib
-from django.db import transaction
-import os
-from django.core.files.images import ImageFile
+from api.image_dedup import find_images_by_url, image_size_probe, prepare_image, save_images
+from .fetching import TokenBucket, download, get_with_retry, make_session
+
+PAGE_SIZE = 20
+# 每批下载后入库的图片数；同时在内存中的图片最多两批（一批入库、下一批下载）
+IMAGE_BATCH_SIZE = 40
+# 高德返回的并发超限错误码，稍后重试即可
+QPS_LIMIT_INFOCODES = {'10019', '10020', '10021'}
+
+
+def is_qps_limited(response) -> bool:
+    try:
+        return response.json().get('infocode') in QPS_LIMIT_INFOCODES
+    except ValueError:
+        return False
+
 
 class AmapCollector:
     """高德地图POI数据采集器"""
     
-    def __init__(self):
+    # 景点的 source 字段，source_id 为高德 POI 编号
+    source = 'amap'
+    
+    def __init__(self, base_url: str = 'https://restapi.amap.com/v3/place/text'):
         self.api_key = settings.AMAP_API_KEY
-        self.base_url = 'https://restapi.amap.com/v3/place/text'
+        self.base_url = base_url
         self.Image = get_image_model()
+        # 所有线程共用连接池和限流配额
+        self.max_workers = getattr(settings, 'AMAP_MAX_WORKERS', 8)
+        self.session = make_session(pool_size=self.max_workers)
+        self.limiter = TokenBucket(getattr(settings, 'AMAP_QPS', 3))
+        self.image_max_bytes = getattr(settings, 'IMAGE_DOWNLOAD_MAX_BYTES', 15 * 1024 * 1024)
         
-    def get_poi_data(self, city: str, type_codes: List[str], page: int = 1) -> Optional[List[Dict[str, Any]]]:
-        """获取指定城市和类型的POI数据"""
+    def fetch_page(self, city: str, type_codes: List[str], page: int = 1) -> Optional[Dict[str, Any]]:
+        """获取一页POI搜索结果（含总数 count），失败时返回 None"""
         params = {
             'key': self.api_key,
             'city': city,
             'types': '|'.join(type_codes),
             'citylimit': 'true',
             'output': 'json',
-            'offset': 20,
+            'offset': PAGE_SIZE,
             'page': page,
             'extensions': 'all'  # 获取详细信息，包括照片
         }
         
         try:
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
+            response = get_with_retry(
+                self.session, self.base_url, limiter=self.limiter,
+                should_retry=is_qps_limited, params=params
+            )
             data = response.json()
             
-            if data['status'] == '1' and data['pois']:
-                return data['pois']
+            if data['status'] == '1':
+                return data
+            print(f"获取POI数据时出错: {data.get('info')}")
             return None
             
         except Exception as e:
             print(f'获取POI数据时出错: {str(e)}')
             return None
             
+    def get_poi_data(self, city: str, type_codes: List[str], page: int = 1) -> Optional[List[Dict[str, Any]]]:
+        """获取指定城市和类型的POI数据"""
+        data = self.fetch_page(city, type_codes, page)
+        if data and data['pois']:
+            return data['pois']
+        return None
+        
+    def collect_pois(self, queries: List[Tuple[str, List[str]]], max_pages: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        并发采集多组 (城市, 类型编码) 的POI数据，按 queries 的顺序返回每组的POI列表
+        先并发请求各组第一页，再按返回的总数一次性并发请求其余页
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            first_pages = list(executor.map(lambda query: self.fetch_page(*query, 1), queries))
+            
+            pending = []
+            for query, data in zip(queries, first_pages):
+                total = int(data.get('count') or 0) if data else 0
+                pages = min(max_pages, math.ceil(total / PAGE_SIZE))
+                pending.append([
+                    executor.submit(self.get_poi_data, *query, page)
+                    for page in range(2, pages + 1)
+                ])
+            
+            results = []
+            for data, futures in zip(first_pages, pending):
+                pois = list(data['pois']) if data and data['pois'] else []
+                for future in futures:
+                    # 与逐页采集一致：遇到空页即停止
+                    page_pois = future.result()
+                    if not page_pois:
+                        break
+                    pois.extend(page_pois)
+                results.append(pois)
+            return results
+            
     def collect_city_pois(self, city: str, type_codes: List[str], max_pages: int = 3) -> List[Dict[str, Any]]:
         """采集指定城市的所有POI数据"""
-        all_pois = []
-        page = 1
+        return self.collect_pois([(city, type_codes)], max_pages)[0]
         
-        while page <= max_pages:
-            pois = self.get_poi_data(city, type_codes, page)
-            if not pois:
-                break
-                
-            all_pois.extend(pois)
-            page += 1
-            time.sleep(0.5)  # 避免请求过快
-            
-        return all_pois
+    def collect_pois_by_type(self, city: str, type_codes: List[str], max_pages: int = 3) -> Dict[str, List[Dict[str, Any]]]:
+        """并发采集指定城市每个类型的POI数据，返回 {类型编码: POI列表}"""
+        results = self.collect_pois([(city, [code]) for code in type_codes], max_pages)
+        return dict(zip(type_codes, results))
         
-    def process_image(self, image_url: str, title: str = '') -> Optional[Dict[str, Any]]:
-        """处理图片URL，下载并创建Wagtail Image对象"""
-        if not image_url:
-            return None
+    def normalize_image(self, image) -> bytes:
+        """统一转为 RGB、限制尺寸并编码为 JPEG"""
+        max_size = (1200, 1200)
+        # JPEG 在解码时直接按不小于目标的 1/2、1/4、1/8 缩放，不必先解码出全尺寸图片
+        image.draft('RGB', max_size)
+        
+        # 转换为RGB模式（如果是RGBA）
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
             
+        # 调整图片大小（如果需要）
+        image.thumbnail(max_size, PILImage.Resampling.LANCZOS)
+        
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        return output.getvalue()
+        
+    def download_image(self, image_url: str) -> Optional[Dict[str, Any]]:
+        """流式下载图片并在内存中计算指纹、规范化，不访问数据库，可在线程池中执行"""
         try:
-            response = requests.get(image_url)
-            response.raise_for_status()
-            
-            # 使用PIL处理图片
-            image = PILImage.open(io.BytesIO(response.content))
-            
-            # 转换为RGB模式（如果是RGBA）
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-                
-            # 调整图片大小（如果需要）
-            max_size = (1200, 1200)
-            image.thumbnail(max_size, PILImage.Resampling.LANCZOS)
-            
-            # 获取图片尺寸
-            width, height = image.size
-            
-            # 保存处理后的图片到临时文件
-            temp_filename = f'temp_{title}.jpg'
-            temp_path = os.path.join(settings.MEDIA_ROOT, 'temp', temp_filename)
-            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-            
-            image.save(temp_path, format='JPEG', quality=85)
-            
-            # 创建Wagtail Image对象
-            with open(temp_path, 'rb') as f:
-                image_file = ImageFile(f, name=temp_filename)
-                wagtail_image = self.Image.objects.create(
-                    title=title,
-                    file=image_file
-                )
-            
-            # 删除临时文件
-            os.remove(temp_path)
-            
-            return {
-                'image': wagtail_image,
-                'title': title,
-                'description': '',
-                'order': 0
-            }
-            
+            data = download(self.session, image_url, self.image_max_bytes, probe=image_size_probe)
+            return prepare_image(data, self.normalize_image)
         except Exception as e:
             print(f'处理图片时出错: {str(e)}')
             return None
             
-    def map_poi_to_attraction(self, poi: Dict[str, Any], destination_id: int) -> Dict[str, Any]:
-        """将POI数据映射为景点数据"""
+    def collect_images(self, pois: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        并发下载 pois 的全部照片并分批去重入库，返回 {图片地址: Wagtail Image}
+        已导入过的地址不再下载；每批下载完成后在一个短事务中入库，事务中不夹带网络请求，
+        入库时下一批已在下载，内存中的图片字节不随 POI 数量增长
+        """
+        titles = {}
+        for poi in pois:
+            for i, photo in enumerate(poi.get('photos') or []):
+                if photo.get('url'):
+                    titles.setdefault(photo['url'], f"{poi['name']}_{i+1}")
+        
+        images = find_images_by_url(titles)
+        missing = [url for url in titles if url not in images]
+        
+        def save(batch):
+            images.update(save_images([
+                dict(prepared, title=titles[url], file_name=f'{titles[url]}.jpg', source_url=url)
+                for url, prepared in ((url, future.result()) for url, future in batch) if prepared
+            ]))
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = []
+            for start in range(0, len(missing), IMAGE_BATCH_SIZE):
+                batch = [
+                    (url, executor.submit(self.download_image, url))
+                    for url in missing[start:start + IMAGE_BATCH_SIZE]
+                ]
+                if pending:
+                    save(pending)
+                pending = batch
+            if pending:
+                save(pending)
+        return images
+            
+    def map_poi_to_attraction(self, poi: Dict[str, Any], destination_id: int,
+                              images: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """将POI数据映射为景点数据，images 为 collect_images 的结果，未提供时现场采集该POI的图片"""
+        if images is None:
+            images = self.collect_images([poi])
+            
         # 处理主图片
         cover_image = None
         other_images = []
@@ -123,28 +187,33 @@ class AmapCollector:
         # 处理所有图片
         if 'photos' in poi and poi['photos']:
             for i, photo in enumerate(poi['photos']):
-                image_data = self.process_image(
-                    photo.get('url'),
-                    title=f"{poi['name']}_{i+1}"
-                )
-                if image_data:
+                image = images.get(photo.get('url'))
+                if image:
                     if i == 0:  # 第一张作为封面
-                        cover_image = image_data['image']
+                        cover_image = image
                     else:  # 其他图片
-                        image_data['order'] = i
-                        other_images.append(image_data)
+                        other_images.append({
+                            'image': image,
+                            'title': f"{poi['name']}_{i+1}",
+                            'description': '',
+                            'order': i
+                        })
+        
+        category = POI_TYPE_MAPPING.get(poi['typecode'], '其他')
         
         # 基本数据映射
         attraction_data = {
+            'source_id': poi['id'],
             'name': poi['name'],
             'description': poi.get('business', ''),
             'location': poi['address'] or poi['name'],
             'latitude': float(poi['location'].split(',')[1]),
             'longitude': float(poi['location'].split(',')[0]),
-            'category': POI_TYPE_MAPPING.get(poi['typecode'], '其他'),
+            'category': category,
             'destination_id': destination_id,
             'rating': float(poi.get('biz_ext', {}).get('rating', 0)) or 0,
-            'views_count': 0
+            'views_count': 0,
+            '_tags': [category]
         }
         
         # 如果有封面图片，添加到数据中
@@ -0,0 +1,101 @@
+"""
+采集器共用的 HTTP 工具
+- make_session：带连接池的 requests.Session，多个线程共用，复用 keep-alive 连接
+- TokenBucket：令牌桶限流，多个线程共享同一个配额（如高德接口的 QPS 限制）
+- get_with_retry：连接错误、超时、429 和 5xx 时按带随机抖动的指数退避重试
+- download：流式下载，超过字节上限立即中止，单个文件的内存占用有上界
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def make_session(pool_size=10, headers=None):
+    """创建连接池大小与并发线程数一致的 Session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个请求，最多允许 capacity 个突发请求"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，没有令牌时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """第 attempt 次重试前的等待时间（full jitter：在指数上限内均匀随机，避免线程同时重试）"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def get_with_retry(session, url, limiter=None, retries=3, should_retry=None, **kwargs):
+    """
+    GET 请求，失败时重试，最后一次仍失败则抛出异常
+    should_retry(response) 可按响应内容（如接口返回的限流错误码）判断是否需要重试
+    """
+    kwargs.setdefault('timeout', 10)
+    for attempt in range(retries + 1):
+        if limiter:
+            limiter.acquire()
+        try:
+            response = session.get(url, **kwargs)
+            if response.status_code not in RETRY_STATUS and not (should_retry and should_retry(response)):
+                response.raise_for_status()
+                return response
+            if attempt == retries:
+                response.raise_for_status()
+                return response
+            response.close()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        time.sleep(backoff_delay(attempt))
+
+
+def download(session, url, max_bytes, probe=None, chunk_size=64 * 1024, **kwargs):
+    """
+    流式下载并返回内容，Content-Length 或实际收到的字节数超过 max_bytes 时抛出 ValueError
+    probe(已收到的字节) 每收到一块数据调用一次，返回 True 后不再调用；
+    可用于根据文件头提前检查（如图片尺寸），检查不通过时抛出异常即可中止下载
+    """
+    response = get_with_retry(session, url, stream=True, **kwargs)
+    with response:
+        length = response.headers.get('Content-Length', '')
+        if length.isdigit() and int(length) > max_bytes:
+            raise ValueError(f'文件大小 {length} 字节，超过上限 {max_bytes} 字节')
+        
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise ValueError(f'文件超过上限 {max_bytes} 字节')
+            if probe and probe(buffer):
+                probe = None
+        return bytes(buffer)
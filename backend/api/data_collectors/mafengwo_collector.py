@@ -1,11 +1,13 @@
 import time
 from typing import Dict, Optional
 import re
-from django.core.files.base import ContentFile
 from wagtail.images import get_image_model
 import urllib.parse
 import requests
 from bs4 import BeautifulSoup
+from django.conf import settings
+from api.image_dedup import find_image_by_url, image_size_probe, import_image
+from .fetching import download, make_session
 
 class MafengwoCollector:
     """马蜂窝数据采集器"""
@@ -19,6 +21,8 @@ class MafengwoCollector:
         }
         self.base_url = 'https://www.mafengwo.cn'
         self.Image = get_image_model()
+        self.session = make_session(headers=self.headers)
+        self.image_max_bytes = getattr(settings, 'IMAGE_DOWNLOAD_MAX_BYTES', 15 * 1024 * 1024)
         
     def get_city_info(self, city_name: str) -> Optional[Dict]:
         """获取城市基本信息"""
@@ -91,22 +95,22 @@ class MafengwoCollector:
                 
             print(f'处理后的图片URL: {clean_url}')
             
-            # 下载图片
-            response = requests.get(clean_url, headers=self.headers, timeout=10)
-            response.raise_for_status()
+            # 已导入过的图片直接复用
+            wagtail_image = find_image_by_url(clean_url)
+            if wagtail_image is not None:
+                return wagtail_image
             
-            # 生成文件名
-            file_name = f'{city_name}_cover.jpg'
+            # 流式下载图片，超过大小或尺寸上限时中止
+            data = download(self.session, clean_url, self.image_max_bytes, probe=image_size_probe)
             
-            # 创建Wagtail图片
-            image_file = ContentFile(response.content, name=file_name)
-            wagtail_image = self.Image.objects.create(
+            # 按内容去重后创建Wagtail图片
+            return import_image(
+                data,
                 title=f'{city_name}_cover',
-                file=image_file
+                file_name=f'{city_name}_cover.jpg',
+                source_url=clean_url
             )
             
-            return wagtail_image
-            
         except Exception as e:
             print(f'处理图片时出错: {str(e)}')
             return None 
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+流式导出
+用 StreamingHttpResponse 逐行输出 NDJSON 或 CSV，查询集用 iterator(chunk_size=...) 分块读取
+（每块单独执行预取），内存占用只与块大小有关，与导出的总行数无关
+"""
+import csv
+
+from django.http import StreamingHttpResponse
+
+from .renderers import FastJSONRenderer
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+ATTRACTION_CSV_COLUMNS = [
+    ('id', 'ID'),
+    ('name', '名称'),
+    ('category', '类型'),
+    ('location', '位置'),
+    ('latitude', '纬度'),
+    ('longitude', '经度'),
+    ('rating', '平均评分'),
+    ('rating_count', '评分人数'),
+    ('favorites_count', '收藏数'),
+    ('views_count', '浏览量'),
+    ('ticket_price', '门票价格'),
+    ('opening_hours', '开放时间'),
+    ('recommended_duration', '建议游玩时长'),
+]
+
+
+class Echo:
+    """csv.writer 的写入目标，直接返回写入的行"""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_rows(queryset, serializer_class, context, chunk_size=EXPORT_CHUNK_SIZE):
+    renderer = FastJSONRenderer()
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield renderer.render(serializer_class(obj, context=context).data) + b'\n'
+
+
+def attraction_csv_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    # 带 BOM，Excel 打开时才能正确识别中文
+    yield '\ufeff' + writer.writerow([title for _, title in ATTRACTION_CSV_COLUMNS] + ['标签'])
+    for attraction in queryset.iterator(chunk_size=chunk_size):
+        row = [getattr(attraction, name) for name, _ in ATTRACTION_CSV_COLUMNS]
+        row.append('|'.join(tag.name for tag in attraction.tags.all()))
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def export_attractions(queryset, export_format, serializer_class, context, filename):
+    """以 NDJSON（与列表接口相同的字段）或 CSV（扁平字段）流式导出景点"""
+    if export_format == 'csv':
+        response = StreamingHttpResponse(
+            attraction_csv_rows(queryset.prefetch_related('tags')),
+            content_type='text/csv; charset=utf-8'
+        )
+    else:
+        response = StreamingHttpResponse(
+            ndjson_rows(queryset, serializer_class, context),
+            content_type='application/x-ndjson'
+        )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
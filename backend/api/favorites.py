@@ -0,0 +1,100 @@
+"""
+收藏计数
+景点的 favorites_count 为收藏人数，目的地的 favorites_count 为其下各景点的收藏数之和：
+- 收藏创建、修改、删除时用 F 表达式原子加减，与收藏写入处于同一事务
+- 批量写入时在 deferred_favorites_counts() 中累计，结束时按增量分组批量更新
+- repair_counters 命令按收藏表重新统计，修复偏差
+行程快照中含有景点和目的地的收藏数，计数变化时将相关快照标记为过期；
+热门缓存不因此失效，在下次重建时更新
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Attraction, Destination, Favorite
+from .snapshots import mark_stale_for_attractions, mark_stale_for_destinations
+
+# deferred_favorites_counts() 期间累计的 {景点主键: 增量}
+_pending_deltas = ContextVar('pending_favorites_deltas', default=None)
+
+
+def adjust_favorites_counts(deltas):
+    """按 {景点主键: 增量} 批量调整景点及其目的地的收藏数，增量相同的对象合并为一条 UPDATE"""
+    deltas = {pk: delta for pk, delta in deltas.items() if pk and delta}
+    if not deltas:
+        return
+    destinations = Counter()
+    # 已删除的景点不会出现在结果中，只调整仍存在的对象
+    for pk, destination_id in Attraction.objects.filter(pk__in=deltas).values_list('pk', 'destination_id'):
+        destinations[destination_id] += deltas[pk]
+
+    now = timezone.now()
+    with transaction.atomic():
+        for model, grouped in ((Attraction, deltas), (Destination, destinations)):
+            by_delta = defaultdict(list)
+            for pk, delta in grouped.items():
+                if delta:
+                    by_delta[delta].append(pk)
+            for delta, pks in by_delta.items():
+                # 同时更新 updated_at，详情接口的 Last-Modified 随之变化
+                model.objects.filter(pk__in=pks).update(
+                    favorites_count=F('favorites_count') + delta, updated_at=now
+                )
+        # queryset.update 不触发信号
+        mark_stale_for_attractions(list(deltas))
+        mark_stale_for_destinations(list(destinations))
+
+
+@contextmanager
+def deferred_favorites_counts():
+    """批量写入期间只累计收藏数的变化，结束时一次性写入"""
+    pending = Counter()
+    token = _pending_deltas.set(pending)
+    try:
+        yield pending
+    finally:
+        _pending_deltas.reset(token)
+    adjust_favorites_counts(pending)
+
+
+def favorite_changed(old_attraction_id, new_attraction_id):
+    """收藏的景点变化，新建时 old 为 None，删除时 new 为 None"""
+    if old_attraction_id == new_attraction_id:
+        return
+    deltas = Counter()
+    if old_attraction_id:
+        deltas[old_attraction_id] -= 1
+    if new_attraction_id:
+        deltas[new_attraction_id] += 1
+    pending = _pending_deltas.get()
+    if pending is not None:
+        pending.update(deltas)
+    else:
+        adjust_favorites_counts(deltas)
+
+
+def _repair(model, counts):
+    drifted = []
+    for obj in model.objects.only('favorites_count').iterator(chunk_size=2000):
+        expected = counts.get(obj.pk, 0)
+        if obj.favorites_count != expected:
+            obj.favorites_count = expected
+            drifted.append(obj)
+    model.objects.bulk_update(drifted, ['favorites_count'], batch_size=500)
+    return len(drifted)
+
+
+def repair_favorites_counts():
+    """按收藏表重新统计景点和目的地的收藏数，返回 (修正的景点数, 修正的目的地数)"""
+    attraction_counts = dict(
+        Favorite.objects.values_list('attraction_id').annotate(n=Count('id')).order_by()
+    )
+    destination_counts = dict(
+        Favorite.objects.values_list('attraction__destination_id').annotate(n=Count('id')).order_by()
+    )
+    with transaction.atomic():
+        return _repair(Attraction, attraction_counts), _repair(Destination, destination_counts)
@@ -0,0 +1,91 @@
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .search_index import search_attractions
+
+
+class AttractionSearchFilter(BaseFilterBackend):
+    """
+    基于倒排索引的景点检索（?search=）
+    结果标注 search_score，游标分页按相关度排序
+    """
+    search_param = 'search'
+
+    def get_search_query(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if not query:
+            return queryset
+        return search_attractions(queryset, query)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': '检索关键词（支持中文）',
+            'schema': {'type': 'string'},
+        }]
+
+
+class RatingDateRangeFilter(BaseFilterBackend):
+    """
+    按评分和创建时间过滤（评论、目的地的景点等关联列表）
+    - ?min_rating= / ?max_rating=：评分范围（含边界）
+    - ?since= / ?until=：创建时间范围，可以是日期（含当天）或日期时间
+    """
+    rating_field = 'rating'
+    date_field = 'created_at'
+
+    def parse_rating(self, request, name):
+        value = request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValidationError({name: '评分须为数字'})
+
+    def parse_time(self, request, name):
+        """返回 (时间, 是否只给了日期)"""
+        value = request.query_params.get(name)
+        if not value:
+            return None, False
+        try:
+            # 先按日期解析，parse_datetime 也会接受纯日期
+            day = parse_date(value)
+            moment = datetime.datetime.combine(day, datetime.time.min) if day else parse_datetime(value)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({name: '时间格式须为 YYYY-MM-DD 或 ISO 8601 日期时间'})
+        only_date = day is not None
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment, only_date
+
+    def filter_queryset(self, request, queryset, view):
+        min_rating = self.parse_rating(request, 'min_rating')
+        max_rating = self.parse_rating(request, 'max_rating')
+        since, _ = self.parse_time(request, 'since')
+        until, until_is_date = self.parse_time(request, 'until')
+
+        if min_rating is not None:
+            queryset = queryset.filter(**{f'{self.rating_field}__gte': min_rating})
+        if max_rating is not None:
+            queryset = queryset.filter(**{f'{self.rating_field}__lte': max_rating})
+        if since is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': since})
+        if until is not None:
+            if until_is_date:
+                # 只给日期时包含当天
+                queryset = queryset.filter(**{f'{self.date_field}__lt': until + datetime.timedelta(days=1)})
+            else:
+                queryset = queryset.filter(**{f'{self.date_field}__lte': until})
+        return queryset
@@ -0,0 +1,136 @@
+"""
+地理位置工具
+- geohash 编码：景点和目的地保存时写入 geohash 字段，前缀相同即位于同一网格
+- 附近查询：先按中心网格及其 8 个相邻网格做索引范围过滤，
+  再在数据库中按 haversine 公式计算距离并排序
+"""
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_LENGTH = 12
+EARTH_RADIUS = 6371000  # 米
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_LENGTH):
+    """将经纬度编码为 geohash，坐标缺失时返回空字符串"""
+    if latitude is None or longitude is None:
+        return ''
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lng_range[0] = mid
+            else:
+                bits = bits * 2
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_range[0] = mid
+            else:
+                bits = bits * 2
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """指定精度下网格的 (纬度跨度, 经度跨度)，单位为度"""
+    total_bits = precision * 5
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def precision_for_radius(radius, latitude):
+    """网格边长不小于 radius（米）的最大精度，保证 3x3 网格覆盖查询圆"""
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    for precision in range(GEOHASH_LENGTH, 0, -1):
+        lat_span, lng_span = cell_size(precision)
+        if (lat_span * METERS_PER_DEGREE >= radius
+                and lng_span * METERS_PER_DEGREE * cos_lat >= radius):
+            return precision
+    return 1
+
+
+def neighbor_cells(latitude, longitude, precision):
+    """中心网格及其 8 个相邻网格"""
+    lat_span, lng_span = cell_size(precision)
+    cells = set()
+    for dlat in (-lat_span, 0, lat_span):
+        for dlng in (-lng_span, 0, lng_span):
+            lat = min(max(latitude + dlat, -90.0), 90.0)
+            lng = (longitude + dlng + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(lat, lng, precision))
+    return cells
+
+
+def distance_expression(latitude, longitude):
+    """到 (latitude, longitude) 的 haversine 距离（米）的查询表达式"""
+    lat1 = math.radians(latitude)
+    lat2 = Radians(F('latitude'))
+    dlat = (lat2 - Value(lat1)) / 2
+    dlng = (Radians(F('longitude')) - Value(math.radians(longitude))) / 2
+    a = Power(Sin(dlat), 2) + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin(dlng), 2)
+    return Value(2 * EARTH_RADIUS, output_field=FloatField()) * ASin(Sqrt(a))
+
+
+def within_radius(queryset, latitude, longitude, radius):
+    """
+    半径 radius（米）内的对象，标注 distance 并按距离排序
+    geohash 前缀过滤写成范围查询，可以直接使用普通 B 树索引
+    """
+    precision = precision_for_radius(radius, latitude)
+    cells = Q()
+    for cell in neighbor_cells(latitude, longitude, precision):
+        cells |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+    return queryset.filter(cells).annotate(
+        distance=distance_expression(latitude, longitude)
+    ).filter(distance__lte=radius).order_by('distance')
+
+
+def nearest(queryset, latitude, longitude, limit, radius=None, max_radius=50000):
+    """
+    最近的 limit 个对象，按距离排序并设置 distance 属性
+    指定 radius 时只查找该半径内；否则从 1 公里开始逐步扩大范围，直到结果足够或达到 max_radius
+    扩大范围时只查询主键和距离，最后一次性取出对象（沿用 queryset 的预取计划）
+    """
+    def search(radius):
+        return list(
+            within_radius(queryset, latitude, longitude, radius)
+            .values_list('pk', 'distance')[:limit]
+        )
+
+    if radius is not None:
+        rows = search(radius)
+    else:
+        radius = 1000
+        rows = search(radius)
+        while len(rows) < limit and radius < max_radius:
+            radius = min(radius * 4, max_radius)
+            rows = search(radius)
+
+    objects = queryset.in_bulk([pk for pk, _ in rows])
+    results = []
+    for pk, distance in rows:
+        obj = objects[pk]
+        obj.distance = distance
+        results.append(obj)
+    return results
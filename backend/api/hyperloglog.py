@@ -0,0 +1,59 @@
+"""
+HyperLogLog 基数估计
+用固定大小的寄存器数组估计独立访客数，精度 12 时占用 4KB（压缩后通常更小），
+标准误差约 1.6%；两个草图按寄存器取最大值即可合并，可跨进程、跨天累加
+"""
+import hashlib
+import math
+import zlib
+
+
+class HyperLogLog:
+    """HyperLogLog 草图"""
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.size)
+        else:
+            if len(registers) != self.size:
+                raise ValueError('寄存器长度与精度不匹配')
+            self.registers = bytearray(registers)
+
+    def add(self, value):
+        """加入一个元素（任意可转为字符串的值）"""
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        x = int.from_bytes(digest, 'big')
+        index = x >> (64 - self.precision)
+        remaining = x & ((1 << (64 - self.precision)) - 1)
+        # 剩余位中第一个 1 出现的位置
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """合并另一个草图（就地修改并返回自身）"""
+        if other.precision != self.precision:
+            raise ValueError('只能合并相同精度的草图')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """估计的独立元素个数"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        # 小基数时改用线性计数
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """序列化为压缩后的字节串，便于存入数据库或缓存"""
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=12):
+        return cls(precision, zlib.decompress(bytes(data)))
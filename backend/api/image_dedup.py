@@ -0,0 +1,227 @@
+"""
+图片去重
+每张导入的图片记录内容指纹（ImageFingerprint）和来源地址（ImageSource），采集器在创建 Wagtail 图片之前先查询：
+1. 来源地址已导入过：直接复用，连下载都省去
+2. 原始字节的 SHA-256 相同：直接复用，不解码、不重新编码
+3. 感知哈希（64 位 dHash）的汉明距离不超过 PHASH_MAX_DISTANCE：视为同一张图片的
+   不同压缩或尺寸版本，复用已有图片
+都未命中时才规范化并创建新图片；无论是否命中都记下来源地址，感知哈希命中时也记下新的内容哈希，
+下次走更快的路径
+内容哈希只对下载到的原始字节计算：已有图片保存的是规范化后的字节，与采集时下载的字节不同，
+补记指纹时只记感知哈希
+
+批量采集时拆成两步：prepare_image 只做计算、不访问数据库，可在线程池中与下载并发执行；
+save_images 再在一个事务中批量去重入库，事务中不包含网络请求
+
+像素数超过 IMAGE_MAX_PIXELS 的图片在解码前拒绝（image_size_probe 可在下载途中根据文件头拒绝）
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from PIL import Image as PILImage
+from wagtail.images import get_image_model
+
+from .models import ImageFingerprint, ImageSource
+
+PHASH_MAX_DISTANCE = 3
+PHASH_BANDS = 4
+# 下载途中最多在前这么多字节中查找图片头部
+PROBE_MAX_BYTES = 256 * 1024
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_MAX_PIXELS', 40_000_000)
+
+
+def check_pixels(image):
+    """图片头部给出的像素数超过上限时抛出 ValueError"""
+    width, height = image.size
+    if width * height > max_pixels():
+        raise ValueError(f'图片尺寸 {width}x{height} 超过上限')
+
+
+def open_image(data):
+    """打开图片（只读取头部，不解码）并检查像素数"""
+    image = PILImage.open(io.BytesIO(data))
+    check_pixels(image)
+    return image
+
+
+def image_size_probe(data):
+    """
+    配合 fetching.download 使用：收到图片头部后检查像素数，超大图片不必下载完
+    头部还没收全时返回 False 继续等待，超过 PROBE_MAX_BYTES 仍无法识别时放弃检查
+    """
+    try:
+        image = PILImage.open(io.BytesIO(data))
+    except OSError:
+        return len(data) >= PROBE_MAX_BYTES
+    check_pixels(image)
+    return True
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image):
+    """
+    dHash：缩成 9x8 灰度图，逐行比较相邻像素的亮度，得到 64 位指纹
+    重新压缩、缩放后的同一张图片指纹相同或只差几位
+    """
+    # draft 让 JPEG 解码时直接按缩小的尺寸解码，省去大部分解码开销
+    image.draft('L', (64, 64))
+    pixels = list(image.convert('L').resize((9, 8), PILImage.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f'{bits:016x}'
+
+
+def phash_bands(phash):
+    width = len(phash) // PHASH_BANDS
+    return {f'phash_band_{i}': phash[i * width:(i + 1) * width] for i in range(PHASH_BANDS)}
+
+
+def hamming_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def find_image_by_url(url):
+    """来源地址已导入过时返回对应的图片"""
+    if not url:
+        return None
+    source = ImageSource.objects.filter(url=url).select_related('image').first()
+    return source.image if source else None
+
+
+def find_images_by_url(urls):
+    """批量查询已导入过的来源地址，返回 {来源地址: 图片}"""
+    sources = ImageSource.objects.filter(url__in=list(urls)).select_related('image')
+    return {source.url: source.image for source in sources}
+
+
+def find_similar_image(phash):
+    """感知哈希相近的已有图片：先按任一段相同从索引中取候选，再计算汉明距离"""
+    candidates = Q()
+    for field, band in phash_bands(phash).items():
+        candidates |= Q(**{field: band})
+    best = None
+    for fingerprint in ImageFingerprint.objects.filter(candidates).select_related('image'):
+        distance = hamming_distance(phash, fingerprint.perceptual_hash)
+        if distance <= PHASH_MAX_DISTANCE and (best is None or distance < best[0]):
+            best = (distance, fingerprint.image)
+    return best[1] if best else None
+
+
+def record_sources(images):
+    """记下 {来源地址: 图片}，已记录的地址不变；超出字段长度的地址无法按原样查询，不记录"""
+    max_length = ImageSource._meta.get_field('url').max_length
+    ImageSource.objects.bulk_create([
+        ImageSource(image=image, url=url)
+        for url, image in images.items() if url and len(url) <= max_length
+    ], ignore_conflicts=True)
+
+
+def record_fingerprint(image, sha, phash):
+    """记录指纹，返回是否写入；同一内容已有指纹（如并发导入）时以先写入的为准"""
+    try:
+        with transaction.atomic():
+            ImageFingerprint.objects.create(
+                image=image, content_hash=sha, perceptual_hash=phash, **phash_bands(phash)
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def import_image(data, title, file_name, source_url='', normalize=None):
+    """
+    按内容去重后导入图片，返回 Wagtail 图片
+    normalize(PIL 图片) -> bytes 为可选的规范化（如转 RGB、缩小、重新编码为 JPEG），只对新图片执行
+    """
+    sha = content_hash(data)
+    fingerprint = ImageFingerprint.objects.filter(content_hash=sha).select_related('image').first()
+    if fingerprint:
+        wagtail_image = fingerprint.image
+    else:
+        phash = perceptual_hash(open_image(data))
+        wagtail_image = find_similar_image(phash)
+        if wagtail_image is None:
+            if normalize:
+                data = normalize(open_image(data))
+            wagtail_image = get_image_model().objects.create(
+                title=title,
+                file=ContentFile(data, name=file_name)
+            )
+        record_fingerprint(wagtail_image, sha, phash)
+    record_sources({source_url: wagtail_image})
+    return wagtail_image
+
+
+def prepare_image(data, normalize=None):
+    """
+    计算指纹并规范化图片，不访问数据库
+    返回 {'content_hash', 'perceptual_hash', 'data'}，data 为规范化后的字节
+    """
+    phash = perceptual_hash(open_image(data))
+    normalized = normalize(open_image(data)) if normalize else data
+    return {'content_hash': content_hash(data), 'perceptual_hash': phash, 'data': normalized}
+
+
+def save_images(images):
+    """
+    批量保存 prepare_image 的结果，images 中每项另含 title、file_name、source_url
+    按内容去重（包括同一批内的重复图片），返回 {来源地址: 图片}
+    """
+    if not images:
+        return {}
+    hashes = [image['content_hash'] for image in images]
+    by_hash = {
+        fingerprint.content_hash: fingerprint.image
+        for fingerprint in ImageFingerprint.objects.filter(content_hash__in=hashes).select_related('image')
+    }
+    saved = {}
+    with transaction.atomic():
+        for image in images:
+            sha, phash = image['content_hash'], image['perceptual_hash']
+            wagtail_image = by_hash.get(sha)
+            if wagtail_image is None:
+                wagtail_image = find_similar_image(phash)
+                if wagtail_image is None:
+                    wagtail_image = get_image_model().objects.create(
+                        title=image['title'],
+                        file=ContentFile(image['data'], name=image['file_name'])
+                    )
+                record_fingerprint(wagtail_image, sha, phash)
+                by_hash[sha] = wagtail_image
+            saved[image['source_url']] = wagtail_image
+        # 内容哈希命中和同一批内重复的图片也记下地址，下次不再下载
+        record_sources(saved)
+    return saved
+
+
+def fingerprint_existing_images():
+    """
+    为尚无指纹的已有图片补记感知哈希，返回记录的图片数
+    保存的文件不是当初下载的原始字节，其内容哈希在采集时永远不会命中，因此不记录；
+    采集时按感知哈希命中后再记下下载字节的内容哈希
+    """
+    images = get_image_model().objects.filter(fingerprints__isnull=True)
+    total = 0
+    for wagtail_image in images.iterator(chunk_size=100):
+        try:
+            with wagtail_image.open_file() as f:
+                data = f.read()
+            if record_fingerprint(wagtail_image, None, perceptual_hash(open_image(data))):
+                total += 1
+        except Exception as e:
+            print(f'计算图片指纹时出错: {str(e)}')
+    return total
@@ -0,0 +1,145 @@
+"""
+采集数据批量入库
+采集到的景点按 (source, source_id) 用一条 bulk_create(update_conflicts=True) 批量插入或更新，
+标签和图片也批量关联，不再逐条 update_or_create
+bulk_create 不调用 save() 也不触发信号，这里补上相应的处理：
+- 计算地理网格编码
+- 重建这批景点的检索索引
+- 被更新景点所在的行程快照标记为过期
+地图网格不做逐条差量更新，导入全部完成后调用一次 clusters.rebuild_map_cells 重建
+"""
+from django.db import transaction
+
+from .geo import encode_geohash
+from .models import Attraction, AttractionImage, ItineraryItem, Tag
+from .search_index import index_attractions
+from .snapshots import mark_stale
+
+# 采集数据只更新这些字段；评分、浏览量等由站内数据维护，更新时不覆盖
+UPDATE_FIELDS = [
+    'name', 'description', 'destination', 'cover_image', 'location', 'latitude', 'longitude',
+    'geohash', 'category', 'updated_at',
+]
+TAG_CATEGORY = '景点类型'
+
+
+def claim_existing(source, rows):
+    """
+    为添加来源编号之前按名称导入的同名景点补上来源编号，之后按编号更新而不是重复插入
+    返回补上的来源编号
+    """
+    names = {(row['destination_id'], row['name']): row['source_id'] for row in rows}
+    if not names:
+        return set()
+    legacy = Attraction.objects.filter(
+        source_id__isnull=True,
+        destination_id__in={destination_id for destination_id, _ in names},
+        name__in={name for _, name in names},
+    )
+    claimed = []
+    for attraction in legacy.only('pk', 'destination_id', 'name'):
+        source_id = names.pop((attraction.destination_id, attraction.name), None)
+        if source_id is not None:
+            attraction.source, attraction.source_id = source, source_id
+            claimed.append(attraction)
+    Attraction.objects.bulk_update(claimed, ['source', 'source_id'])
+    return {attraction.source_id for attraction in claimed}
+
+
+def link_tags(pks_by_source_id, rows):
+    """按名称批量创建缺少的标签并关联到景点"""
+    names = {name for row in rows for name in row.get('_tags', [])}
+    if not names:
+        return
+    Tag.objects.bulk_create(
+        [Tag(name=name, category=TAG_CATEGORY) for name in names], ignore_conflicts=True
+    )
+    tags = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+    Through = Attraction.tags.through
+    Through.objects.bulk_create([
+        Through(attraction_id=pks_by_source_id[row['source_id']], tag_id=tags[name])
+        for row in rows for name in row.get('_tags', [])
+    ], ignore_conflicts=True)
+
+
+def link_images(pks_by_source_id, rows):
+    """批量关联景点图片，已关联的图片不重复添加；返回新增的图片数"""
+    pks = list(pks_by_source_id.values())
+    existing = set(AttractionImage.objects.filter(attraction_id__in=pks).values_list(
+        'attraction_id', 'image_id'
+    ))
+    images = []
+    for row in rows:
+        pk = pks_by_source_id[row['source_id']]
+        for image_data in row.get('_other_images', []):
+            if (pk, image_data['image'].pk) in existing:
+                continue
+            existing.add((pk, image_data['image'].pk))
+            images.append(AttractionImage(
+                attraction_id=pk,
+                image=image_data['image'],
+                title=image_data['title'],
+                description=image_data['description'],
+                order=image_data['order']
+            ))
+    AttractionImage.objects.bulk_create(images, batch_size=500)
+    return len(images)
+
+
+def upsert_attractions(source, rows):
+    """
+    批量插入或更新同一来源的景点，rows 为景点字段字典（须含 source_id），
+    可另含 _tags（标签名列表）和 _other_images（景点图片列表）
+    返回 (新建数, 更新数, 新增图片数)
+    """
+    # 同一批中重复的 POI 以最后一条为准
+    rows = list({row['source_id']: row for row in rows}.values())
+    if not rows:
+        return 0, 0, 0
+
+    attractions = []
+    for row in rows:
+        fields = {name: value for name, value in row.items() if not name.startswith('_')}
+        attraction = Attraction(**fields)
+        attraction.source = source
+        attraction.geohash = encode_geohash(attraction.latitude, attraction.longitude)
+        attractions.append(attraction)
+
+    source_ids = [row['source_id'] for row in rows]
+    with transaction.atomic():
+        covers = dict(Attraction.objects.filter(
+            source=source, source_id__in=source_ids
+        ).values_list('source_id', 'cover_image_id'))
+        claimed = claim_existing(source, [row for row in rows if row['source_id'] not in covers])
+        covers.update(Attraction.objects.filter(
+            source=source, source_id__in=claimed
+        ).values_list('source_id', 'cover_image_id'))
+        existing = set(covers)
+        # 本次没能取得封面（如图片下载失败）时保留原有封面
+        for attraction in attractions:
+            if attraction.cover_image_id is None:
+                attraction.cover_image_id = covers.get(attraction.source_id)
+
+        Attraction.objects.bulk_create(
+            attractions,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['source', 'source_id'],
+            update_fields=UPDATE_FIELDS,
+        )
+        # 并非所有数据库都会在冲突更新后回填主键，统一按来源编号查回
+        pks_by_source_id = dict(Attraction.objects.filter(
+            source=source, source_id__in=source_ids
+        ).values_list('source_id', 'pk'))
+
+        link_tags(pks_by_source_id, rows)
+        images_count = link_images(pks_by_source_id, rows)
+
+        index_attractions(Attraction.objects.filter(pk__in=pks_by_source_id.values()))
+        updated_pks = [pks_by_source_id[source_id] for source_id in existing]
+        if updated_pks:
+            mark_stale(ItineraryItem.objects.filter(
+                attraction_id__in=updated_pks
+            ).values('day__itinerary'))
+
+    return len(rows) - len(existing), len(existing), images_count
@@ -0,0 +1,65 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from wagtail.models import Page
+
+from api.models import Destination, Itinerary
+
+class Command(BaseCommand):
+    help = '在临时数据上测试行程可见性查询的执行计划和耗时（结束后回滚，不修改数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='依次测试的行程数量')
+        parser.add_argument('--users', type=int, default=100, help='临时用户数')
+        parser.add_argument('--repeat', type=int, default=50, help='每个查询重复次数')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS('测试完成，临时数据已回滚'))
+
+    def run(self, options):
+        destination = Destination.objects.first()
+        if destination is None:
+            destination = Page.get_first_root_node().add_child(
+                instance=Destination(title='benchmark', slug='benchmark-destination', location='benchmark')
+            )
+        users = [
+            User.objects.create(username=f'benchmark_{i}')
+            for i in range(options['users'])
+        ]
+        viewer = users[0]
+        start_date = datetime.date.today()
+
+        created = 0
+        for size in sorted(options['sizes']):
+            itineraries = [
+                Itinerary(
+                    title=f'benchmark {i}',
+                    user=random.choice(users),
+                    destination=destination,
+                    start_date=start_date,
+                    end_date=start_date,
+                    is_public=random.random() < 0.3,
+                )
+                for i in range(created, size)
+            ]
+            Itinerary.objects.bulk_create(itineraries, batch_size=1000)
+            created = size
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n行程数量：{size}'))
+            for label, user in (('匿名用户', AnonymousUser()), ('登录用户', viewer)):
+                queryset = Itinerary.objects.visible_to(user).order_by('-created_at', '-id')[:10]
+                self.stdout.write(f'{label}执行计划：')
+                self.stdout.write(queryset.explain())
+
+                begin = time.perf_counter()
+                for _ in range(options['repeat']):
+                    list(queryset.values_list('id', flat=True))
+                elapsed = (time.perf_counter() - begin) / options['repeat'] * 1000
+                self.stdout.write(f'{label}首页平均耗时：{elapsed:.2f} ms')
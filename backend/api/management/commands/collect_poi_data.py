@@ -1,9 +1,13 @@
 from django.core.management.base import BaseCommand
 from api.data_collectors.amap_collector import AmapCollector
-from api.models import Destination, Attraction, AttractionImage
-from django.db import transaction
+from api.clusters import rebuild_map_cells
+from api.ingestion import upsert_attractions
+from api.models import Destination
 from api.data_collectors.poi_types import POI_TYPE_MAPPING
 
+# 每次批量写入的POI数
+PAGE_SIZE = 500
+
 class Command(BaseCommand):
     help = '采集目的地的景点、公园、博物馆等观光文化类POI数据'
 
@@ -33,15 +37,23 @@ class Command(BaseCommand):
         total_updated = 0
         total_images = 0
         
+        # 所有类型的各页并发采集
+        pois_by_type = collector.collect_pois_by_type(
+            city=city,
+            type_codes=list(POI_TYPE_MAPPING),
+            max_pages=max_pages
+        )
+        
+        # 所有POI的图片并发下载、处理后批量入库，之后的导入只写数据库
+        self.stdout.write('开始下载图片...')
+        images = collector.collect_images(
+            [poi for pois in pois_by_type.values() for poi in pois]
+        )
+        
         for type_code, type_name in POI_TYPE_MAPPING.items():
-            self.stdout.write(f'开始采集{type_name}类型的数据...')
+            self.stdout.write(f'开始导入{type_name}类型的数据...')
             
-            # 采集当前类型的POI数据
-            pois = collector.collect_city_pois(
-                city=city,
-                type_codes=[type_code],
-                max_pages=max_pages
-            )
+            pois = pois_by_type[type_code]
             
             if not pois:
                 self.stdout.write(self.style.WARNING(f'{type_name}类型未采集到数据'))
@@ -49,44 +61,20 @@ class Command(BaseCommand):
                 
             self.stdout.write(f'采集到 {len(pois)} 条{type_name}数据')
             
-            # 将POI数据保存到数据库
-            created_count = 0
-            updated_count = 0
-            images_count = 0
-            
+            # 将POI数据映射后按页批量写入数据库
+            rows = []
             for poi in pois:
                 try:
-                    # 先处理图片
-                    attraction_data = collector.map_poi_to_attraction(poi, destination.id)
-                    other_images = attraction_data.pop('_other_images', [])
-                    
-                    # 保存景点数据
-                    with transaction.atomic():
-                        attraction, created = Attraction.objects.update_or_create(
-                            name=attraction_data['name'],
-                            destination=destination,
-                            defaults=attraction_data
-                        )
-                        
-                        # 保存其他图片
-                        for image_data in other_images:
-                            AttractionImage.objects.create(
-                                attraction=attraction,
-                                image=image_data['image'],
-                                title=image_data['title'],
-                                description=image_data['description'],
-                                order=image_data['order']
-                            )
-                            images_count += 1
-                        
-                        if created:
-                            created_count += 1
-                        else:
-                            updated_count += 1
-                            
+                    rows.append(collector.map_poi_to_attraction(poi, destination.id, images))
                 except Exception as e:
                     self.stdout.write(self.style.ERROR(f'处理POI数据时出错: {str(e)}'))
-                    continue
+            
+            created_count = updated_count = images_count = 0
+            for start in range(0, len(rows), PAGE_SIZE):
+                created, updated, linked = upsert_attractions(collector.source, rows[start:start + PAGE_SIZE])
+                created_count += created
+                updated_count += updated
+                images_count += linked
             
             total_created += created_count
             total_updated += updated_count
@@ -96,6 +84,9 @@ class Command(BaseCommand):
                 f'{type_name}数据导入完成！新建：{created_count}，更新：{updated_count}，图片：{images_count}'
             ))
             
+        # bulk_create 不触发信号，导入完成后统一重建地图网格
+        rebuild_map_cells()
+        
         # 输出总结信息
         self.stdout.write(self.style.SUCCESS(
             f'\n数据采集完成！总计：新建景点：{total_created}，更新景点：{total_updated}，图片：{total_images}'
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api.image_dedup import fingerprint_existing_images
+
+class Command(BaseCommand):
+    help = '为已有图片补记感知哈希指纹，之后的采集会复用这些图片而不是重复导入'
+
+    def handle(self, *args, **options):
+        total = fingerprint_existing_images()
+        self.stdout.write(self.style.SUCCESS(f'指纹记录完成！共处理 {total} 张图片'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from api.counters import flush_view_counts, refresh_visitor_windows
+
+class Command(BaseCommand):
+    help = '将本进程缓冲和共享缓存中暂存的浏览量写回数据库，并刷新独立访客窗口、删除过期草图，可由定时任务调用'
+
+    def handle(self, *args, **options):
+        flushed = flush_view_counts()
+        self.stdout.write(self.style.SUCCESS(f'已写回 {flushed} 个对象的浏览量'))
+        deleted = refresh_visitor_windows()
+        self.stdout.write(self.style.SUCCESS(f'已刷新独立访客数，删除 {deleted} 个过期草图'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from wagtail.images import get_image_model
+from api.renditions import generate_renditions, images_missing_renditions
+
+class Command(BaseCommand):
+    help = '为图片补齐响应式缩略图（WebP / JPEG 多种宽度），默认只处理缺少缩略图的图片，可定时执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='检查全部图片，而不只是缺少缩略图的图片'
+        )
+
+    def handle(self, *args, **options):
+        images = get_image_model().objects.all() if options['all'] else images_missing_renditions()
+        total = images.count()
+        for index, image in enumerate(images.order_by('pk').iterator(chunk_size=100), 1):
+            generate_renditions(image)
+            if index % 50 == 0:
+                self.stdout.write(f'已处理 {index}/{total} 张图片')
+        self.stdout.write(self.style.SUCCESS(f'缩略图生成完成！共 {total} 张图片'))
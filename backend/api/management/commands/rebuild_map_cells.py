@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api.clusters import rebuild_map_cells
+
+class Command(BaseCommand):
+    help = '重建地图网格聚合表，批量导入景点后或定期执行'
+
+    def handle(self, *args, **options):
+        total = rebuild_map_cells()
+        self.stdout.write(self.style.SUCCESS(f'地图网格重建完成！共 {total} 个网格'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from api.models import Attraction
+from api.search_index import index_attractions
+
+class Command(BaseCommand):
+    help = '重建景点检索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的景点数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        total = 0
+
+        for attraction in Attraction.objects.order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(attraction)
+            if len(batch) >= batch_size:
+                index_attractions(batch)
+                total += len(batch)
+                batch = []
+                self.stdout.write(f'已索引 {total} 个景点')
+
+        if batch:
+            index_attractions(batch)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'检索索引重建完成！共 {total} 个景点'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.models import Attraction, Destination
+from api.ratings import reconcile_ratings
+
+class Command(BaseCommand):
+    help = '按评论表重新统计景点和目的地的评分，修正累计值的偏差，可由定时任务调用'
+
+    def handle(self, *args, **options):
+        attractions = reconcile_ratings(Attraction, 'attraction')
+        destinations = reconcile_ratings(Destination, 'destination')
+        self.stdout.write(self.style.SUCCESS(
+            f'评分统计核对完成！修正了 {attractions} 个景点、{destinations} 个目的地'
+        ))
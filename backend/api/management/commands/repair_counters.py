@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.favorites import repair_favorites_counts
+from api.models import Attraction, Destination
+from api.ratings import reconcile_ratings
+
+class Command(BaseCommand):
+    help = '按评论表和收藏表重新统计评论数、评分和收藏数，修复计数偏差，可由定时任务调用'
+
+    def handle(self, *args, **options):
+        attractions = reconcile_ratings(Attraction, 'attraction')
+        destinations = reconcile_ratings(Destination, 'destination')
+        self.stdout.write(f'评论数和评分：修正了 {attractions} 个景点、{destinations} 个目的地')
+
+        attractions, destinations = repair_favorites_counts()
+        self.stdout.write(f'收藏数：修正了 {attractions} 个景点、{destinations} 个目的地')
+        self.stdout.write(self.style.SUCCESS('计数修复完成！'))
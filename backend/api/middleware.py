@@ -0,0 +1,104 @@
+"""
+API 响应压缩
+按 Accept-Encoding 协商 brotli（安装了 brotli 时）或 gzip，只压缩 /api/ 下不小于
+API_COMPRESSION_MIN_SIZE 字节的响应，小响应压缩后收益有限反而多花 CPU
+流式响应（如导出）逐块压缩；登录接口返回令牌，不压缩以避免 BREACH 类攻击
+"""
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 动态响应取中等压缩级别，在压缩率和 CPU 之间折中
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+EXCLUDED_PREFIXES = ('/api/auth/',)
+
+
+def _accepted_encodings(request):
+    """解析 Accept-Encoding，返回 {编码: q 值}；q 值无法解析时视为拒绝"""
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def _choose_encoding(request):
+    """按 q 值选择压缩编码（q=0 表示拒绝，未列出的编码按 * 的 q 值），同分时优先 brotli"""
+    accepted = _accepted_encodings(request)
+    default = accepted.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, default)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class APICompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (not request.path.startswith('/api/') or request.path.startswith(EXCLUDED_PREFIXES)
+                or response.has_header('Content-Encoding')):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not response.streaming and len(response.content) < settings.API_COMPRESSION_MIN_SIZE:
+            return response
+
+        encoding = _choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            response.headers.pop('Content-Length', None)
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(response.content, compresslevel=GZIP_LEVEL, mtime=0)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # 压缩后内容与未压缩的不再逐字节相同，强 ETag 改为弱 ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
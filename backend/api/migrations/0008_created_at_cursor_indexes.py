@@ -0,0 +1,40 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_destination_long_description'),
+        ('wagtailimages', '0027_image_description'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['-created_at', '-id'], name='api_attract_created_8bbf21_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['destination', '-created_at', '-id'], name='api_attract_destina_6fc22c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created_at', '-id'], name='api_comment_created_c91d27_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['destination', '-created_at', '-id'], name='api_comment_destina_cd2e36_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['attraction', '-created_at', '-id'], name='api_comment_attract_bf187c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='api_favorit_user_id_6f4011_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_created_at_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attraction',
+            name='unique_visitors',
+            field=models.PositiveIntegerField(default=0, verbose_name='独立访客数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='unique_visitors',
+            field=models.PositiveIntegerField(default=0, verbose_name='独立访客数'),
+        ),
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('registers', models.BinaryField(verbose_name='草图寄存器')),
+                ('attraction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to='api.attraction', verbose_name='景点')),
+                ('destination', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to='api.destination', verbose_name='目的地')),
+            ],
+            options={
+                'verbose_name': '访客草图',
+                'verbose_name_plural': '访客草图',
+                'unique_together': {('attraction', 'date'), ('destination', 'date')},
+            },
+        ),
+    ]
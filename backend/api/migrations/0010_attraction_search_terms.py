@@ -0,0 +1,96 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:03
+
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+# 以下切分规则与权重复制自 api.search_index，以后修改那里不影响本迁移
+FIELD_WEIGHTS = {'name': 8, 'tags': 4, 'category': 3, 'location': 2, 'description': 1}
+MAX_TERM_LENGTH = 32
+MAX_DESCRIPTION_LENGTH = 500
+CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+WORD = re.compile(r'[a-z0-9]+')
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = strip_tags(text).lower()
+    tokens = []
+    for run in CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(word[:MAX_TERM_LENGTH] for word in WORD.findall(CJK_RUN.sub(' ', text)))
+    return tokens
+
+
+def index_batch(AttractionSearchTerm, Through, batch):
+    if not batch:
+        return
+    tag_names = {}
+    for attraction_id, name in Through.objects.filter(
+        attraction_id__in=[row[0] for row in batch]
+    ).values_list('attraction_id', 'tag__name'):
+        tag_names.setdefault(attraction_id, []).append(name)
+    terms = []
+    for pk, name, category, location, description in batch:
+        fields = {
+            'name': name,
+            'tags': ' '.join(tag_names.get(pk, [])),
+            'category': category,
+            'location': location,
+            'description': strip_tags(description or '')[:MAX_DESCRIPTION_LENGTH],
+        }
+        weights = Counter()
+        for field, text in fields.items():
+            for token in tokenize(text):
+                weights[token] += FIELD_WEIGHTS[field]
+        terms.extend(
+            AttractionSearchTerm(attraction_id=pk, term=term, weight=weight)
+            for term, weight in weights.items()
+        )
+    AttractionSearchTerm.objects.bulk_create(terms, batch_size=500)
+
+
+def fill_search_terms(apps, schema_editor):
+    """为已有景点建立索引词条，否则在运行 rebuild_search_index 之前都检索不到"""
+    Attraction = apps.get_model('api', 'Attraction')
+    AttractionSearchTerm = apps.get_model('api', 'AttractionSearchTerm')
+    rows = Attraction.objects.values_list('pk', 'name', 'category', 'location', 'description')
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            index_batch(AttractionSearchTerm, Attraction.tags.through, batch)
+            batch = []
+    index_batch(AttractionSearchTerm, Attraction.tags.through, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_unique_visitor_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttractionSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=32, verbose_name='词条')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='权重')),
+                ('attraction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='api.attraction', verbose_name='景点')),
+            ],
+            options={
+                'verbose_name': '景点索引词条',
+                'verbose_name_plural': '景点索引词条',
+                'indexes': [models.Index(fields=['term', 'attraction'], name='api_attract_term_358d11_idx')],
+                'unique_together': {('attraction', 'term')},
+            },
+        ),
+        migrations.RunPython(fill_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:05
+
+from django.db import migrations, models
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+BATCH_SIZE = 500
+
+
+def encode_geohash(latitude, longitude, precision=12):
+    """迁移时的 geohash 编码，与 api.geo.encode_geohash 相同；复制到这里，以后修改 api.geo 不影响本迁移"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lng_range[0] = mid
+            else:
+                bits = bits * 2
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_range[0] = mid
+            else:
+                bits = bits * 2
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def fill_geohash(apps, schema_editor):
+    for model_name in ('Attraction', 'Destination'):
+        model = apps.get_model('api', model_name)
+        rows = model.objects.exclude(latitude=None).exclude(longitude=None).values_list(
+            'pk', 'latitude', 'longitude'
+        )
+        batch = []
+        for pk, latitude, longitude in rows.iterator(chunk_size=2000):
+            batch.append(model(pk=pk, geohash=encode_geohash(latitude, longitude)))
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ['geohash'])
+                batch = []
+        model.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_attraction_search_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attraction',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, verbose_name='地理网格编码'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, verbose_name='地理网格编码'),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
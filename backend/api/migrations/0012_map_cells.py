@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('precision', models.PositiveSmallIntegerField(verbose_name='网格精度')),
+                ('cell', models.CharField(max_length=12, verbose_name='网格编码')),
+                ('count', models.IntegerField(default=0, verbose_name='景点数')),
+                ('latitude_sum', models.FloatField(default=0, verbose_name='纬度之和')),
+                ('longitude_sum', models.FloatField(default=0, verbose_name='经度之和')),
+                ('top_rating', models.FloatField(default=0, verbose_name='最高评分')),
+                ('top_attraction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.attraction', verbose_name='评分最高的景点')),
+            ],
+            options={
+                'verbose_name': '地图网格',
+                'verbose_name_plural': '地图网格',
+                'unique_together': {('precision', 'cell')},
+            },
+        ),
+    ]
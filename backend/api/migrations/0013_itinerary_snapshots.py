@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:08
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_map_cells'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItinerarySnapshot',
+            fields=[
+                ('itinerary', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='api.itinerary', verbose_name='行程')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='序列化数据')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='版本')),
+                ('is_stale', models.BooleanField(default=False, verbose_name='是否过期')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '行程快照',
+                'verbose_name_plural': '行程快照',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_itinerary_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['-created_at', '-id'], name='api_itinera_created_78accf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['is_public', '-created_at', '-id'], name='api_itinera_is_publ_f4e56c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='api_itinera_user_id_769a0c_idx'),
+        ),
+    ]
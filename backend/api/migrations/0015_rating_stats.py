@@ -0,0 +1,115 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:15
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_rating_stats(apps, schema_editor):
+    Comment = apps.get_model('api', 'Comment')
+    for model_name, field in (('Attraction', 'attraction'), ('Destination', 'destination')):
+        model = apps.get_model('api', model_name)
+        histograms = {}
+        rows = Comment.objects.filter(**{f'{field}__isnull': False}).values_list(
+            field, 'rating'
+        ).annotate(n=Count('id')).order_by()
+        for pk, rating, n in rows:
+            histograms.setdefault(pk, {})[rating] = n
+
+        objects = list(model.objects.filter(pk__in=histograms))
+        for obj in objects:
+            histogram = histograms[obj.pk]
+            for star, n in histogram.items():
+                setattr(obj, f'rating_{star}_count', n)
+            obj.rating_count = sum(histogram.values())
+            obj.rating_sum = sum(star * n for star, n in histogram.items())
+            obj.rating = obj.rating_sum / obj.rating_count
+        model.objects.bulk_update(objects, [
+            'rating_sum', 'rating_count', 'rating',
+            'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_itinerary_visibility_indexes'),
+        ('wagtailimages', '0027_image_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attraction',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='1星评分数'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='2星评分数'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='3星评分数'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='4星评分数'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='5星评分数'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='评分人数'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='评分总和'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='1星评分数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='2星评分数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='3星评分数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='4星评分数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='5星评分数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='评分人数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='评分总和'),
+        ),
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['-rating', '-id'], name='api_attract_rating_690dbb_idx'),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
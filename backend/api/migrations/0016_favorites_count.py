@@ -0,0 +1,36 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:21
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_favorites_count(apps, schema_editor):
+    Favorite = apps.get_model('api', 'Favorite')
+    for model_name, field in (('Attraction', 'attraction_id'), ('Destination', 'attraction__destination_id')):
+        model = apps.get_model('api', model_name)
+        counts = dict(Favorite.objects.values_list(field).annotate(n=Count('id')).order_by())
+        objects = list(model.objects.filter(pk__in=counts))
+        for obj in objects:
+            obj.favorites_count = counts[obj.pk]
+        model.objects.bulk_update(objects, ['favorites_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attraction',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='收藏数'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='景点收藏数'),
+        ),
+        migrations.RunPython(fill_favorites_count, migrations.RunPython.noop),
+    ]
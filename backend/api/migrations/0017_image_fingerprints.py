@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_favorites_count'),
+        ('wagtailimages', '0027_image_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True, verbose_name='内容哈希')),
+                ('perceptual_hash', models.CharField(max_length=16, verbose_name='感知哈希')),
+                ('phash_band_0', models.CharField(db_index=True, max_length=4, verbose_name='感知哈希段0')),
+                ('phash_band_1', models.CharField(db_index=True, max_length=4, verbose_name='感知哈希段1')),
+                ('phash_band_2', models.CharField(db_index=True, max_length=4, verbose_name='感知哈希段2')),
+                ('phash_band_3', models.CharField(db_index=True, max_length=4, verbose_name='感知哈希段3')),
+                ('source_url', models.URLField(blank=True, db_index=True, max_length=500, verbose_name='来源地址')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='wagtailimages.image', verbose_name='图片')),
+            ],
+            options={
+                'verbose_name': '图片指纹',
+                'verbose_name_plural': '图片指纹',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_image_fingerprints'),
+        ('wagtailimages', '0027_image_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attraction',
+            name='source',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='数据来源'),
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='source_id',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='来源编号'),
+        ),
+        migrations.AddConstraint(
+            model_name='attraction',
+            constraint=models.UniqueConstraint(fields=('source', 'source_id'), name='unique_attraction_source'),
+        ),
+    ]
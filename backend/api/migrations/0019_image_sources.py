@@ -0,0 +1,46 @@
+# Generated by Django 5.0.14 on 2026-10-17 07:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_source_urls(apps, schema_editor):
+    ImageFingerprint = apps.get_model('api', 'ImageFingerprint')
+    ImageSource = apps.get_model('api', 'ImageSource')
+    rows = ImageFingerprint.objects.exclude(source_url='').values_list('image_id', 'source_url')
+    batch = []
+    for image_id, url in rows.iterator(chunk_size=2000):
+        batch.append(ImageSource(image_id=image_id, url=url))
+        if len(batch) == 2000:
+            ImageSource.objects.bulk_create(batch, batch_size=500, ignore_conflicts=True)
+            batch = []
+    ImageSource.objects.bulk_create(batch, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_attraction_source'),
+        ('wagtailimages', '0027_image_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, unique=True, verbose_name='来源地址')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sources', to='wagtailimages.image', verbose_name='图片')),
+            ],
+            options={
+                'verbose_name': '图片来源',
+                'verbose_name_plural': '图片来源',
+            },
+        ),
+        migrations.RunPython(copy_source_urls, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='imagefingerprint',
+            name='source_url',
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_image_sources'),
+    ]
+
+    operations = [
+        # auto_now 字段新增时已有行取迁移时的时间
+        migrations.AddField(
+            model_name='destination',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='更新时间'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_destination_updated_at'),
+        ('wagtailimages', '0027_image_description'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['geohash', '-rating', '-id'], name='api_attract_geohash_e8afed_idx'),
+        ),
+    ]
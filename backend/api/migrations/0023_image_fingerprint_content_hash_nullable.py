@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_response_cache_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagefingerprint',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='内容哈希'),
+        ),
+    ]
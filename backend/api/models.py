@@ -6,6 +6,8 @@ from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django import forms
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from .geo import encode_geohash
 
 class Tag(models.Model):
     """标签模型"""
@@ -19,7 +21,29 @@ class Tag(models.Model):
         verbose_name = "标签"
         verbose_name_plural = "标签"
 
-class Destination(Page):
+class RatingStats(models.Model):
+    """评分统计：评论增删改时由 api.ratings 原子更新，rating 字段即 rating_sum / rating_count"""
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="评分总和")
+    rating_count = models.PositiveIntegerField(default=0, verbose_name="评分人数")
+    rating_1_count = models.PositiveIntegerField(default=0, verbose_name="1星评分数")
+    rating_2_count = models.PositiveIntegerField(default=0, verbose_name="2星评分数")
+    rating_3_count = models.PositiveIntegerField(default=0, verbose_name="3星评分数")
+    rating_4_count = models.PositiveIntegerField(default=0, verbose_name="4星评分数")
+    rating_5_count = models.PositiveIntegerField(default=0, verbose_name="5星评分数")
+
+    @property
+    def comments_count(self):
+        # 每条评论都必须评分，评论数即评分人数
+        return self.rating_count
+
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
+    class Meta:
+        abstract = True
+
+class Destination(RatingStats, Page):
     """目的地模型"""
     description = RichTextField(verbose_name="描述", blank=True)
     long_description = RichTextField(verbose_name="详细描述", blank=True)
@@ -36,15 +60,20 @@ class Destination(Page):
     country = models.CharField(max_length=100, verbose_name="国家", default="中国")
     latitude = models.FloatField(verbose_name="纬度", null=True, blank=True)
     longitude = models.FloatField(verbose_name="经度", null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False, verbose_name="地理网格编码")
     category = models.CharField(max_length=50, verbose_name="目的地类型", default="景区")  # 城市、景区、国家公园等
     tags = models.ManyToManyField(Tag, blank=True, related_name="destinations", verbose_name="标签")
     best_season = models.CharField(max_length=50, blank=True, verbose_name="最佳旅游季节")
     views_count = models.PositiveIntegerField(default=0, verbose_name="浏览量")
+    unique_visitors = models.PositiveIntegerField(default=0, verbose_name="独立访客数")
+    favorites_count = models.PositiveIntegerField(default=0, verbose_name="景点收藏数")
     rating = models.FloatField(
         default=5.0,
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)],
         verbose_name="平均评分"
     )
+    # 接口修改、发布、标签变化时更新，作为详情接口 ETag/Last-Modified 的版本
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
     
     content_panels = Page.content_panels + [
         FieldPanel('description'),
@@ -60,11 +89,19 @@ class Destination(Page):
         FieldPanel('best_season'),
     ]
 
+    def save(self, *args, **kwargs):
+        # 经纬度变化时同步地理网格编码
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "目的地"
         verbose_name_plural = "目的地"
 
-class Attraction(models.Model):
+class Attraction(RatingStats, models.Model):
     """景点模型"""
     name = models.CharField(max_length=200, verbose_name="名称")
     description = RichTextField(verbose_name="描述", blank=True)
@@ -85,6 +122,7 @@ class Attraction(models.Model):
     location = models.CharField(max_length=200, verbose_name="具体位置")
     latitude = models.FloatField(verbose_name="纬度", null=True, blank=True)
     longitude = models.FloatField(verbose_name="经度", null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False, verbose_name="地理网格编码")
     opening_hours = models.TextField(verbose_name="开放时间", blank=True)
     ticket_price = models.DecimalField(
         max_digits=10,
@@ -101,17 +139,42 @@ class Attraction(models.Model):
         verbose_name="平均评分"
     )
     views_count = models.PositiveIntegerField(default=0, verbose_name="浏览量")
+    unique_visitors = models.PositiveIntegerField(default=0, verbose_name="独立访客数")
+    favorites_count = models.PositiveIntegerField(default=0, verbose_name="收藏数")
     recommended_duration = models.CharField(max_length=50, blank=True, verbose_name="建议游玩时长")
+    # 采集来源及其中的POI编号，采集时按 (source, source_id) 批量更新或插入；
+    # 手动添加的景点 source_id 为 NULL，不受唯一约束限制
+    source = models.CharField(max_length=20, blank=True, default='', verbose_name="数据来源")
+    source_id = models.CharField(max_length=64, null=True, blank=True, verbose_name="来源编号")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # 经纬度变化时同步地理网格编码
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "景点"
         verbose_name_plural = "景点"
         ordering = ['-created_at']
+        # 支持按 (created_at, id) 的游标分页
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['destination', '-created_at', '-id']),
+            models.Index(fields=['-rating', '-id']),
+            # 地图网格重新挑选最高评分景点时按 geohash 前缀范围扫描，只读索引
+            models.Index(fields=['geohash', '-rating', '-id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'source_id'], name='unique_attraction_source'),
+        ]
 
 class Comment(models.Model):
     """评论模型"""
@@ -157,6 +220,20 @@ class Comment(models.Model):
         verbose_name = "评论"
         verbose_name_plural = "评论"
         ordering = ['-created_at']
+        # 支持按 (created_at, id) 的游标分页
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['destination', '-created_at', '-id']),
+            models.Index(fields=['attraction', '-created_at', '-id']),
+        ]
+
+
+class ItineraryQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """用户可见的行程：公开的，或用户自己创建的（单个 WHERE，不再合并两个查询集）"""
+        if user.is_authenticated:
+            return self.filter(models.Q(is_public=True) | models.Q(user=user))
+        return self.filter(is_public=True)
 
 class Itinerary(models.Model):
     """行程模型"""
@@ -180,6 +257,8 @@ class Itinerary(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
+    objects = ItineraryQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -187,6 +266,13 @@ class Itinerary(models.Model):
         verbose_name = "行程"
         verbose_name_plural = "行程"
         ordering = ['-created_at']
+        # 公开行程流和“我的行程”都按 (created_at, id) 游标分页；
+        # “公开或自己的”条件无法用单个复合索引定位，按时间索引顺序扫描并过滤，取满一页即停止
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['is_public', '-created_at', '-id']),
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
 
 class ItineraryDay(models.Model):
     """行程日程模型"""
@@ -272,6 +358,10 @@ class Favorite(models.Model):
         # 确保用户不能重复收藏同一个景点
         unique_together = ['user', 'attraction']
         ordering = ['-created_at']
+        # 支持按 (created_at, id) 的游标分页
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} 收藏了 {self.attraction.name}"
@@ -302,3 +392,151 @@ class AttractionImage(models.Model):
 
     def __str__(self):
         return f"{self.attraction.name} - {self.title or '图片'}"
+
+class VisitorSketch(models.Model):
+    """每日独立访客草图（HyperLogLog），见 api/hyperloglog.py"""
+    destination = models.ForeignKey(
+        Destination,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='visitor_sketches',
+        verbose_name="目的地"
+    )
+    attraction = models.ForeignKey(
+        Attraction,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='visitor_sketches',
+        verbose_name="景点"
+    )
+    date = models.DateField(verbose_name="日期")
+    registers = models.BinaryField(verbose_name="草图寄存器")
+
+    class Meta:
+        verbose_name = "访客草图"
+        verbose_name_plural = "访客草图"
+        unique_together = [['destination', 'date'], ['attraction', 'date']]
+
+    def __str__(self):
+        return f"{self.destination or self.attraction} - {self.date}"
+
+class AttractionSearchTerm(models.Model):
+    """景点倒排索引词条，由 api/search_index.py 维护"""
+    attraction = models.ForeignKey(
+        Attraction,
+        on_delete=models.CASCADE,
+        related_name='search_terms',
+        verbose_name="景点"
+    )
+    term = models.CharField(max_length=32, verbose_name="词条")
+    weight = models.PositiveIntegerField(default=1, verbose_name="权重")
+
+    class Meta:
+        verbose_name = "景点索引词条"
+        verbose_name_plural = "景点索引词条"
+        unique_together = ['attraction', 'term']
+        indexes = [
+            models.Index(fields=['term', 'attraction']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.attraction_id}"
+
+class MapCell(models.Model):
+    """地图网格聚合：每个 geohash 前缀网格内的景点数量、坐标和及评分最高的景点，见 api/clusters.py"""
+    precision = models.PositiveSmallIntegerField(verbose_name="网格精度")
+    cell = models.CharField(max_length=12, verbose_name="网格编码")
+    count = models.IntegerField(default=0, verbose_name="景点数")
+    latitude_sum = models.FloatField(default=0, verbose_name="纬度之和")
+    longitude_sum = models.FloatField(default=0, verbose_name="经度之和")
+    top_attraction = models.ForeignKey(
+        Attraction,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="评分最高的景点"
+    )
+    top_rating = models.FloatField(default=0, verbose_name="最高评分")
+
+    class Meta:
+        verbose_name = "地图网格"
+        verbose_name_plural = "地图网格"
+        unique_together = ['precision', 'cell']
+
+    @property
+    def latitude(self):
+        return self.latitude_sum / self.count if self.count else None
+
+    @property
+    def longitude(self):
+        return self.longitude_sum / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.cell} ({self.count})"
+
+class ItinerarySnapshot(models.Model):
+    """行程读模型：预先序列化好的完整行程，见 api/snapshots.py"""
+    itinerary = models.OneToOneField(
+        Itinerary,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='snapshot',
+        verbose_name="行程"
+    )
+    data = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="序列化数据")
+    version = models.PositiveIntegerField(default=1, verbose_name="版本")
+    is_stale = models.BooleanField(default=False, verbose_name="是否过期")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        verbose_name = "行程快照"
+        verbose_name_plural = "行程快照"
+
+    def __str__(self):
+        return f"{self.itinerary_id} v{self.version}"
+
+class ImageFingerprint(models.Model):
+    """图片内容指纹，采集时按此去重，见 api/image_dedup.py"""
+    image = models.ForeignKey(
+        'wagtailimages.Image',
+        on_delete=models.CASCADE,
+        related_name='fingerprints',
+        verbose_name="图片"
+    )
+    # 下载到的原始字节的 SHA-256；为已有图片补记的指纹没有原始字节，只记感知哈希
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="内容哈希")
+    perceptual_hash = models.CharField(max_length=16, verbose_name="感知哈希")  # 64 位 dHash 的十六进制
+    # 感知哈希按 16 位分成 4 段分别建索引：汉明距离不超过 3 时至少有一段完全相同
+    phash_band_0 = models.CharField(max_length=4, db_index=True, verbose_name="感知哈希段0")
+    phash_band_1 = models.CharField(max_length=4, db_index=True, verbose_name="感知哈希段1")
+    phash_band_2 = models.CharField(max_length=4, db_index=True, verbose_name="感知哈希段2")
+    phash_band_3 = models.CharField(max_length=4, db_index=True, verbose_name="感知哈希段3")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "图片指纹"
+        verbose_name_plural = "图片指纹"
+
+    def __str__(self):
+        return f"{(self.content_hash or self.perceptual_hash)[:12]} -> {self.image_id}"
+
+class ImageSource(models.Model):
+    """图片的来源地址：同一张图片可能来自多个地址，每个地址都记下，再次采集时不必重新下载"""
+    image = models.ForeignKey(
+        'wagtailimages.Image',
+        on_delete=models.CASCADE,
+        related_name='sources',
+        verbose_name="图片"
+    )
+    url = models.URLField(max_length=500, unique=True, verbose_name="来源地址")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "图片来源"
+        verbose_name_plural = "图片来源"
+
+    def __str__(self):
+        return f"{self.url} -> {self.image_id}"
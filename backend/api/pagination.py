@@ -0,0 +1,145 @@
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    复合键游标分页，默认按 (created_at, id) 倒序
+    游标保存上一页边界行全部排序列的值，下一页按
+    (a < x) OR (a = x AND id < y) 的条件从索引位置继续读取，
+    排序列取值相同（如评分都是 5.0）时也不退化为 OFFSET 扫描，深页与首页成本相同；
+    排序最后总是补上 id，保证顺序唯一。需要总数时可通过 ?count=true 显式开启
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+    invalid_cursor_message = '无效的游标'
+
+    def get_ordering(self, request, queryset, view):
+        """视图可以通过 get_cursor_ordering() 替换排序，如检索时按相关度"""
+        get_cursor_ordering = getattr(view, 'get_cursor_ordering', None)
+        ordering = get_cursor_ordering() if get_cursor_ordering else None
+        if not ordering:
+            ordering = super().get_ordering(request, queryset, view)
+        ordering = tuple(ordering)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+
+        position, reverse = self.decode_cursor(request)
+        ordering = self.reverse_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position, ordering))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        if not self.page:
+            # 空页（如边界行已删除）时不再给出翻页链接
+            self.has_previous = self.has_next = False
+        return self.page
+
+    def reverse_ordering(self):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering)
+
+    def after(self, position, ordering):
+        """
+        排在 position 之后的行：(a > x) OR (a = x AND b > y) ...，倒序的列取小于
+        另加上首列的范围条件 a >= x，数据库可以直接定位到索引中的位置，而不是从头扫描
+        """
+        condition = Q()
+        equal = {}
+        for name, value in zip(ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & condition
+
+    def get_position(self, instance):
+        return [getattr(instance, name.lstrip('-')) for name in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        values = [
+            value.isoformat() if isinstance(value, (datetime.date, datetime.time))
+            else str(value) if isinstance(value, Decimal) else value
+            for value in position
+        ]
+        data = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """返回 (边界行各排序列的值, 是否向前翻页)；没有游标时为 (None, False)"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values, reverse = data['p'], bool(data['r'])
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            position = [self.parse_value(name, value) for name, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def parse_value(self, name, value):
+        """模型字段按字段类型还原游标中的值（如时间），注解列（如相关度）原样使用"""
+        try:
+            field = self.model._meta.get_field(name.lstrip('-'))
+        except FieldDoesNotExist:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError
+            return value
+        return field.to_python(value)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {'count': self.count, **response.data}
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return schema
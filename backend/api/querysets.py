@@ -0,0 +1,109 @@
+"""
+查询计划
+为各视图集声明 select_related / prefetch_related，
+保证列表和详情接口的查询次数与分页大小无关
+
+expand 参数与序列化器的 ?expand= 对应：为 None 时预取全部嵌套关系（详情序列化器），
+否则只预取 expand 中列出的可展开关系（列表序列化器）
+"""
+from django.db.models import Prefetch
+from .models import (
+    Destination, Attraction, AttractionImage, Comment,
+    Itinerary, ItineraryDay, ItineraryItem, Favorite
+)
+from .renditions import rendition_prefetch
+from .serializers import nested_names
+
+
+def descend(expand, path):
+    """取出 path 之下的展开路径，如 path 为 'days' 时 'days.items.x' 得到 'items.x'"""
+    return {name[len(path) + 1:] for name in expand if name.startswith(f'{path}.')}
+
+
+def comment_queryset():
+    """评论查询集，连带查询 user 供 CommentSerializer.user_detail 使用"""
+    return Comment.objects.select_related('user')
+
+
+def attraction_image_queryset():
+    """景点图片查询集，连带查询 Wagtail 图片及其缩略图供 AttractionImageSerializer 使用"""
+    return AttractionImage.objects.select_related('image').prefetch_related(
+        rendition_prefetch('image__')
+    )
+
+
+def attraction_prefetches(prefix='', expand=None):
+    """景点序列化所需的预取项，prefix 用于从其他模型嵌套预取（如 'attraction__'）"""
+    prefetches = [f'{prefix}tags', rendition_prefetch(f'{prefix}cover_image__')]
+    if expand is None or 'images' in expand:
+        prefetches.append(Prefetch(f'{prefix}images', queryset=attraction_image_queryset()))
+    if expand is None or 'comments' in expand:
+        prefetches.append(Prefetch(f'{prefix}comments', queryset=comment_queryset()))
+    return prefetches
+
+
+def destination_prefetches(prefix='', expand=None):
+    """目的地序列化所需的预取项"""
+    prefetches = [f'{prefix}tags', rendition_prefetch(f'{prefix}cover_image__')]
+    if expand is None or 'comments' in expand:
+        prefetches.append(Prefetch(f'{prefix}comments', queryset=comment_queryset()))
+    return prefetches
+
+
+def attraction_queryset(queryset=None, expand=None):
+    """AttractionSerializer / AttractionListSerializer 的查询计划"""
+    if queryset is None:
+        queryset = Attraction.objects.all()
+    return queryset.select_related('cover_image').prefetch_related(
+        *attraction_prefetches(expand=expand)
+    )
+
+
+def destination_queryset(queryset=None, expand=None):
+    """DestinationSerializer / DestinationListSerializer 的查询计划"""
+    if queryset is None:
+        queryset = Destination.objects.all()
+    return queryset.select_related('cover_image').prefetch_related(
+        *destination_prefetches(expand=expand)
+    )
+
+
+def itinerary_item_queryset(queryset=None, expand=()):
+    """ItineraryItemSerializer 的查询计划，expand 相对于行程项目这一层"""
+    if queryset is None:
+        queryset = ItineraryItem.objects.all()
+    return queryset.select_related('attraction__cover_image').prefetch_related(
+        *attraction_prefetches('attraction__', nested_names(expand, 'attraction_detail'))
+    )
+
+
+def itinerary_day_queryset(queryset=None, expand=()):
+    """ItineraryDaySerializer 的查询计划"""
+    if queryset is None:
+        queryset = ItineraryDay.objects.all()
+    return queryset.prefetch_related(
+        Prefetch('items', queryset=itinerary_item_queryset(expand=descend(expand, 'items')))
+    )
+
+
+def itinerary_queryset(queryset=None, expand=()):
+    """ItinerarySerializer 的查询计划"""
+    if queryset is None:
+        queryset = Itinerary.objects.all()
+    return queryset.select_related(
+        'user', 'destination__cover_image'
+    ).prefetch_related(
+        *destination_prefetches('destination__', nested_names(expand, 'destination_detail')),
+        Prefetch('days', queryset=itinerary_day_queryset(expand=descend(expand, 'days'))),
+    )
+
+
+def favorite_queryset(queryset=None, expand=()):
+    """FavoriteSerializer 的查询计划"""
+    if queryset is None:
+        queryset = Favorite.objects.all()
+    return queryset.select_related(
+        'user', 'attraction__cover_image'
+    ).prefetch_related(
+        *attraction_prefetches('attraction__', nested_names(expand, 'attraction_detail'))
+    )
@@ -0,0 +1,116 @@
+"""
+评分聚合
+景点和目的地保存评分总和、评分人数和各星级人数（RatingStats），rating 字段为平均分：
+- 评论创建、修改、删除时在一条 UPDATE 中按差量调整，不读取再写回，并发写入不会丢失
+- reconcile_ratings 命令按评论表重新统计，修复直接改库等原因造成的偏差
+列表按评分排序时只读取预先计算好的 rating 字段
+"""
+import math
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan
+
+from .clusters import update_cells_rating
+from .models import Attraction, Comment, Destination
+from .snapshots import mark_stale_for_attraction, mark_stale_for_destination
+
+STARS = range(1, 6)
+
+
+def histogram_field(star):
+    return f'rating_{star}_count'
+
+
+def average_expression(total, count, default):
+    """平均分表达式，没有评分时取模型默认值"""
+    return Case(
+        When(GreaterThan(count, 0), then=Cast(total, FloatField()) / count),
+        default=Value(default),
+        output_field=FloatField(),
+    )
+
+
+def rating_target(destination_id, attraction_id):
+    """评论所评价的对象 (模型, 主键)"""
+    if attraction_id:
+        return Attraction, attraction_id
+    if destination_id:
+        return Destination, destination_id
+    return None, None
+
+
+def apply_rating(model, pk, rating, sign):
+    """把一条评分计入（sign=1）或移出（sign=-1）对象的评分统计"""
+    total = F('rating_sum') + sign * rating
+    count = F('rating_count') + sign
+    field = histogram_field(rating)
+    default = model._meta.get_field('rating').default
+    return model.objects.filter(pk=pk).update(
+        rating_sum=total,
+        rating_count=count,
+        rating=average_expression(total, count, default),
+        **{field: F(field) + sign},
+    )
+
+
+def rating_changed(model, pk):
+    """平均分变化后更新依赖它的地图网格和行程快照（queryset.update 不触发信号）"""
+    if model is Attraction:
+        row = Attraction.objects.filter(pk=pk).values_list('geohash', 'rating').first()
+        if row:
+            update_cells_rating(pk, *row)
+        mark_stale_for_attraction(pk)
+    else:
+        mark_stale_for_destination(pk)
+
+
+def comment_rating_changed(old, new):
+    """
+    评论评分变化，old/new 为 (destination_id, attraction_id, rating)，新建时 old 为 None，删除时 new 为 None
+    """
+    if old == new:
+        return
+    changed = set()
+    with transaction.atomic():
+        for state, sign in ((old, -1), (new, 1)):
+            if not state:
+                continue
+            model, pk = rating_target(*state[:2])
+            if model and apply_rating(model, pk, state[2], sign):
+                changed.add((model, pk))
+        for model, pk in changed:
+            rating_changed(model, pk)
+
+
+def reconcile_ratings(model, field):
+    """按评论表重新统计 model 的评分，field 为 Comment 上指向 model 的外键名；返回修正的对象数"""
+    histograms = {}
+    rows = Comment.objects.filter(**{f'{field}__isnull': False}).values_list(
+        field, 'rating'
+    ).annotate(n=Count('id')).order_by()
+    for pk, rating, n in rows:
+        histograms.setdefault(pk, {})[rating] = n
+
+    default = model._meta.get_field('rating').default
+    fields = ['rating_sum', 'rating_count', 'rating'] + [histogram_field(star) for star in STARS]
+    drifted = []
+    for obj in model.objects.only(*fields).iterator(chunk_size=2000):
+        histogram = histograms.get(obj.pk, {})
+        expected = {histogram_field(star): histogram.get(star, 0) for star in STARS}
+        expected['rating_count'] = sum(histogram.values())
+        expected['rating_sum'] = sum(star * n for star, n in histogram.items())
+        rating = expected['rating_sum'] / expected['rating_count'] if expected['rating_count'] else default
+        if (any(getattr(obj, name) != value for name, value in expected.items())
+                or not math.isclose(obj.rating, rating)):
+            obj.rating = rating
+            for name, value in expected.items():
+                setattr(obj, name, value)
+            drifted.append(obj)
+
+    with transaction.atomic():
+        model.objects.bulk_update(drifted, fields, batch_size=500)
+        for obj in drifted:
+            rating_changed(model, obj.pk)
+    return len(drifted)
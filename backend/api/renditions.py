@@ -0,0 +1,67 @@
+"""
+响应式图片
+按 RENDITION_WIDTHS 预先生成 WebP 和 JPEG 两种格式的缩略图（Wagtail rendition），
+ImageSerializer 输出 srcset，客户端按屏幕宽度选择合适的尺寸，不再下载原图
+缩略图由 generate_renditions 命令定时补齐（只处理缺少缩略图的图片），
+上传、导入和接口请求中都不做图片处理；尚未生成时 srcset 为空，客户端使用原图
+查询集通过 rendition_prefetch() 批量预取缩略图，序列化时不再逐张查询
+"""
+from django.db.models import Count, Prefetch, Q
+from wagtail.images import get_image_model
+
+RENDITION_WIDTHS = (320, 640, 1024)
+RENDITION_FORMATS = ('webp', 'jpeg')
+RENDITION_SPECS = [
+    f'width-{width}|format-{image_format}'
+    for image_format in RENDITION_FORMATS
+    for width in RENDITION_WIDTHS
+]
+PREFETCH_ATTR = 'srcset_renditions'
+
+
+def rendition_prefetch(path=''):
+    """预取 path 处图片（如 'cover_image__'）的 srcset 缩略图，结果放在 srcset_renditions 属性上"""
+    Rendition = get_image_model().get_rendition_model()
+    return Prefetch(
+        f'{path}renditions',
+        queryset=Rendition.objects.filter(filter_spec__in=RENDITION_SPECS),
+        to_attr=PREFETCH_ATTR,
+    )
+
+
+def images_missing_renditions():
+    """缺少 srcset 缩略图的图片"""
+    return get_image_model().objects.annotate(
+        srcset_count=Count('renditions', filter=Q(renditions__filter_spec__in=RENDITION_SPECS))
+    ).filter(srcset_count__lt=len(RENDITION_SPECS))
+
+
+def generate_renditions(image):
+    """生成（或补齐）图片的全部 srcset 缩略图"""
+    try:
+        image.get_renditions(*RENDITION_SPECS)
+    except Exception as e:
+        print(f'生成缩略图时出错: {str(e)}')
+
+
+def build_srcset(image):
+    """按格式返回 srcset 字符串，如 {'webp': 'a.webp 320w, b.webp 640w'}；只使用已生成的缩略图"""
+    renditions = getattr(image, PREFETCH_ATTR, None)
+    if renditions is None:
+        # 未预取时一次查询取出该图片的全部缩略图
+        renditions = list(image.renditions.filter(filter_spec__in=RENDITION_SPECS))
+
+    candidates = {image_format: [] for image_format in RENDITION_FORMATS}
+    for rendition in renditions:
+        image_format = rendition.filter_spec.rsplit('format-', 1)[-1]
+        candidates[image_format].append((rendition.width, rendition.url))
+
+    srcset = {}
+    for image_format, items in candidates.items():
+        # 原图小于目标宽度时不会放大，不同规格可能得到相同宽度，只保留一个
+        widths = {}
+        for width, url in sorted(items):
+            widths.setdefault(width, url)
+        if widths:
+            srcset[image_format] = ', '.join(f'{url} {width}w' for width, url in widths.items())
+    return srcset
@@ -0,0 +1,123 @@
+"""
+景点全文检索
+在 AttractionSearchTerm 表中维护倒排索引：中文按单字和相邻二字（bigram）切分，
+英文和数字按整词切分；检索时只按词条索引查找候选景点并按权重求和排序，
+不再对景点表做 icontains 全表扫描，也没有标签多对多连接带来的重复行
+"""
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.utils.html import strip_tags
+
+from .models import Attraction, AttractionSearchTerm
+
+# 各字段的权重
+FIELD_WEIGHTS = {
+    'name': 8,
+    'tags': 4,
+    'category': 3,
+    'location': 2,
+    'description': 1,
+}
+
+MAX_TERM_LENGTH = 32
+# 描述只索引开头部分，控制每个景点的词条数量
+MAX_DESCRIPTION_LENGTH = 500
+
+CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+WORD = re.compile(r'[a-z0-9]+')
+
+
+def cjk_tokens(run, with_unigrams):
+    if len(run) == 1:
+        return [run]
+    bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+    return list(run) + bigrams if with_unigrams else bigrams
+
+
+def tokenize(text, for_query=False):
+    """
+    切分文本
+    建索引时同时产出单字和二字词条，以便单字查询也能命中；
+    查询时连续两个以上汉字只用二字词条，相当于短语匹配
+    """
+    if not text:
+        return []
+    text = strip_tags(text).lower()
+    tokens = []
+    for run in CJK_RUN.findall(text):
+        tokens.extend(cjk_tokens(run, with_unigrams=not for_query))
+    tokens.extend(word[:MAX_TERM_LENGTH] for word in WORD.findall(CJK_RUN.sub(' ', text)))
+    return tokens
+
+
+def build_terms(attraction, tag_names=None):
+    """计算景点的 {词条: 权重}"""
+    if tag_names is None:
+        tag_names = list(attraction.tags.values_list('name', flat=True))
+    fields = {
+        'name': attraction.name,
+        'tags': ' '.join(tag_names),
+        'category': attraction.category,
+        'location': attraction.location,
+        'description': strip_tags(attraction.description or '')[:MAX_DESCRIPTION_LENGTH],
+    }
+    weights = Counter()
+    for field, text in fields.items():
+        for token in tokenize(text):
+            weights[token] += FIELD_WEIGHTS[field]
+    return weights
+
+
+def index_attractions(attractions):
+    """重建若干景点的索引词条"""
+    attractions = list(attractions)
+    if not attractions:
+        return
+    tag_names = {}
+    for attraction_id, name in Attraction.tags.through.objects.filter(
+        attraction__in=attractions
+    ).values_list('attraction_id', 'tag__name'):
+        tag_names.setdefault(attraction_id, []).append(name)
+
+    terms = [
+        AttractionSearchTerm(attraction_id=attraction.pk, term=term, weight=weight)
+        for attraction in attractions
+        for term, weight in build_terms(attraction, tag_names.get(attraction.pk, [])).items()
+    ]
+    with transaction.atomic():
+        AttractionSearchTerm.objects.filter(attraction__in=attractions).delete()
+        AttractionSearchTerm.objects.bulk_create(terms, batch_size=500)
+
+
+def index_attraction(attraction):
+    index_attractions([attraction])
+
+
+def query_tokens(query):
+    """检索词切分出的词条集合；只有标点、空白等时为空"""
+    return set(tokenize(query, for_query=True))
+
+
+def search_attractions(queryset, query):
+    """
+    按检索词过滤景点并标注相关度 search_score
+    所有查询词条都命中的景点才会返回；检索词切分不出词条时没有结果
+    """
+    tokens = query_tokens(query)
+    if not tokens:
+        return queryset.none()
+    matches = AttractionSearchTerm.objects.filter(term__in=tokens).values(
+        'attraction'
+    ).annotate(
+        hits=Count('term'), score=Sum('weight')
+    ).filter(hits=len(tokens))
+    return queryset.filter(
+        pk__in=matches.values('attraction')
+    ).annotate(
+        search_score=Subquery(
+            matches.filter(attraction=OuterRef('pk')).values('score')[:1]
+        )
+    )
@@ -1,21 +1,90 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from wagtail.images.models import Image
 from .models import Destination, Attraction, AttractionImage, Comment, Favorite, Tag, Itinerary, ItineraryDay, ItineraryItem
 from django.conf import settings
+from .renditions import build_srcset
 from django.contrib.auth.models import User
 
+def split_query_param(request, name):
+    """将逗号分隔的查询参数解析为集合，如 ?expand=comments,images"""
+    if request is None:
+        return set()
+    value = request.query_params.get(name, '')
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+def nested_names(names, path=''):
+    """取出属于 path 这一层的字段名，如 path 为 'attraction_detail' 时 'attraction_detail.comments' 得到 'comments'"""
+    prefix = f'{path}.' if path else ''
+    return {name[len(prefix):].split('.')[0] for name in names if name.startswith(prefix)}
+
+class DynamicFieldsMixin:
+    """
+    按查询参数裁剪字段的序列化器混入类
+    - ?fields=id,name：只返回列出的字段（仅对读请求生效）
+    - ?expand=comments：返回 Meta.expandable_fields 中默认不返回的嵌套关系
+    嵌套序列化器用点号路径指定，如 ?expand=attraction_detail.comments
+    """
+
+    def get_field_path(self):
+        """当前序列化器相对于顶层序列化器的字段路径"""
+        names = []
+        node = self
+        while node.parent is not None:
+            if getattr(node, 'field_name', ''):
+                names.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        path = self.get_field_path()
+
+        expand = nested_names(split_query_param(request, 'expand'), path)
+        for name in getattr(self.Meta, 'expandable_fields', []):
+            if name not in expand:
+                fields.pop(name, None)
+
+        if request is not None and request.method in SAFE_METHODS:
+            only = nested_names(split_query_param(request, 'fields'), path)
+            if only:
+                for name in set(fields) - only:
+                    fields.pop(name)
+
+        return fields
+
+class BatchPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    批量写入时从 context['related_objects'][模型] 中取关联对象，
+    由视图预先一次查询出整批数据引用的对象，校验时不再逐条查询
+    """
+
+    def to_internal_value(self, data):
+        objects = self.context.get('related_objects', {}).get(self.get_queryset().model)
+        if objects is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail('does_not_exist', pk_value=data)
+        return objects[pk]
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email']
 
 class ImageSerializer(serializers.ModelSerializer):
-    """图片序列化器"""
+    """图片序列化器，url 为原图，srcset 为按格式分组的响应式缩略图"""
     url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Image
-        fields = ['id', 'title', 'url']
+        fields = ['id', 'title', 'url', 'width', 'height', 'srcset']
         
     def get_url(self, obj):
         if not obj:
@@ -26,12 +95,15 @@ class ImageSerializer(serializers.ModelSerializer):
             print(f"获取图片URL时出错: {str(e)}")
             return None
 
+    def get_srcset(self, obj):
+        return build_srcset(obj)
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name', 'category']
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_detail = UserSerializer(source='user', read_only=True)
     
     class Meta:
@@ -50,12 +122,14 @@ class AttractionImageSerializer(serializers.ModelSerializer):
         model = AttractionImage
         fields = ['id', 'image', 'title', 'description', 'order']
 
-class AttractionSerializer(serializers.ModelSerializer):
+class AttractionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """景点序列化器"""
     cover_image = ImageSerializer()
     images = AttractionImageSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
+    rating_histogram = serializers.ReadOnlyField()
+    comments_count = serializers.ReadOnlyField()
     
     class Meta:
         model = Attraction
@@ -63,25 +137,47 @@ class AttractionSerializer(serializers.ModelSerializer):
             'id', 'name', 'description', 'destination', 
             'cover_image', 'images', 'location', 'latitude', 
             'longitude', 'opening_hours', 'ticket_price', 
-            'category', 'tags', 'rating', 'views_count', 
+            'category', 'tags', 'rating', 'rating_count', 'rating_histogram',
+            'comments_count', 'favorites_count', 'views_count', 'unique_visitors',
             'recommended_duration', 'comments'
         ]
+        # 评分和计数由评论、收藏汇总得出
+        read_only_fields = ['rating', 'rating_count', 'favorites_count']
 
-class DestinationSerializer(serializers.ModelSerializer):
+class AttractionListSerializer(AttractionSerializer):
+    """景点列表序列化器，图片集和评论需通过 ?expand= 显式请求"""
+
+    class Meta(AttractionSerializer.Meta):
+        expandable_fields = ['images', 'comments']
+
+class DestinationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     cover_image = ImageSerializer()
     tags = TagSerializer(many=True, read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
+    rating_histogram = serializers.ReadOnlyField()
+    comments_count = serializers.ReadOnlyField()
     
     class Meta:
         model = Destination
         fields = [
             'id', 'title', 'description', 'long_description', 'cover_image', 'location',
             'province', 'country', 'latitude', 'longitude', 'category', 'tags', 'best_season',
-            'views_count', 'rating', 'comments'
+            'views_count', 'unique_visitors', 'rating', 'rating_count', 'rating_histogram',
+            'comments_count', 'favorites_count', 'comments'
         ]
+        read_only_fields = ['rating', 'rating_count', 'favorites_count']
+
+class DestinationListSerializer(DestinationSerializer):
+    """目的地列表序列化器，详细描述和评论需通过 ?expand= 显式请求"""
+
+    class Meta(DestinationSerializer.Meta):
+        expandable_fields = ['long_description', 'comments']
 
 class ItineraryItemSerializer(serializers.ModelSerializer):
-    attraction_detail = AttractionSerializer(source='attraction', read_only=True)
+    attraction = BatchPrimaryKeyRelatedField(
+        queryset=Attraction.objects.all(), allow_null=True, required=False
+    )
+    attraction_detail = AttractionListSerializer(source='attraction', read_only=True)
 
     class Meta:
         model = ItineraryItem
@@ -97,10 +193,10 @@ class ItineraryDaySerializer(serializers.ModelSerializer):
         model = ItineraryDay
         fields = ['id', 'day_number', 'date', 'note', 'items']
 
-class ItinerarySerializer(serializers.ModelSerializer):
+class ItinerarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     days = ItineraryDaySerializer(many=True, read_only=True)
     user_detail = UserSerializer(source='user', read_only=True)
-    destination_detail = DestinationSerializer(source='destination', read_only=True)
+    destination_detail = DestinationListSerializer(source='destination', read_only=True)
 
     class Meta:
         model = Itinerary
@@ -111,8 +207,9 @@ class ItinerarySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['user', 'created_at', 'updated_at']
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    attraction_detail = AttractionSerializer(source='attraction', read_only=True)
+class FavoriteSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    attraction = BatchPrimaryKeyRelatedField(queryset=Attraction.objects.all())
+    attraction_detail = AttractionListSerializer(source='attraction', read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
 
     class Meta:
@@ -0,0 +1,237 @@
+"""
+信号处理
+- 目的地发布、下线、修改或删除时使热门目的地缓存失效
+- 景点及其标签变化时增量更新检索索引
+- 景点、目的地的标签或景点图片变化时更新 updated_at，使详情接口的 ETag 失效
+- 景点位置或评分变化时差量更新地图网格聚合
+- 行程、日程、行程项目及其引用的景点和目的地（包括标签）变化时更新行程快照
+- 评论创建、修改、删除时差量更新景点和目的地的评分统计
+- 收藏创建、修改、删除时更新景点和目的地的收藏数
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from wagtail.signals import page_published, page_unpublished
+
+from .caching import invalidate_popular_destinations
+from .clusters import add_to_cells, remove_from_cells
+from .favorites import favorite_changed
+from .models import (
+    Attraction, AttractionImage, Comment, Destination, Favorite, Itinerary, ItineraryDay,
+    ItineraryItem, Tag
+)
+from .ratings import comment_rating_changed
+from .search_index import index_attraction, index_attractions
+from .snapshots import (
+    mark_stale, mark_stale_for_attraction, mark_stale_for_attractions, mark_stale_for_destination,
+    mark_stale_for_destinations, refresh_snapshot_day
+)
+
+
+@receiver(page_published, sender=Destination)
+@receiver(page_unpublished, sender=Destination)
+@receiver(post_delete, sender=Destination)
+def destination_changed(sender, instance, **kwargs):
+    invalidate_popular_destinations()
+    mark_stale_for_destination(instance.pk)
+
+
+@receiver(post_save, sender=Destination)
+def destination_saved(sender, instance, created, raw=False, **kwargs):
+    # 接口修改不经过发布流程
+    if not created and not raw:
+        invalidate_popular_destinations()
+        mark_stale_for_destination(instance.pk)
+
+
+def touch(model, pks):
+    """关联数据变化后更新 updated_at（详情接口的版本），不触发保存信号"""
+    model.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Attraction)
+def attraction_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_attraction(instance)
+
+
+@receiver(m2m_changed, sender=Attraction.tags.through)
+def attraction_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # 从标签一侧清空时，先记下受影响的景点
+        instance._cleared_attraction_ids = list(instance.attractions.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # 从标签一侧修改时 instance 是标签
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_attraction_ids', [])
+        index_attractions(Attraction.objects.filter(pk__in=pk_set))
+        touch(Attraction, pk_set)
+        mark_stale_for_attractions(pk_set)
+    else:
+        index_attraction(instance)
+        touch(Attraction, [instance.pk])
+        mark_stale_for_attraction(instance.pk)
+
+
+@receiver(m2m_changed, sender=Destination.tags.through)
+def destination_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_destination_ids = list(instance.destinations.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_destination_ids', [])
+        touch(Destination, pk_set)
+        mark_stale_for_destinations(pk_set)
+    else:
+        touch(Destination, [instance.pk])
+        mark_stale_for_destination(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        index_attractions(instance.attractions.all())
+        tag_relations_changed(instance)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    # 删除标签时关联行级联删除，不触发 m2m_changed
+    tag_relations_changed(instance)
+
+
+def tag_relations_changed(tag):
+    """标签改名或删除后，带有该标签的景点和目的地的详情版本、行程快照都要更新"""
+    attraction_ids = list(tag.attractions.values_list('pk', flat=True))
+    destination_ids = list(tag.destinations.values_list('pk', flat=True))
+    touch(Attraction, attraction_ids)
+    touch(Destination, destination_ids)
+    mark_stale_for_attractions(attraction_ids)
+    mark_stale_for_destinations(destination_ids)
+
+
+@receiver(post_save, sender=AttractionImage)
+@receiver(post_delete, sender=AttractionImage)
+def attraction_image_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch(Attraction, [instance.attraction_id])
+
+
+@receiver(pre_save, sender=Attraction)
+def attraction_pre_save(sender, instance, raw=False, **kwargs):
+    # 记下保存前的位置和评分，用于差量更新地图网格
+    instance._map_cell_state = None
+    if instance.pk and not raw:
+        instance._map_cell_state = Attraction.objects.filter(pk=instance.pk).values_list(
+            'geohash', 'latitude', 'longitude', 'rating'
+        ).first()
+
+
+@receiver(post_save, sender=Attraction)
+def attraction_map_cells(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_map_cell_state', None)
+    new = (instance.geohash, instance.latitude, instance.longitude, instance.rating)
+    if old == new:
+        return
+    with transaction.atomic():
+        if old:
+            remove_from_cells(instance.pk, *old[:3])
+        add_to_cells(instance)
+
+
+@receiver(pre_delete, sender=Attraction)
+def attraction_deleting(sender, instance, **kwargs):
+    # 行程项目的 attraction 由级联置空（不触发信号），删除前记下引用它的行程
+    instance._itinerary_ids = list(ItineraryItem.objects.filter(
+        attraction_id=instance.pk
+    ).values_list('day__itinerary', flat=True).distinct())
+
+
+@receiver(post_delete, sender=Attraction)
+def attraction_deleted(sender, instance, **kwargs):
+    remove_from_cells(instance.pk, instance.geohash, instance.latitude, instance.longitude)
+    mark_stale(getattr(instance, '_itinerary_ids', []))
+
+
+@receiver(post_save, sender=Attraction)
+def attraction_snapshots(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        mark_stale_for_attraction(instance.pk)
+
+
+@receiver(post_save, sender=Itinerary)
+def itinerary_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        mark_stale([instance.pk])
+
+
+@receiver(post_save, sender=ItineraryDay)
+@receiver(post_delete, sender=ItineraryDay)
+def itinerary_day_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_snapshot_day(instance.itinerary_id, instance.pk)
+
+
+@receiver(post_save, sender=ItineraryItem)
+@receiver(post_delete, sender=ItineraryItem)
+def itinerary_item_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        itinerary_id = ItineraryDay.objects.filter(pk=instance.day_id).values_list(
+            'itinerary_id', flat=True
+        ).first()
+        if itinerary_id is not None:
+            refresh_snapshot_day(itinerary_id, instance.day_id)
+
+
+def comment_rating_state(comment):
+    return (comment.destination_id, comment.attraction_id, comment.rating)
+
+
+@receiver(pre_save, sender=Comment)
+def comment_pre_save(sender, instance, raw=False, **kwargs):
+    # 记下保存前的评价对象和评分，用于差量更新评分统计
+    instance._rating_state = None
+    if instance.pk and not raw:
+        instance._rating_state = Comment.objects.filter(pk=instance.pk).values_list(
+            'destination_id', 'attraction_id', 'rating'
+        ).first()
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        comment_rating_changed(getattr(instance, '_rating_state', None), comment_rating_state(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    comment_rating_changed(comment_rating_state(instance), None)
+
+
+@receiver(pre_save, sender=Favorite)
+def favorite_pre_save(sender, instance, raw=False, **kwargs):
+    instance._counted_attraction_id = None
+    if instance.pk and not raw:
+        instance._counted_attraction_id = Favorite.objects.filter(pk=instance.pk).values_list(
+            'attraction_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        favorite_changed(getattr(instance, '_counted_attraction_id', None), instance.attraction_id)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    favorite_changed(instance.attraction_id, None)
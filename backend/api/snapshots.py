@@ -0,0 +1,110 @@
+"""
+行程读模型
+ItinerarySnapshot 保存与 ItinerarySerializer 输出相同的完整行程数据，读取时一次查询直接返回：
+- 日程或行程项目变化时只重新序列化受影响的那一天，替换快照中对应的条目
+- 行程本身、其中的景点或目的地（包括标签、收藏数）变化时把快照标记为过期，下次读取时整体重建
+每次写入快照版本号加一，可直接用作 ETag
+批量写入时在 deferred_snapshot_refresh() 中合并，每个受影响的日程只重新序列化一次
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Itinerary, ItineraryItem, ItinerarySnapshot
+from .querysets import itinerary_day_queryset, itinerary_queryset
+from .serializers import ItineraryDaySerializer, ItinerarySerializer
+
+# deferred_snapshot_refresh() 期间等待刷新的 (行程主键, 日程主键)
+_pending_days = ContextVar('pending_snapshot_days', default=None)
+
+
+def build_itinerary_snapshot(itinerary_id):
+    """整体重建行程快照"""
+    itinerary = itinerary_queryset().get(pk=itinerary_id)
+    data = ItinerarySerializer(itinerary).data
+    with transaction.atomic():
+        snapshot, created = ItinerarySnapshot.objects.select_for_update().get_or_create(
+            itinerary_id=itinerary_id, defaults={'data': data}
+        )
+        if not created:
+            snapshot.data = data
+            snapshot.version += 1
+            snapshot.is_stale = False
+            snapshot.save()
+    return snapshot
+
+
+def get_snapshot(itinerary):
+    """行程的最新快照，缺失或过期时重建（itinerary 应已 select_related('snapshot')）"""
+    try:
+        snapshot = itinerary.snapshot
+    except ItinerarySnapshot.DoesNotExist:
+        snapshot = None
+    if snapshot is None or snapshot.is_stale:
+        snapshot = build_itinerary_snapshot(itinerary.pk)
+    return snapshot
+
+
+@contextmanager
+def deferred_snapshot_refresh():
+    """批量写入期间只记录受影响的日程，结束时每个日程刷新一次"""
+    pending = set()
+    token = _pending_days.set(pending)
+    try:
+        yield pending
+    finally:
+        _pending_days.reset(token)
+    for itinerary_id, day_id in pending:
+        refresh_snapshot_day(itinerary_id, day_id)
+
+
+def refresh_snapshot_day(itinerary_id, day_id):
+    """重新序列化某一天并替换到快照中；日程已删除时从快照中移除"""
+    pending = _pending_days.get()
+    if pending is not None:
+        pending.add((itinerary_id, day_id))
+        return
+    with transaction.atomic():
+        snapshot = ItinerarySnapshot.objects.select_for_update().filter(
+            itinerary_id=itinerary_id, is_stale=False
+        ).first()
+        if snapshot is None:
+            # 没有可用的快照，等下次读取时整体重建
+            return
+
+        days = [day for day in snapshot.data.get('days', []) if day['id'] != day_id]
+        day = itinerary_day_queryset().filter(pk=day_id, itinerary_id=itinerary_id).first()
+        if day is not None:
+            days.append(ItineraryDaySerializer(day).data)
+        days.sort(key=lambda d: d['day_number'])
+
+        snapshot.data = {**snapshot.data, 'days': days}
+        snapshot.version += 1
+        snapshot.save()
+
+
+def mark_stale(itineraries):
+    """将行程快照标记为过期，itineraries 为行程查询集或主键列表"""
+    ItinerarySnapshot.objects.filter(itinerary__in=itineraries).update(
+        is_stale=True, version=F('version') + 1
+    )
+
+
+def mark_stale_for_attraction(attraction_id):
+    mark_stale_for_attractions([attraction_id])
+
+
+def mark_stale_for_attractions(attraction_ids):
+    mark_stale(ItineraryItem.objects.filter(
+        attraction_id__in=attraction_ids
+    ).values('day__itinerary'))
+
+
+def mark_stale_for_destination(destination_id):
+    mark_stale_for_destinations([destination_id])
+
+
+def mark_stale_for_destinations(destination_ids):
+    mark_stale(Itinerary.objects.filter(destination_id__in=destination_ids).values('pk'))
@@ -1,3 +1,1391 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage, ImageDraw
+from rest_framework.test import APIClient
+from wagtail.images import get_image_model
+from wagtail.models import Page
+
+from . import counters
+from .caching import POPULAR_DESTINATIONS_KEY, get_or_build
+from .clusters import add_to_cells, rebuild_map_cells, remove_from_cells, update_cells_rating
+from .counters import ViewCountBuffer, flush_view_counts, get_client_ip, refresh_visitor_windows
+from .data_collectors import fetching
+from .data_collectors.amap_collector import AmapCollector
+from .data_collectors.poi_types import POI_TYPE_MAPPING
+from .geo import encode_geohash
+from .hyperloglog import HyperLogLog
+from .image_dedup import (
+    content_hash, find_image_by_url, find_images_by_url, fingerprint_existing_images, image_size_probe,
+    import_image, prepare_image, save_images
+)
+from .ingestion import upsert_attractions
+from .management.commands.collect_attractions import Command as CollectAttractionsCommand
+from .management.commands.collect_poi_data import Command as CollectPOIDataCommand
+from .middleware import _choose_encoding
+from .models import (
+    Attraction, AttractionImage, Comment, Destination, Favorite, ImageFingerprint, ImageSource, Itinerary,
+    ItineraryDay, ItineraryItem, ItinerarySnapshot, MapCell, Tag, VisitorSketch
+)
+from .ratings import reconcile_ratings
+from .renditions import RENDITION_SPECS, build_srcset, images_missing_renditions
+from .search_index import index_attractions, tokenize
+from .snapshots import build_itinerary_snapshot
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """记录收到的请求参数，按 server.respond 的结果返回 JSON"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(parse_qs(urlparse(self.path).query))
+            status, payload = server.respond(server.requests[-1], len(server.requests))
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub_server(test, respond):
+    """
+    在本机线程中启动 HTTP 桩服务，respond(参数, 第几个请求) -> (状态码, JSON)
+    返回 (服务, 地址)，测试结束时关闭
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.respond = respond
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server, f'http://127.0.0.1:{server.server_port}/'
+
+
+class StubServerTestCase(TestCase):
+    def start_server(self, respond):
+        self.server, url = start_stub_server(self, respond)
+        return url
+
+    def setUp(self):
+        # 重试不等待，测试只验证重试次数
+        patcher = mock.patch.object(fetching, 'backoff_delay', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+def poi_page(total, page, type_code='110000'):
+    """模拟高德POI搜索的一页结果"""
+    start = (page - 1) * 20
+    pois = [
+        {'id': f'B{type_code}{i}', 'name': f'{type_code}-{i}', 'typecode': type_code}
+        for i in range(start, min(start + 20, total))
+    ]
+    return {'status': '1', 'count': str(total), 'infocode': '10000', 'pois': pois}
+
+
+@override_settings(AMAP_API_KEY='test', AMAP_QPS=1000, AMAP_MAX_WORKERS=4)
+class AmapCollectorFetchTests(StubServerTestCase):
+    def test_pages_fetched_up_to_total(self):
+        url = self.start_server(lambda params, n: (200, poi_page(45, int(params['page'][0]))))
+        pois = AmapCollector(base_url=url).collect_city_pois('杭州', ['110000'], max_pages=5)
+
+        self.assertEqual(len(pois), 45)
+        self.assertEqual(len({poi['id'] for poi in pois}), 45)
+        # 总数 45 条只需 3 页，不请求第 4、5 页
+        self.assertEqual(sorted(int(r['page'][0]) for r in self.server.requests), [1, 2, 3])
+
+    def test_max_pages_limits_requests(self):
+        url = self.start_server(lambda params, n: (200, poi_page(200, int(params['page'][0]))))
+        pois = AmapCollector(base_url=url).collect_city_pois('杭州', ['110000'], max_pages=2)
+
+        self.assertEqual(len(pois), 40)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_types_fanned_out(self):
+        url = self.start_server(
+            lambda params, n: (200, poi_page(25, int(params['page'][0]), params['types'][0]))
+        )
+        results = AmapCollector(base_url=url).collect_pois_by_type('杭州', ['110000', '140100'], max_pages=3)
+
+        self.assertEqual({code: len(pois) for code, pois in results.items()}, {'110000': 25, '140100': 25})
+        self.assertTrue(all(poi['typecode'] == '140100' for poi in results['140100']))
+
+    def test_qps_limit_infocode_retried(self):
+        def respond(params, n):
+            if n == 1:
+                return 200, {'status': '0', 'infocode': '10021', 'info': 'CUQPS_HAS_EXCEEDED_THE_LIMIT'}
+            return 200, poi_page(5, 1)
+
+        url = self.start_server(respond)
+        pois = AmapCollector(base_url=url).collect_city_pois('杭州', ['110000'], max_pages=1)
+
+        self.assertEqual(len(pois), 5)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_server_error_retried(self):
+        url = self.start_server(lambda params, n: (503, {}) if n <= 2 else (200, poi_page(5, 1)))
+        pois = AmapCollector(base_url=url).collect_city_pois('杭州', ['110000'], max_pages=1)
+
+        self.assertEqual(len(pois), 5)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_gives_up_after_max_retries(self):
+        url = self.start_server(lambda params, n: (503, {}))
+        collector = AmapCollector(base_url=url)
+
+        with mock.patch('builtins.print'):
+            self.assertIsNone(collector.fetch_page('杭州', ['110000']))
+            # 首次请求加 3 次重试
+            self.assertEqual(len(self.server.requests), 4)
+            self.assertEqual(collector.collect_city_pois('杭州', ['110000']), [])
+
+    def test_get_with_retry_raises_after_retries(self):
+        url = self.start_server(lambda params, n: (429, {}))
+
+        with self.assertRaises(requests.HTTPError):
+            fetching.get_with_retry(fetching.make_session(), url, retries=2)
+        self.assertEqual(len(self.server.requests), 3)
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """按 server.body 返回文件；server.content_length 为 False 时不发送 Content-Length，以关闭连接结束"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if self.server.content_length:
+            self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        try:
+            for start in range(0, len(self.server.body), 64 * 1024):
+                self.wfile.write(self.server.body[start:start + 64 * 1024])
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前中止下载
+            pass
+
+
+def png_header(width, height):
+    """只有文件头（IHDR 和空的 IDAT）的 PNG，用于构造声明了超大尺寸的图片"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', b'')
+
+
+class StreamingDownloadTests(TestCase):
+    def serve(self, body, content_length=True):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+        server.body, server.content_length = body, content_length
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_port}/image'
+
+    def download(self, url, max_bytes, **kwargs):
+        return fetching.download(fetching.make_session(), url, max_bytes, retries=0, **kwargs)
+
+    def test_within_limit(self):
+        body = encode_test_image((20, 40, 60))
+        for content_length in (True, False):
+            url = self.serve(body, content_length)
+            self.assertEqual(self.download(url, len(body), probe=image_size_probe), body)
+
+    def test_content_length_over_limit(self):
+        url = self.serve(b'x' * 2048)
+        with self.assertRaisesRegex(ValueError, '文件大小 2048 字节'):
+            self.download(url, 1024)
+
+    def test_stream_over_limit(self):
+        url = self.serve(b'x' * 300 * 1024, content_length=False)
+        with self.assertRaisesRegex(ValueError, '文件超过上限'):
+            self.download(url, 100 * 1024)
+
+    @override_settings(IMAGE_MAX_PIXELS=1_000_000)
+    def test_probe_rejects_huge_image(self):
+        # 文件头声明 4000x4000，后面的数据不必下载完
+        url = self.serve(png_header(4000, 4000) + b'\0' * 1024 * 1024)
+        with self.assertRaisesRegex(ValueError, '4000x4000'):
+            self.download(url, 10 * 1024 * 1024, probe=image_size_probe)
+
+        with self.assertRaisesRegex(ValueError, '超过上限'):
+            prepare_image(png_header(4000, 4000))
+
+    @override_settings(AMAP_API_KEY='test', IMAGE_DOWNLOAD_MAX_BYTES=1024)
+    def test_collector_skips_oversized(self):
+        collector = AmapCollector()
+        small = encode_test_image((20, 40, 60), size=(8, 8))
+        self.assertIsNotNone(collector.download_image(self.serve(small)))
+        with mock.patch('builtins.print') as printed:
+            self.assertIsNone(collector.download_image(self.serve(b'x' * 4096)))
+        self.assertIn('超过上限', printed.call_args[0][0])
+
+
+class TokenBucketTests(TestCase):
+    def test_burst_then_paced(self):
+        bucket = fetching.TokenBucket(rate=20, capacity=5)
+        begin = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        # 桶内令牌允许立即突发
+        self.assertLess(time.monotonic() - begin, 0.05)
+
+        for _ in range(10):
+            bucket.acquire()
+        # 其余 10 个请求按每秒 20 个放行，约 0.5 秒
+        self.assertGreaterEqual(time.monotonic() - begin, 0.45)
+
+    def test_shared_across_threads(self):
+        bucket = fetching.TokenBucket(rate=50, capacity=1)
+        stamps = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(5):
+                bucket.acquire()
+                with lock:
+                    stamps.append(time.monotonic())
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stamps.sort()
+        # 4 个线程共 20 个请求仍按总速率每秒 50 个放行
+        self.assertGreaterEqual(stamps[-1] - stamps[0], 19 / 50 * 0.9)
+
+    @override_settings(AMAP_API_KEY='test', AMAP_QPS=10, AMAP_MAX_WORKERS=8)
+    def test_collector_requests_paced(self):
+        server, url = start_stub_server(self, lambda params, n: (200, poi_page(20, 1, params['types'][0])))
+        collector = AmapCollector(base_url=url)
+        collector.limiter.tokens = 1
+
+        begin = time.monotonic()
+        collector.collect_pois_by_type('杭州', [str(110000 + i) for i in range(6)], max_pages=1)
+        # 6 个请求、每秒 10 个、初始只有 1 个令牌：至少等待 0.5 秒
+        self.assertGreaterEqual(time.monotonic() - begin, 0.45)
+        self.assertEqual(len(server.requests), 6)
+
+
+def encode_test_image(color, size=(64, 48), fmt='PNG'):
+    image = PILImage.new('RGB', size, color)
+    ImageDraw.Draw(image).rectangle([0, 0, size[0] // 2, size[1] // 3], fill=(255 - color[0], 40, 90))
+    output = io.BytesIO()
+    image.save(output, format=fmt)
+    return output.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageSourceTests(TestCase):
+    def prepared(self, data, url):
+        return dict(prepare_image(data), title='t', file_name='t.png', source_url=url)
+
+    def test_every_url_recorded(self):
+        data = encode_test_image((200, 10, 10))
+        saved = save_images([
+            self.prepared(data, 'http://a.example/1.png'),
+            # 同一批内内容相同
+            self.prepared(data, 'http://b.example/1.png'),
+        ])
+        self.assertEqual(saved['http://a.example/1.png'], saved['http://b.example/1.png'])
+
+        # 内容哈希命中已有图片
+        again = save_images([self.prepared(data, 'http://c.example/1.png')])
+        self.assertEqual(again['http://c.example/1.png'], saved['http://a.example/1.png'])
+
+        urls = ['http://a.example/1.png', 'http://b.example/1.png', 'http://c.example/1.png']
+        self.assertEqual(set(find_images_by_url(urls)), set(urls))
+        self.assertEqual(get_image_model().objects.count(), 1)
+
+    def test_import_image_records_url_on_hit(self):
+        data = encode_test_image((10, 200, 10))
+        first = import_image(data, 't', 't.png', source_url='http://a.example/2.png')
+        second = import_image(data, 't', 't.png', source_url='http://b.example/2.png')
+
+        self.assertEqual(first, second)
+        self.assertEqual(find_image_by_url('http://b.example/2.png'), first)
+        self.assertEqual(ImageSource.objects.filter(image=first).count(), 2)
+
+    def test_backfilled_fingerprint_matches_collected_bytes(self):
+        def normalize(image):
+            output = io.BytesIO()
+            image.convert('RGB').save(output, format='JPEG', quality=85)
+            return output.getvalue()
+
+        data = encode_test_image((200, 200, 10))
+        image = import_image(data, 't', 't.png', normalize=normalize)
+        ImageFingerprint.objects.all().delete()
+        ImageSource.objects.all().delete()
+
+        # 保存的是规范化后的字节，补记的指纹只有感知哈希
+        self.assertEqual(fingerprint_existing_images(), 1)
+        self.assertIsNone(ImageFingerprint.objects.get(image=image).content_hash)
+
+        saved = save_images([self.prepared(data, 'http://a.example/3.png')])
+        self.assertEqual(saved['http://a.example/3.png'], image)
+        # 感知哈希命中后记下下载字节的内容哈希，下次直接命中
+        self.assertTrue(ImageFingerprint.objects.filter(image=image, content_hash=content_hash(data)).exists())
+        self.assertEqual(get_image_model().objects.count(), 1)
+
+
+@override_settings(AMAP_API_KEY='test', AMAP_MAX_WORKERS=2, MEDIA_ROOT=tempfile.mkdtemp())
+class CollectImagesTests(TestCase):
+    def test_saved_in_bounded_batches(self):
+        collector = AmapCollector()
+        urls = [f'http://img.example/{i}.png' for i in range(5)]
+        pois = [{'name': 'p', 'photos': [{'url': url} for url in urls]}]
+        batches = []
+
+        def save(images):
+            batches.append(len(images))
+            return save_images(images)
+
+        download = lambda url: prepare_image(encode_test_image((int(url[-5]) * 50, 0, 0)))
+        with mock.patch('api.data_collectors.amap_collector.IMAGE_BATCH_SIZE', 2), \
+                mock.patch.object(collector, 'download_image', side_effect=download), \
+                mock.patch('api.data_collectors.amap_collector.save_images', side_effect=save):
+            images = collector.collect_images(pois)
+
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertEqual(set(images), set(urls))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RenditionTests(TestCase):
+    def test_generated_by_command_not_on_import(self):
+        image = import_image(encode_test_image((30, 60, 200), size=(400, 300)), 't', 't.png')
+        self.assertEqual(image.renditions.count(), 0)
+        self.assertEqual(build_srcset(image), {})
+        self.assertEqual(list(images_missing_renditions()), [image])
+
+        out = io.StringIO()
+        call_command('generate_renditions', stdout=out)
+        self.assertIn('共 1 张图片', out.getvalue())
+        self.assertEqual(image.renditions.filter(filter_spec__in=RENDITION_SPECS).count(), len(RENDITION_SPECS))
+        srcset = build_srcset(image)
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        self.assertIn('320w', srcset['webp'])
+
+        # 再次执行时跳过已生成的图片
+        out = io.StringIO()
+        call_command('generate_renditions', stdout=out)
+        self.assertIn('共 0 张图片', out.getvalue())
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'view_counts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    },
+})
+class ViewCountParkingTests(TestCase):
+    def setUp(self):
+        home = Page.objects.get(depth=2)
+        self.destination = home.add_child(instance=Destination(title='杭州', slug='hangzhou', location='杭州'))
+
+    def test_parked_counts_flushed_by_another_process(self):
+        worker = ViewCountBuffer(Destination, 'destination')
+        worker.incr(self.destination.pk, amount=3)
+        with mock.patch.object(worker, '_write', side_effect=DatabaseError('database is locked')):
+            self.assertEqual(worker.flush(), 0)
+
+        # flush_view_counts 命令所在的进程只能从共享缓存中取到计数
+        command = ViewCountBuffer(Destination, 'destination')
+        self.assertEqual(command.flush(), 1)
+        self.destination.refresh_from_db()
+        self.assertEqual(self.destination.views_count, 3)
+        self.assertEqual(command.flush(), 0)
+
+
+class ViewCountBufferTests(TestCase):
+    def setUp(self):
+        home = Page.objects.get(depth=2)
+        self.destination = home.add_child(instance=Destination(title='杭州', slug='hangzhou', location='杭州'))
+        self.attraction = Attraction.objects.create(name='西湖', destination=self.destination, location='西湖')
+        self.addCleanup(flush_view_counts)
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+    def test_detail_reads_do_not_write(self):
+        url = f'/api/attractions/{self.attraction.pk}/'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.client.get(url)
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT'))])
+        self.attraction.refresh_from_db()
+        self.assertEqual(self.attraction.views_count, 0)
+
+        self.assertEqual(flush_view_counts(), 1)
+        self.attraction.refresh_from_db()
+        self.assertEqual(self.attraction.views_count, 4)
+        self.assertEqual(self.attraction.unique_visitors, 1)
+
+    def test_flush_batches_counts(self):
+        other = Attraction.objects.create(name='灵隐寺', destination=self.destination, location='灵隐')
+        buffer = ViewCountBuffer(Attraction, 'attraction')
+        buffer.incr(self.attraction.pk, amount=2)
+        buffer.incr(other.pk)
+        buffer.incr(self.attraction.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            dict(Attraction.objects.values_list('pk', 'views_count')),
+            {self.attraction.pk: 3, other.pk: 1}
+        )
+        self.assertEqual(buffer.flush(), 0)
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=0.01)
+    def test_background_flush_thread(self):
+        flushed = threading.Event()
+        self.addCleanup(counters.enable_background_flush, False)
+        with mock.patch('api.counters.flush_view_counts', side_effect=flushed.set), \
+                mock.patch('api.counters.connection'), \
+                mock.patch('api.counters._flush_thread_pid', None):
+            # 未开启时不启动线程
+            counters.attraction_views.incr(self.attraction.pk)
+            self.assertFalse(flushed.wait(0.1))
+
+            counters.enable_background_flush()
+            counters.attraction_views.incr(self.attraction.pk)
+            self.assertTrue(flushed.wait(2))
+            counters.enable_background_flush(False)
+            time.sleep(0.05)
+
+
+class APITestBase(TestCase):
+    """一个用户、一个目的地、几个景点和一份两天的行程"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('traveler', 'traveler@example.com', 'pw-123456')
+        home = Page.objects.get(depth=2)
+        self.destination = home.add_child(instance=Destination(title='杭州', slug='hangzhou', location='杭州'))
+        self.attractions = [
+            Attraction.objects.create(
+                name=f'景点{n}', destination=self.destination, location='西湖',
+                latitude=30.25 + n * 0.01, longitude=120.15 + n * 0.01
+            )
+            for n in range(4)
+        ]
+        self.itinerary = Itinerary.objects.create(
+            title='杭州两日游', user=self.user, destination=self.destination,
+            start_date=datetime.date(2025, 4, 1), end_date=datetime.date(2025, 4, 2)
+        )
+        self.days = [
+            ItineraryDay.objects.create(
+                itinerary=self.itinerary, day_number=n + 1, date=datetime.date(2025, 4, 1 + n)
+            )
+            for n in range(2)
+        ]
+        self.items = [
+            ItineraryItem.objects.create(
+                day=self.days[0], attraction=attraction,
+                start_time=datetime.time(9 + n), end_time=datetime.time(10 + n)
+            )
+            for n, attraction in enumerate(self.attractions[:3])
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # 在测试数据库销毁前写回详情接口缓冲的浏览量
+        self.addCleanup(flush_view_counts)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class EagerLoadingTests(APITestBase):
+    """列表和详情接口的查询次数与对象数量无关"""
+
+    def setUp(self):
+        super().setUp()
+        self.image = import_image(encode_test_image((90, 120, 30)), 't', 't.png')
+        self.tag = Tag.objects.create(name='湖泊', category='主题')
+        self.decorate(self.attractions)
+
+    def decorate(self, attractions):
+        for attraction in attractions:
+            attraction.cover_image = self.image
+            attraction.save()
+            attraction.tags.add(self.tag)
+            AttractionImage.objects.create(attraction=attraction, image=self.image)
+            Comment.objects.create(user=self.user, attraction=attraction, content='不错', rating=4)
+            Favorite.objects.get_or_create(user=self.user, attraction=attraction)
+
+    def add_attractions(self, count):
+        attractions = [
+            Attraction.objects.create(name=f'新景点{n}', destination=self.destination, location='西湖')
+            for n in range(count)
+        ]
+        self.decorate(attractions)
+        for attraction in attractions:
+            ItineraryItem.objects.create(
+                day=self.days[1], attraction=attraction,
+                start_time=datetime.time(9), end_time=datetime.time(10)
+            )
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_constant_queries(self):
+        requests = [
+            ('/api/attractions/', {'expand': 'images,comments'}),
+            (f'/api/destinations/{self.destination.pk}/attractions/', {'expand': 'images,comments'}),
+            ('/api/favorites/', None),
+            # 裁剪字段的请求不读快照，实时序列化
+            (f'/api/itineraries/{self.itinerary.pk}/', {'expand': 'days'}),
+            ('/api/itinerary-items/', None),
+        ]
+        before = [self.count_queries(url, params) for url, params in requests]
+        self.add_attractions(4)
+        after = [self.count_queries(url, params) for url, params in requests]
+        self.assertEqual(before, after)
+
+    def test_detail_queries(self):
+        url = f'/api/attractions/{self.attractions[0].pk}/'
+        before = self.count_queries(url)
+        for _ in range(3):
+            AttractionImage.objects.create(attraction=self.attractions[0], image=self.image)
+            Comment.objects.create(user=self.user, attraction=self.attractions[0], content='好', rating=5)
+        self.assertEqual(self.count_queries(url), before)
+
+
+class SparseFieldsTests(APITestBase):
+    def setUp(self):
+        super().setUp()
+        Comment.objects.create(user=self.user, attraction=self.attractions[0], content='不错', rating=4)
+
+    def test_list_omits_expandable_fields(self):
+        item = self.client.get('/api/attractions/').data['results'][0]
+        self.assertNotIn('images', item)
+        self.assertNotIn('comments', item)
+        self.assertIn('tags', item)
+
+        item = self.client.get('/api/attractions/', {'expand': 'comments'}).data['results'][0]
+        self.assertIn('comments', item)
+        self.assertNotIn('images', item)
+
+        destination = self.client.get('/api/destinations/').data['results'][0]
+        self.assertNotIn('long_description', destination)
+
+    def test_detail_returns_everything(self):
+        data = self.client.get(f'/api/attractions/{self.attractions[0].pk}/').data
+        self.assertEqual(len(data['comments']), 1)
+        self.assertIn('images', data)
+
+    def test_fields(self):
+        response = self.client.get('/api/attractions/', {'fields': 'id,name'})
+        for item in response.data['results']:
+            self.assertEqual(set(item), {'id', 'name'})
+        data = self.client.get(f'/api/destinations/{self.destination.pk}/', {'fields': 'id,title'}).data
+        self.assertEqual(set(data), {'id', 'title'})
+
+    def test_nested_paths(self):
+        Favorite.objects.create(user=self.user, attraction=self.attractions[0])
+        item = self.client.get('/api/favorites/', {
+            'fields': 'id,attraction_detail', 'expand': 'attraction_detail.comments',
+        }).data['results'][0]
+        self.assertEqual(set(item), {'id', 'attraction_detail'})
+        self.assertEqual(item['attraction_detail']['comments'][0]['content'], '不错')
+
+        item = self.client.get('/api/favorites/', {'fields': 'attraction_detail.name'}).data['results'][0]
+        self.assertEqual(item['attraction_detail'], {'name': '景点0'})
+
+    def test_fields_ignored_on_write(self):
+        response = self.client.patch(
+            f'/api/itineraries/{self.itinerary.pk}/?fields=id', {'title': '新标题'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], '新标题')
+
+
+class NearbyTests(APITestBase):
+    def nearby(self, url='/api/attractions/nearby/', **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['distance']) for item in response.data]
+
+    def test_encode_geohash(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode_geohash(None, 120.0), '')
+        self.assertEqual(self.attractions[0].geohash, encode_geohash(30.25, 120.15))
+
+    def test_radius(self):
+        far = Attraction.objects.create(
+            name='千岛湖', destination=self.destination, location='淳安', latitude=29.6, longitude=119.0
+        )
+        results = self.nearby(lat=30.25, lng=120.15, radius=2000)
+        self.assertEqual([pk for pk, _ in results], [self.attractions[0].pk, self.attractions[1].pk])
+        self.assertEqual(results[0][1], 0)
+        self.assertTrue(1000 < results[1][1] < 2000)
+        self.assertNotIn(far.pk, [pk for pk, _ in self.nearby(lat=30.25, lng=120.15, radius=50000)])
+
+    def test_across_cell_boundary(self):
+        # 赤道两侧的 geohash 首字符就不同，只查中心网格会漏掉
+        south = Attraction.objects.create(
+            name='南', destination=self.destination, location='赤道', latitude=-0.0004, longitude=10.0
+        )
+        self.assertNotEqual(south.geohash[0], encode_geohash(0.0004, 10.0)[0])
+        self.assertEqual([pk for pk, _ in self.nearby(lat=0.0004, lng=10.0, radius=200)], [south.pk])
+
+    def test_nearest_expands_and_excludes_center(self):
+        results = self.nearby(near=self.attractions[0].pk, limit=3)
+        self.assertEqual([pk for pk, _ in results], [a.pk for a in self.attractions[1:4]])
+        self.assertEqual([d for _, d in results], sorted(d for _, d in results))
+
+    def test_destinations(self):
+        self.destination.latitude, self.destination.longitude = 30.25, 120.15
+        self.destination.save()
+        results = self.nearby('/api/destinations/nearby/', lat=30.26, lng=120.16, radius=5000)
+        self.assertEqual([pk for pk, _ in results], [self.destination.pk])
+
+    def test_invalid_params(self):
+        invalid = [{}, {'lat': 'x', 'lng': 1}, {'lat': 91, 'lng': 0}, {'lat': 30, 'lng': 120, 'radius': 10 ** 6}]
+        for params in invalid:
+            self.assertEqual(self.client.get('/api/attractions/nearby/', params).status_code, 400)
+
+
+class RatingAggregateTests(APITestBase):
+    def stats(self, obj):
+        obj.refresh_from_db()
+        return obj.rating, obj.rating_count, obj.rating_sum, obj.rating_histogram
+
+    def comment(self, rating, **target):
+        return Comment.objects.create(user=self.user, content='评论', rating=rating, **target)
+
+    def test_incremental_updates(self):
+        attraction = self.attractions[0]
+        first = self.comment(5, attraction=attraction)
+        second = self.comment(2, attraction=attraction)
+        self.assertEqual(self.stats(attraction), (3.5, 2, 7, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}))
+
+        second.rating = 4
+        second.save()
+        self.assertEqual(self.stats(attraction)[:3], (4.5, 2, 9))
+
+        # 改为评价目的地：从景点移出、计入目的地
+        second.attraction, second.destination = None, self.destination
+        second.save()
+        self.assertEqual(self.stats(attraction)[:3], (5.0, 1, 5))
+        self.assertEqual(self.stats(self.destination)[:3], (4.0, 1, 4))
+
+        first.delete()
+        second.delete()
+        self.assertEqual(self.stats(attraction), (5.0, 0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}))
+        self.assertEqual(self.stats(self.destination)[:2], (5.0, 0))
+
+    def test_update_does_not_overwrite_row(self):
+        attraction = self.attractions[0]
+        with CaptureQueriesContext(connection) as queries:
+            self.comment(3, attraction=attraction)
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "api_attraction"')]
+        self.assertTrue(any('"rating_sum" = ("api_attraction"."rating_sum" + 3)' in sql for sql in updates))
+
+        # 过期的对象保存其他字段不会覆盖评分统计
+        stale = Attraction.objects.get(pk=attraction.pk)
+        self.comment(1, attraction=attraction)
+        stale.description = '新描述'
+        stale.save(update_fields=['description'])
+        self.assertEqual(self.stats(attraction)[:3], (2.0, 2, 4))
+
+    def test_api_and_ordering(self):
+        data = {'attraction': self.attractions[2].pk, 'content': '一般', 'rating': 1}
+        response = self.client.post('/api/comments/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.comment(4, attraction=self.attractions[1])
+        results = self.client.get('/api/attractions/', {'ordering': 'rating'}).data['results']
+        ratings = [item['rating'] for item in results]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        self.assertEqual(results[-1]['id'], self.attractions[2].pk)
+        self.assertEqual(results[-1]['comments_count'], 1)
+
+    def test_reconcile_ratings(self):
+        self.comment(4, attraction=self.attractions[0])
+        self.comment(2, destination=self.destination)
+        self.assertEqual(reconcile_ratings(Attraction, 'attraction'), 0)
+
+        # 直接改库造成的偏差
+        Attraction.objects.filter(pk=self.attractions[0].pk).update(rating_sum=40, rating=4.5, rating_4_count=0)
+        Attraction.objects.filter(pk=self.attractions[1].pk).update(rating_count=3)
+        Destination.objects.filter(pk=self.destination.pk).update(rating=1.0)
+        self.assertEqual(reconcile_ratings(Attraction, 'attraction'), 2)
+        self.assertEqual(reconcile_ratings(Destination, 'destination'), 1)
+        self.assertEqual(self.stats(self.attractions[0]), (4.0, 1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}))
+        self.assertEqual(self.stats(self.attractions[1])[:3], (5.0, 0, 0))
+        self.assertEqual(self.stats(self.destination)[:3], (2.0, 1, 2))
+
+        out = io.StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn('修正了 0 个景点、0 个目的地', out.getvalue())
+
+
+class FavoriteCounterTests(APITestBase):
+    def setUp(self):
+        super().setUp()
+        home = Page.objects.get(depth=2)
+        self.other_destination = home.add_child(instance=Destination(title='苏州', slug='suzhou', location='苏州'))
+        self.other = Attraction.objects.create(name='拙政园', destination=self.other_destination, location='苏州')
+
+    def counts(self):
+        attractions = dict(Attraction.objects.values_list('pk', 'favorites_count'))
+        destinations = dict(Destination.objects.values_list('pk', 'favorites_count'))
+        return (
+            [attractions[a.pk] for a in self.attractions[:2]] + [attractions[self.other.pk]],
+            [destinations[self.destination.pk], destinations[self.other_destination.pk]],
+        )
+
+    def test_single_writes(self):
+        response = self.client.post('/api/favorites/', {'attraction': self.attractions[0].pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.counts(), ([1, 0, 0], [1, 0]))
+
+        favorite = response.data['id']
+        self.client.patch(f'/api/favorites/{favorite}/', {'attraction': self.other.pk}, format='json')
+        self.assertEqual(self.counts(), ([0, 0, 1], [0, 1]))
+
+        self.client.delete(f'/api/favorites/{favorite}/')
+        self.assertEqual(self.counts(), ([0, 0, 0], [0, 0]))
+
+    def test_bulk_writes(self):
+        rows = [{'attraction': self.attractions[0].pk}, {'attraction': self.attractions[1].pk},
+                {'attraction': self.other.pk}]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/favorites/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.counts(), ([1, 1, 1], [2, 1]))
+        # 增量相同的对象合并为一条 UPDATE：景点一条、目的地两条（增量 2 和 1）
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE "api_')
+                   and 'favorites_count' in q['sql']]
+        self.assertEqual(len(updates), 3)
+
+        # 改到已收藏的景点上，整批冲突，计数不变
+        first = response.data[0]['id']
+        conflict = self.client.patch(
+            '/api/favorites/bulk/', [{'id': first, 'attraction': self.other.pk}], format='json'
+        )
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(self.counts(), ([1, 1, 1], [2, 1]))
+
+        ids = [item['id'] for item in response.data]
+        self.client.generic('DELETE', '/api/favorites/bulk/', json.dumps({'ids': ids[:2]}),
+                            content_type='application/json')
+        self.assertEqual(self.counts(), ([0, 0, 1], [0, 1]))
+
+    def test_comments_count(self):
+        Comment.objects.create(user=self.user, attraction=self.attractions[0], content='好', rating=5)
+        data = self.client.get(f'/api/attractions/{self.attractions[0].pk}/').data
+        self.assertEqual(data['comments_count'], 1)
+
+    def test_repair_counters(self):
+        Favorite.objects.create(user=self.user, attraction=self.attractions[0])
+        Comment.objects.create(user=self.user, attraction=self.attractions[1], content='好', rating=3)
+        Attraction.objects.filter(pk=self.attractions[0].pk).update(favorites_count=7)
+        Attraction.objects.filter(pk=self.attractions[1].pk).update(rating_count=0)
+        Destination.objects.filter(pk=self.other_destination.pk).update(favorites_count=2)
+
+        out = io.StringIO()
+        call_command('repair_counters', stdout=out)
+        self.assertIn('评论数和评分：修正了 1 个景点、0 个目的地', out.getvalue())
+        self.assertIn('收藏数：修正了 1 个景点、1 个目的地', out.getvalue())
+        self.assertEqual(self.counts(), ([1, 0, 0], [1, 0]))
+        self.attractions[1].refresh_from_db()
+        self.assertEqual(self.attractions[1].comments_count, 1)
+
+
+class MultiGetTests(APITestBase):
+    def test_order_and_missing(self):
+        ids = [self.attractions[2].pk, 999999, self.attractions[0].pk, self.attractions[2].pk]
+        response = self.client.get('/api/attractions/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, 200)
+        # 不分页，按请求顺序返回，不存在的 id 跳过、重复的只返回一次
+        self.assertEqual(
+            [item['id'] for item in response.data], [self.attractions[2].pk, self.attractions[0].pk]
+        )
+
+        response = self.client.get('/api/destinations/', {'ids': str(self.destination.pk)})
+        self.assertEqual([item['id'] for item in response.data], [self.destination.pk])
+
+    def test_constant_queries(self):
+        tag = Tag.objects.create(name='湖泊', category='主题')
+        for attraction in self.attractions:
+            attraction.tags.add(tag)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/attractions/', {'ids': str(self.attractions[0].pk)})
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get('/api/attractions/', {'ids': ','.join(str(a.pk) for a in self.attractions)})
+        self.assertEqual(len(response.data), 4)
+
+    def test_invalid(self):
+        self.assertEqual(self.client.get('/api/attractions/', {'ids': '1,x'}).status_code, 400)
+        too_many = ','.join(str(n) for n in range(1, 102))
+        self.assertEqual(self.client.get('/api/attractions/', {'ids': too_many}).status_code, 400)
+
+
+class AttractionExportTests(APITestBase):
+    def export(self, export_format, **params):
+        response = self.client.get(
+            f'/api/destinations/{self.destination.pk}/attractions/', {'export': export_format, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn(f'.{export_format}"', response['Content-Disposition'])
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        lines = self.export('ndjson').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [a.pk for a in self.attractions])
+        # 与列表接口字段一致
+        listed = self.client.get(f'/api/destinations/{self.destination.pk}/attractions/').data['results'][0]
+        self.assertEqual(set(rows[0]), set(listed))
+
+        rows = [json.loads(line) for line in self.export('ndjson', fields='id,name').splitlines()]
+        self.assertEqual(rows[0], {'id': self.attractions[0].pk, 'name': '景点0'})
+
+    def test_csv(self):
+        tag = Tag.objects.create(name='湖泊', category='主题')
+        self.attractions[0].tags.add(tag, Tag.objects.create(name='免费', category='价格'))
+        self.attractions[0].opening_hours = '8:00-17:00, 全年'
+        self.attractions[0].save()
+
+        content = self.export('csv')
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.reader(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(rows[0][:2], ['ID', '名称'])
+        self.assertEqual(rows[0][-1], '标签')
+        self.assertEqual(len(rows), 1 + len(self.attractions))
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['名称'], '景点0')
+        self.assertEqual(first['开放时间'], '8:00-17:00, 全年')
+        self.assertEqual(sorted(first['标签'].split('|')), ['免费', '湖泊'])
+
+    def test_invalid_format(self):
+        response = self.client.get(f'/api/destinations/{self.destination.pk}/attractions/', {'export': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UpsertAttractionsTests(APITestBase):
+    def row(self, source_id, name, **fields):
+        return {
+            'source_id': source_id, 'name': name, 'destination_id': self.destination.pk,
+            'location': '杭州', 'latitude': 30.2, 'longitude': 120.1, '_tags': ['风景名胜'], **fields
+        }
+
+    def test_conflicts_update_in_place(self):
+        self.assertEqual(upsert_attractions('amap', [self.row('B1', '西湖'), self.row('B2', '灵隐寺')]), (2, 0, 0))
+        lake = Attraction.objects.get(source='amap', source_id='B1')
+        # 站内维护的数据不被采集数据覆盖
+        Attraction.objects.filter(pk=lake.pk).update(views_count=42, favorites_count=3)
+        ItineraryItem.objects.create(
+            day=self.days[1], attraction=lake, start_time=datetime.time(9), end_time=datetime.time(10)
+        )
+        build_itinerary_snapshot(self.itinerary.pk)
+
+        rows = [
+            self.row('B1', '旧名'),
+            # 同一批内重复的 POI 以最后一条为准
+            self.row('B1', '西湖风景区', description='新描述', latitude=30.25, longitude=120.15),
+            self.row('B2', '灵隐寺'),
+        ]
+        self.assertEqual(upsert_attractions('amap', rows), (0, 2, 0))
+        self.assertEqual(Attraction.objects.filter(source='amap').count(), 2)
+        lake.refresh_from_db()
+        self.assertEqual((lake.name, lake.description), ('西湖风景区', '新描述'))
+        self.assertEqual((lake.views_count, lake.favorites_count), (42, 3))
+        self.assertEqual(lake.geohash, encode_geohash(30.25, 120.15))
+        self.assertEqual(list(lake.tags.values_list('name', flat=True)), ['风景名胜'])
+        self.assertTrue(ItinerarySnapshot.objects.get(itinerary=self.itinerary).is_stale)
+
+        # 检索索引随之更新
+        response = self.client.get('/api/attractions/', {'search': '风景区'})
+        self.assertEqual([item['id'] for item in response.data['results']], [lake.pk])
+
+    def test_cover_and_images(self):
+        image = import_image(encode_test_image((10, 10, 200)), 't', 't.png')
+        gallery = [{'image': image, 'title': 't', 'description': '', 'order': 1}]
+        created = upsert_attractions('amap', [self.row('B1', '西湖', cover_image=image, _other_images=gallery)])
+        self.assertEqual(created, (1, 0, 1))
+
+        # 本次没有封面时保留原有封面，已关联的图片不重复添加
+        self.assertEqual(upsert_attractions('amap', [self.row('B1', '西湖', _other_images=gallery)]), (0, 1, 0))
+        lake = Attraction.objects.get(source_id='B1')
+        self.assertEqual(lake.cover_image_id, image.pk)
+        self.assertEqual(lake.images.count(), 1)
+
+    def test_claims_legacy_rows(self):
+        legacy = self.attractions[0]
+        self.assertEqual(upsert_attractions('amap', [self.row('B9', legacy.name)]), (0, 1, 0))
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.source, legacy.source_id), ('amap', 'B9'))
+        self.assertEqual(Attraction.objects.filter(name=legacy.name).count(), 1)
+
+
+@override_settings(AMAP_API_KEY='test')
+class CollectAttractionsCommandTests(APITestBase):
+    def pois(self):
+        return [
+            {'id': f'B{n}', 'name': f'公园{n}', 'typecode': '110101', 'address': '杭州',
+             'location': f'120.1{n},30.2{n}'}
+            for n in range(2)
+        ]
+
+    def collect(self, command):
+        results = {code: [] for code in POI_TYPE_MAPPING}
+        results['110101'] = self.pois()
+        out = io.StringIO()
+        with mock.patch.object(AmapCollector, 'collect_pois_by_type', return_value=results), \
+                mock.patch.object(AmapCollector, 'collect_images', return_value={}):
+            call_command(command, '杭州', destination_id=self.destination.pk, stdout=out)
+        return out.getvalue()
+
+    def test_collect_attractions_is_collect_poi_data(self):
+        self.assertTrue(issubclass(CollectAttractionsCommand, CollectPOIDataCommand))
+        self.assertIn('新建景点：2，更新景点：0', self.collect('collect_attractions'))
+        self.assertIn('新建景点：0，更新景点：2', self.collect('collect_poi_data'))
+        self.assertEqual(Attraction.objects.filter(source_id__in=['B0', 'B1']).count(), 2)
+        self.assertTrue(MapCell.objects.filter(count__gt=0).exists())
+
+
+class BulkWriteErrorTests(APITestBase):
+    def test_object_body_required(self):
+        for method, url in (
+            ('delete', '/api/itinerary-items/bulk/'),
+            ('post', '/api/itinerary-items/bulk/'),
+            ('post', '/api/itinerary-items/reorder/'),
+            ('delete', '/api/favorites/bulk/'),
+        ):
+            response = getattr(self.client, method)(url, [1, 2], format='json')
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_invalid_day_id_is_404(self):
+        for day in ('abc', None, 99999):
+            response = self.client.post(
+                '/api/itinerary-items/reorder/', {'day': day, 'items': [self.items[0].pk]}, format='json'
+            )
+            self.assertEqual(response.status_code, 404, day)
+        response = self.client.post(
+            '/api/itinerary-items/bulk/', {'day': 'abc', 'items': [{'attraction': self.attractions[0].pk}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_unique_conflict_is_409(self):
+        first, second = [
+            Favorite.objects.create(user=self.user, attraction=attraction)
+            for attraction in self.attractions[:2]
+        ]
+        # 把第二个收藏改到已收藏的景点上
+        response = self.client.patch(
+            '/api/favorites/bulk/', [{'id': second.pk, 'attraction': self.attractions[0].pk}], format='json'
+        )
+
+        self.assertEqual(response.status_code, 409)
+        second.refresh_from_db()
+        self.assertEqual(second.attraction_id, self.attractions[1].pk)
+        self.assertEqual(
+            list(Attraction.objects.filter(pk__in=[a.pk for a in self.attractions[:2]]).order_by('pk')
+                 .values_list('favorites_count', flat=True)),
+            [1, 1]
+        )
+
+    def test_concurrent_duplicate_create_is_409(self):
+        with mock.patch.object(Favorite.objects, 'bulk_create', side_effect=IntegrityError):
+            response = self.client.post(
+                '/api/favorites/bulk/', [{'attraction': self.attractions[0].pk}], format='json'
+            )
+        self.assertEqual(response.status_code, 409)
+        self.attractions[0].refresh_from_db()
+        self.assertEqual(self.attractions[0].favorites_count, 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DetailETagTests(APITestBase):
+    """标签、图片和接口修改都要让详情接口的 ETag 失效"""
+
+    def setUp(self):
+        super().setUp()
+        self.tag = Tag.objects.create(name='湖泊', category='主题')
+
+    def assertChanges(self, url, change):
+        etag = self.client.get(url)['ETag']
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_destination(self):
+        url = f'/api/destinations/{self.destination.pk}/'
+        self.assertChanges(url, lambda: self.client.patch(url, {'description': '人间天堂'}, format='json'))
+        self.assertChanges(url, lambda: self.destination.tags.add(self.tag))
+        self.assertChanges(url, lambda: self.tag.destinations.clear())
+
+    def test_attraction(self):
+        attraction = self.attractions[0]
+        url = f'/api/attractions/{attraction.pk}/'
+        self.assertChanges(url, lambda: attraction.tags.add(self.tag))
+        self.assertChanges(url, self.tag.save)
+        image = get_image_model().objects.create(
+            title='t', file=ContentFile(encode_test_image((10, 10, 200)), name='t.png')
+        )
+        self.assertChanges(url, lambda: AttractionImage.objects.create(attraction=attraction, image=image))
+        self.assertChanges(url, lambda: self.tag.delete())
+
+    def test_counters(self):
+        attraction = self.attractions[0]
+        for url in (f'/api/attractions/{attraction.pk}/', f'/api/destinations/{self.destination.pk}/'):
+            self.assertChanges(url, lambda: Favorite.objects.create(user=self.user, attraction=attraction))
+            self.assertChanges(url, lambda: Favorite.objects.filter(user=self.user).delete())
+        url = f'/api/attractions/{attraction.pk}/'
+        self.assertChanges(url, lambda: Attraction.objects.filter(pk=attraction.pk).update(unique_visitors=7))
+
+
+class SnapshotStalenessTests(APITestBase):
+    """不触发行程项目信号的变化也要让行程快照过期"""
+
+    def assertStales(self, change):
+        build_itinerary_snapshot(self.itinerary.pk)
+        change()
+        self.assertTrue(ItinerarySnapshot.objects.get(itinerary=self.itinerary).is_stale)
+
+    def test_attraction_deleted(self):
+        self.assertStales(self.attractions[0].delete)
+
+    def test_tags_changed(self):
+        tag = Tag.objects.create(name='湖泊', category='主题')
+        self.assertStales(lambda: self.attractions[0].tags.add(tag))
+        self.assertStales(lambda: self.destination.tags.add(tag))
+        self.assertStales(tag.save)
+        self.assertStales(tag.delete)
+
+    def test_destination_edited_through_api(self):
+        self.assertStales(lambda: self.client.patch(
+            f'/api/destinations/{self.destination.pk}/', {'description': '人间天堂'}, format='json'
+        ))
+
+    def test_favorites_count_changed(self):
+        self.assertStales(lambda: Favorite.objects.create(user=self.user, attraction=self.attractions[0]))
+        self.assertStales(lambda: self.client.post(
+            '/api/favorites/bulk/', [{'attraction': self.attractions[1].pk}], format='json'
+        ))
+
+
+class MapCellTests(APITestBase):
+    def cell_state(self):
+        return [
+            (precision, cell, count, round(latitude_sum, 6), round(longitude_sum, 6), top_id, top_rating)
+            for precision, cell, count, latitude_sum, longitude_sum, top_id, top_rating
+            in MapCell.objects.filter(count__gt=0).order_by('precision', 'cell').values_list(
+                'precision', 'cell', 'count', 'latitude_sum', 'longitude_sum',
+                'top_attraction_id', 'top_rating'
+            )
+        ]
+
+    def test_incremental_updates_match_rebuild(self):
+        rebuild_map_cells()
+        first, second, third, fourth = self.attractions
+        # 移动网格内的最高评分景点，迫使原网格重新挑选
+        fourth.latitude, fourth.longitude = 39.9, 116.4
+        fourth.save()
+        first.rating = 4.2
+        first.save()
+        Attraction.objects.filter(pk=second.pk).update(rating=2.0)
+        update_cells_rating(second.pk, second.geohash, 2.0)
+        third.delete()
+        incremental = self.cell_state()
+
+        rebuild_map_cells()
+        self.assertEqual(incremental, self.cell_state())
+
+    def test_query_count_independent_of_precisions(self):
+        rebuild_map_cells()
+        top = self.attractions[3]
+        # 同一位置评分更低的景点在各级网格中都不是最高评分景点，移除时不需要重新挑选
+        twin = Attraction.objects.create(
+            name='景点', destination=self.destination, location='西湖',
+            latitude=top.latitude, longitude=top.longitude, rating=1.0
+        )
+        with self.assertNumQueries(2):
+            remove_from_cells(twin.pk, twin.geohash, twin.latitude, twin.longitude)
+        with self.assertNumQueries(3):
+            add_to_cells(twin)
+
+
+class AcceptEncodingTests(TestCase):
+    def choose(self, header, brotli=True):
+        request = RequestFactory().get('/api/attractions/', HTTP_ACCEPT_ENCODING=header)
+        with mock.patch('api.middleware.brotli', object() if brotli else None):
+            return _choose_encoding(request)
+
+    def test_q_values(self):
+        for header, expected in (
+            ('gzip, deflate, br', 'br'),
+            ('gzip;q=0, br;q=0', None),
+            ('br;q=0, gzip', 'gzip'),
+            ('br; q=0.000, GZIP; Q=0.8', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('br;q=abc, gzip;q=0.1', 'gzip'),
+            ('*;q=0.5', 'br'),
+            ('*, br;q=0', 'gzip'),
+            ('identity', None),
+            ('', None),
+        ):
+            self.assertEqual(self.choose(header), expected, header)
+
+    def test_without_brotli(self):
+        self.assertEqual(self.choose('br, gzip;q=0', brotli=False), None)
+        self.assertEqual(self.choose('br, gzip;q=0.5', brotli=False), 'gzip')
+
+
+class ItineraryFeedQueryTests(APITestBase):
+    """行程列表读取快照，查询数与行程数量无关"""
+
+    def setUp(self):
+        super().setUp()
+        other = User.objects.create_user('other', 'other@example.com', 'pw-123456')
+        for n in range(6):
+            Itinerary.objects.create(
+                title=f'公开行程{n}', user=other, destination=self.destination, is_public=True,
+                start_date=datetime.date(2025, 5, 1), end_date=datetime.date(2025, 5, 2)
+            )
+        for user in (self.user, other):
+            Itinerary.objects.create(
+                title='私人行程', user=user, destination=self.destination, is_public=False,
+                start_date=datetime.date(2025, 5, 1), end_date=datetime.date(2025, 5, 2)
+            )
+        # 预先生成快照，之后的读取不再重建
+        self.client.get('/api/itineraries/')
+        APIClient().get('/api/itineraries/')
+
+    def test_anonymous(self):
+        client = APIClient()
+        with self.assertNumQueries(1):
+            response = client.get('/api/itineraries/')
+        self.assertEqual(len(response.data['results']), 7)
+
+    def test_logged_in(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/itineraries/')
+        # 公开行程加上自己的私人行程
+        self.assertEqual(len(response.data['results']), 8)
+
+
+class AttractionSearchTests(APITestBase):
+    def create(self, name, **fields):
+        return Attraction.objects.create(name=name, destination=self.destination, location='杭州', **fields)
+
+    def search(self, query):
+        response = self.client.get('/api/attractions/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('西湖 <b>Lake</b>-2'), ['西', '湖', '西湖', 'lake', '2'])
+        # 查询时连续汉字只取二字词条
+        self.assertEqual(tokenize('西湖十景', for_query=True), ['西湖', '湖十', '十景'])
+        self.assertEqual(tokenize('苏', for_query=True), ['苏'])
+        self.assertEqual(tokenize('!!! ，。'), [])
+
+    def test_all_terms_must_match(self):
+        tower = self.create('雷峰塔', description='夕照山上的古塔')
+        self.create('灵隐寺', description='古刹')
+        self.assertEqual(self.search('雷峰 古塔'), [tower.pk])
+        self.assertEqual(self.search('雷峰 古刹'), [])
+
+    def test_ranked_by_field_weight(self):
+        in_description = self.create('白堤', description='断桥残雪就在白堤东端')
+        in_name = self.create('断桥')
+        self.assertEqual(self.search('断桥'), [in_name.pk, in_description.pk])
+
+    def test_query_without_terms(self):
+        for query in ('!!!', '  ，。 ', '%'):
+            self.assertEqual(self.search(query), [], query)
+
+
+class KeysetPaginationTests(APITestBase):
+    """排序列取值相同时翻页也不重复、不遗漏，且不使用 OFFSET"""
+
+    def setUp(self):
+        super().setUp()
+        # 全部评分相同（默认 5.0），名称都能被检索到且相关度相同
+        Attraction.objects.bulk_create([
+            Attraction(name=f'古镇{n}', destination=self.destination, location='乌镇')
+            for n in range(23)
+        ])
+        index_attractions(Attraction.objects.all())
+        self.expected_total = Attraction.objects.count()
+
+    def walk(self, params):
+        url, ids, sqls = '/api/attractions/', [], []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            sqls.extend(query['sql'] for query in queries.captured_queries)
+            ids.extend(item['id'] for item in response.data['results'])
+            last = response.data
+            url, params = response.data['next'], None
+        self.assertFalse(any('OFFSET' in sql for sql in sqls))
+        return ids, last
+
+    def test_tied_ratings(self):
+        ids, last = self.walk({'ordering': 'rating', 'page_size': 5})
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(ids), self.expected_total)
+
+        # 从最后一页往回翻
+        back = []
+        url = last['previous']
+        while url:
+            response = self.client.get(url)
+            back = [item['id'] for item in response.data['results']] + back
+            url = response.data['previous']
+        self.assertEqual(back + [item['id'] for item in last['results']], ids)
+
+    def test_tied_search_scores(self):
+        ids, _ = self.walk({'search': '古镇', 'page_size': 4})
+        self.assertEqual(len(ids), 23)
+        self.assertEqual(len(set(ids)), 23)
+
+    def test_default_ordering(self):
+        ids, _ = self.walk({'page_size': 3})
+        self.assertEqual(ids, list(Attraction.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+
+    def test_invalid_cursor(self):
+        for cursor in ('abc', 'eyJwIjpbMV0sInIiOjB9', 'eyJwIjpbIngiLCJ5Il0sInIiOjB9'):
+            response = self.client.get('/api/attractions/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class HyperLogLogTests(TestCase):
+    def sketch(self, values):
+        sketch = HyperLogLog()
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def test_estimate(self):
+        for n in (50, 1000, 20000):
+            estimate = self.sketch(f'visitor-{i}' for i in range(n)).count()
+            self.assertLess(abs(estimate - n) / n, 0.05, n)
+        # 重复的访客不增加计数
+        self.assertEqual(self.sketch(['a'] * 100 + ['b'] * 100).count(), 2)
+
+    def test_merge(self):
+        first = self.sketch(f'visitor-{i}' for i in range(6000))
+        second = self.sketch(f'visitor-{i}' for i in range(3000, 9000))
+        merged = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+        self.assertLess(abs(merged.count() - 9000) / 9000, 0.05)
+        self.assertEqual(merged.registers, self.sketch(f'visitor-{i}' for i in range(9000)).registers)
+
+
+class UniqueVisitorTests(APITestBase):
+    def visit(self, remote_addr, forwarded_for=''):
+        response = APIClient().get(
+            f'/api/attractions/{self.attractions[0].pk}/',
+            REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for, HTTP_USER_AGENT='test'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def unique_visitors(self):
+        flush_view_counts()
+        self.attractions[0].refresh_from_db()
+        return self.attractions[0].unique_visitors
+
+    def test_repeat_visits_and_forged_forwarded_for(self):
+        for n in range(5):
+            self.visit('10.0.0.1', f'203.0.113.{n}')
+        self.assertEqual(self.unique_visitors(), 1)
+        self.assertEqual(self.attractions[0].views_count, 5)
+        self.visit('10.0.0.2')
+        self.assertEqual(self.unique_visitors(), 2)
+
+    def test_trusted_proxy(self):
+        request = RequestFactory().get(
+            '/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.7, 203.0.113.9'
+        )
+        self.assertEqual(get_client_ip(request), '10.0.0.1')
+        with self.settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(get_client_ip(request), '203.0.113.9')
+        with self.settings(TRUSTED_PROXY_COUNT=5):
+            self.assertEqual(get_client_ip(request), '198.51.100.7')
+
+    def test_window_refresh(self):
+        today = timezone.localdate()
+        active, idle = self.attractions[:2]
+        for attraction, days, visitors in ((active, 2, 3), (active, 40, 50), (idle, 31, 8)):
+            sketch = HyperLogLog()
+            for n in range(visitors):
+                sketch.add(f'{days}-{n}')
+            VisitorSketch.objects.create(
+                attraction=attraction, date=today - datetime.timedelta(days=days), registers=sketch.to_bytes()
+            )
+        Attraction.objects.filter(pk__in=[active.pk, idle.pk]).update(unique_visitors=99)
+
+        self.assertEqual(refresh_visitor_windows(), 2)
+        self.assertEqual(VisitorSketch.objects.count(), 1)
+        active.refresh_from_db()
+        idle.refresh_from_db()
+        self.assertEqual((active.unique_visitors, idle.unique_visitors), (3, 0))
+
+
+class PopularDestinationsCacheTests(APITestBase):
+    def setUp(self):
+        super().setUp()
+        self.cache = caches['shared']
+        self.cache.clear()
+
+    def test_payload_and_lock_in_shared_cache(self):
+        response = self.client.get('/api/destinations/popular/')
+        self.assertEqual([item['title'] for item in response.data], ['杭州'])
+        self.assertIsNotNone(self.cache.get(POPULAR_DESTINATIONS_KEY))
+
+        # 其他 worker 正在重建时返回旧数据，不再重复重建
+        build = mock.Mock(return_value='new')
+        self.cache.set('stale', {'payload': 'old', 'expires_at': time.time() - 1})
+        self.cache.add('stale:lock', 1)
+        self.assertEqual(get_or_build('stale', build, 60), 'old')
+        build.assert_not_called()
+        self.cache.delete('stale:lock')
+        self.assertEqual(get_or_build('stale', build, 60), 'new')
+
+    def test_invalidated_by_api_edit(self):
+        self.client.get('/api/destinations/popular/')
+        response = self.client.patch(
+            f'/api/destinations/{self.destination.pk}/', {'title': '杭州市'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/destinations/popular/')
+        self.assertEqual([item['title'] for item in response.data], ['杭州市'])
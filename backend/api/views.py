@@ -2,18 +2,316 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
-from django.db.models import F
+from rest_framework.generics import get_object_or_404
+from django.core.exceptions import ObjectDoesNotExist
+from contextlib import contextmanager
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+import hashlib
 from .models import (
     Destination, Attraction, Itinerary, ItineraryDay,
     ItineraryItem, Favorite, Tag, Comment
 )
 from .serializers import (
-    DestinationSerializer, AttractionSerializer, ItinerarySerializer,
-    ItineraryDaySerializer, ItineraryItemSerializer, FavoriteSerializer,
-    TagSerializer, CommentSerializer
+    DestinationSerializer, DestinationListSerializer, AttractionSerializer,
+    AttractionListSerializer, ItinerarySerializer, ItineraryDaySerializer,
+    ItineraryItemSerializer, FavoriteSerializer, TagSerializer, CommentSerializer,
+    ImageSerializer, split_query_param
+)
+from .querysets import (
+    comment_queryset, destination_queryset, attraction_queryset,
+    itinerary_queryset, itinerary_day_queryset, itinerary_item_queryset,
+    favorite_queryset
 )
 from rest_framework.views import APIView
+from .pagination import CreatedAtCursorPagination
+from .counters import destination_views, attraction_views, get_visitor_key
+from .caching import get_popular_destinations
+from .filters import AttractionSearchFilter, RatingDateRangeFilter
+from .search_index import query_tokens
+from .geo import nearest
+from .clusters import visible_cells
+from .snapshots import deferred_snapshot_refresh, get_snapshot, refresh_snapshot_day
+from .favorites import adjust_favorites_counts, deferred_favorites_counts
+from .exports import EXPORT_FORMATS, export_attractions
+
+class ListSerializerMixin:
+    """列表类动作使用精简的列表序列化器，嵌套关系按 ?expand= 预取"""
+    list_serializer_class = None
+    list_actions = ['list']
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def get_expand(self):
+        """列表动作返回 ?expand= 请求的关系；详情动作返回 None，即预取全部关系"""
+        if self.action in self.list_actions:
+            return split_query_param(self.request, 'expand')
+        return None
+
+class ConditionalRetrieveMixin:
+    """
+    详情接口的条件请求（ETag / Last-Modified）
+    先用一条轻量查询取出版本列、计数列和评论的最后修改时间，命中时在序列化之前直接返回 304；
+    收藏数、独立访客数由 queryset.update 维护，不更新版本列，直接计入版本；
+    每次读取都在变化的浏览量不参与版本计算，因此使用弱 ETag
+    """
+    version_field = 'updated_at'
+    version_counters = ('favorites_count', 'unique_visitors')
+    view_buffer = None
+
+    def get_version(self):
+        """返回 (主键, 最后修改时间, ETag)，对象不存在时返回 None"""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        row = queryset.select_related(None).prefetch_related(None).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).annotate(
+            comments_updated_at=Max('comments__updated_at'),
+            comments_total=Count('comments', distinct=True),
+        ).values_list(
+            'pk', self.version_field, 'comments_updated_at', 'comments_total', *self.version_counters
+        ).first()
+        if row is None:
+            return None
+
+        pk, updated_at, comments_updated_at, comments_total, *counters = row
+        timestamps = [t for t in (updated_at, comments_updated_at) if t is not None]
+        last_modified = max(timestamps) if timestamps else None
+        source = ':'.join(str(value) for value in (
+            pk, updated_at, comments_updated_at, comments_total, *counters,
+            self.request.accepted_renderer.format
+        ))
+        etag = 'W/"%s"' % hashlib.md5(source.encode('utf-8')).hexdigest()
+        return pk, last_modified, etag
+
+    def retrieve(self, request, *args, **kwargs):
+        version = self.get_version()
+        if version is not None:
+            pk, last_modified, etag = version
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                # 重新验证也算一次浏览
+                self.view_buffer.incr(pk, get_visitor_key(request))
+                return self.set_version_headers(response, version)
+
+        instance = self.get_object()
+        # 增加浏览量（缓冲后批量写回，不保存整行）
+        self.view_buffer.incr(instance.pk, get_visitor_key(request))
+        instance.views_count += 1
+        serializer = self.get_serializer(instance)
+        return self.set_version_headers(Response(serializer.data), version)
+
+    def set_version_headers(self, response, version):
+        if version is not None:
+            _, last_modified, etag = version
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+class MultiGetMixin:
+    """
+    列表接口的批量获取 ?ids=1,2,3
+    一次预取查询取出全部对象，按请求中的顺序返回（不存在的 id 跳过），不分页
+    """
+    multi_get_max_ids = 100
+
+    def get_multi_get_ids(self, request):
+        try:
+            ids = [int(value) for value in request.query_params['ids'].split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError({'ids': 'ids 须为逗号分隔的整数'})
+        # 去重并保持顺序
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > self.multi_get_max_ids:
+            raise ValidationError({'ids': f'一次最多获取 {self.multi_get_max_ids} 个对象'})
+        return ids
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        ids = self.get_multi_get_ids(request)
+        objects = self.get_queryset().in_bulk(ids)
+        results = [objects[pk] for pk in ids if pk in objects]
+        return Response(self.get_serializer(results, many=True).data)
+
+class BulkConflict(APIException):
+    status_code = 409
+    default_detail = '与已有数据冲突（如重复收藏同一景点），整批未写入'
+    default_code = 'conflict'
+
+class BulkWriteMixin:
+    """
+    批量写入接口的公共部分
+    整批数据先在内存中校验（引用的景点预先一次查询），权限只检查一次，
+    视图再用 bulk_create / bulk_update 在一个事务中写入
+    """
+    bulk_max_size = 100
+
+    def check_bulk_size(self, data):
+        if not isinstance(data, list) or not data:
+            raise ValidationError({'detail': '请提供非空的列表'})
+        if len(data) > self.bulk_max_size:
+            raise ValidationError({'detail': f'一次最多写入 {self.bulk_max_size} 条'})
+        return data
+
+    def get_bulk_body(self, data):
+        """请求体为对象的批量接口（如 {"ids": [...]}）"""
+        if not isinstance(data, dict):
+            raise ValidationError({'detail': '请求体须为对象'})
+        return data
+
+    @contextmanager
+    def bulk_atomic(self):
+        """批量写入的事务；违反唯一约束（如并发请求重复收藏）时整批回滚并返回 409"""
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError:
+            raise BulkConflict()
+
+    def get_bulk_rows(self, data):
+        rows = self.check_bulk_size(data)
+        if not all(isinstance(row, dict) for row in rows):
+            raise ValidationError({'detail': '列表中的每一项须为对象'})
+        return rows
+
+    def get_bulk_ids(self, data):
+        """解析 id 列表，重复的 id 只保留第一个"""
+        try:
+            return list(dict.fromkeys(int(pk) for pk in self.check_bulk_size(data)))
+        except (TypeError, ValueError):
+            raise ValidationError({'ids': 'ids 须为整数列表'})
+
+    def get_bulk_context(self, rows):
+        """序列化器上下文，附带整批数据引用的景点"""
+        attraction_ids = set()
+        for row in rows:
+            try:
+                attraction_ids.add(int(row['attraction']))
+            except (KeyError, TypeError, ValueError):
+                pass
+        context = self.get_serializer_context()
+        context['related_objects'] = {Attraction: Attraction.objects.in_bulk(attraction_ids)}
+        return context
+
+    def get_bulk_objects(self, ids):
+        """一次取出当前用户可修改的对象，按 ids 的顺序返回；任何一个不存在时整批拒绝"""
+        objects = self.get_queryset().select_related(None).prefetch_related(None).in_bulk(ids)
+        missing = [pk for pk in ids if pk not in objects]
+        if missing:
+            raise NotFound({'ids': missing})
+        return [objects[pk] for pk in ids]
+
+    def validate_bulk(self, rows, instances=None):
+        """逐条校验，收集全部错误后一起返回；instances 不为空时为部分更新"""
+        context = self.get_bulk_context(rows)
+        checked = []
+        for index, row in enumerate(rows):
+            instance = instances[index] if instances else None
+            checked.append(self.get_serializer_class()(
+                instance, data=row, partial=instance is not None, context=context
+            ))
+        errors = [{} if serializer.is_valid() else serializer.errors for serializer in checked]
+        if any(errors):
+            raise ValidationError(errors)
+        return [serializer.validated_data for serializer in checked]
+
+    def apply_bulk_update(self, instances, rows):
+        """把校验后的数据写到对象上，返回被修改的字段"""
+        fields = set()
+        for instance, data in zip(instances, rows):
+            for name, value in data.items():
+                setattr(instance, name, value)
+                fields.add(name)
+        return fields
+
+    def bulk_response(self, pks, status=200):
+        """按预取计划重新取出写入后的对象并序列化"""
+        objects = self.get_queryset().in_bulk(pks)
+        data = self.get_serializer([objects[pk] for pk in pks if pk in objects], many=True).data
+        return Response(data, status=status)
+
+class RelatedListMixin:
+    """
+    详情动作中的关联列表（如目的地的景点、评论）
+    按 (created_at, id) 游标分页，支持评分和时间范围过滤（RatingDateRangeFilter），
+    只为当前页预取关联数据；所属对象只确认存在，不加载详情接口的全部预取
+    """
+    related_actions = []
+    related_pagination_class = CreatedAtCursorPagination
+    related_filter_class = RatingDateRangeFilter
+
+    def get_expand(self):
+        if self.action in self.related_actions:
+            return set()
+        return super().get_expand()
+
+    def paginate_related(self, queryset, serializer_class):
+        queryset = self.related_filter_class().filter_queryset(self.request, queryset, self)
+        paginator = self.related_pagination_class()
+        # 不传入视图，列表接口的排序钩子（如按相关度）不作用于关联列表
+        page = paginator.paginate_queryset(queryset, self.request)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+class NearbyMixin:
+    """
+    附近查询 /nearby/
+    - ?lat=&lng= 指定中心点，或 ?near=<id> 以某个对象为中心（结果中不含该对象）
+    - ?radius= 半径（米），不指定时返回最近的 limit 个
+    - ?limit= 数量，默认 20
+    """
+    nearby_max_radius = 50000
+    nearby_max_limit = 100
+
+    def get_nearby_params(self, request, queryset):
+        params = request.query_params
+        try:
+            near = params.get('near')
+            if near:
+                center = queryset.model.objects.only('latitude', 'longitude').get(pk=near)
+                latitude, longitude = center.latitude, center.longitude
+                if latitude is None or longitude is None:
+                    raise ValidationError({'near': '该对象没有坐标'})
+            else:
+                latitude, longitude = float(params['lat']), float(params['lng'])
+            radius = float(params['radius']) if params.get('radius') else None
+            limit = int(params.get('limit', 20))
+        except KeyError:
+            raise ValidationError({'detail': '请提供 lat 和 lng 参数，或 near 参数'})
+        except (ValueError, ObjectDoesNotExist):
+            raise ValidationError({'detail': '参数格式不正确'})
+
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({'detail': '经纬度超出范围'})
+        if radius is not None and not (0 < radius <= self.nearby_max_radius):
+            raise ValidationError({'radius': f'半径须在 0 到 {self.nearby_max_radius} 米之间'})
+        limit = min(max(limit, 1), self.nearby_max_limit)
+        return near, latitude, longitude, radius, limit
+
+    @action(detail=False)
+    def nearby(self, request):
+        """获取附近的对象，按距离排序，每项附带 distance（米）"""
+        queryset = self.get_queryset()
+        near, latitude, longitude, radius, limit = self.get_nearby_params(request, queryset)
+        if near:
+            queryset = queryset.exclude(pk=near)
+        results = nearest(
+            queryset, latitude, longitude, limit,
+            radius=radius, max_radius=self.nearby_max_radius
+        )
+        data = self.get_serializer(results, many=True).data
+        for item, obj in zip(data, results):
+            item['distance'] = round(obj.distance)
+        return Response(data)
 
 class TagViewSet(viewsets.ModelViewSet):
     """标签视图集"""
@@ -27,9 +325,11 @@ class CommentViewSet(viewsets.ModelViewSet):
     """评论视图集"""
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = [RatingDateRangeFilter]
 
     def get_queryset(self):
-        queryset = Comment.objects.all()
+        queryset = comment_queryset()
         destination_id = self.request.query_params.get('destination', None)
         attraction_id = self.request.query_params.get('attraction', None)
 
@@ -40,58 +340,100 @@ class CommentViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    # 评论与评分统计在同一事务中写入（见 api.signals）
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class DestinationViewSet(viewsets.ModelViewSet):
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
+class DestinationViewSet(ConditionalRetrieveMixin, MultiGetMixin, NearbyMixin, RelatedListMixin,
+                         ListSerializerMixin, viewsets.ModelViewSet):
     """目的地视图集"""
     queryset = Destination.objects.all()
     serializer_class = DestinationSerializer
+    list_serializer_class = DestinationListSerializer
+    list_actions = ['list', 'popular', 'nearby']
+    related_actions = ['attractions', 'comments']
+    view_buffer = destination_views
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter]
     search_fields = ['title', 'description', 'location', 'category', 'tags__name']
 
+    def get_queryset(self):
+        return destination_queryset(expand=self.get_expand())
+
     @action(detail=False)
     def popular(self, request):
-        """获取热门目的地（按浏览量排序）"""
-        popular_destinations = self.get_queryset().order_by('-views_count')[:3]
-        serializer = self.get_serializer(popular_destinations, many=True)
-        return Response(serializer.data)
+        """获取热门目的地（按独立访客数排序，相同时按浏览量）"""
+        def build():
+            popular_destinations = self.get_queryset().order_by('-unique_visitors', '-views_count')[:3]
+            return self.get_serializer(popular_destinations, many=True).data
 
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        # 增加浏览量
-        instance.views_count = F('views_count') + 1
-        instance.save()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        # 裁剪字段的请求不走缓存
+        if 'fields' in request.query_params or 'expand' in request.query_params:
+            return Response(build())
+        return Response(get_popular_destinations(build))
 
     @action(detail=True)
     def attractions(self, request, pk=None):
-        """获取目的地下的所有景点"""
+        """
+        获取目的地下的景点（游标分页，支持 ?min_rating= ?since= 等过滤）
+        ?export=ndjson|csv 时以流式响应逐行导出全部景点，景点数量再多内存占用也不变
+        """
         destination = self.get_object()
-        attractions = destination.attractions.all()
-        serializer = AttractionSerializer(attractions, many=True)
-        return Response(serializer.data)
+        attractions = attraction_queryset(
+            destination.attractions.all(),
+            expand=split_query_param(request, 'expand')
+        )
+        export_format = request.query_params.get('export')
+        if export_format:
+            if export_format not in EXPORT_FORMATS:
+                raise ValidationError({'export': f'支持的导出格式：{", ".join(EXPORT_FORMATS)}'})
+            return export_attractions(
+                attractions.order_by('pk'), export_format, AttractionListSerializer,
+                self.get_serializer_context(), f'destination-{destination.pk}-attractions'
+            )
+        return self.paginate_related(attractions, AttractionListSerializer)
 
     @action(detail=True)
     def comments(self, request, pk=None):
-        """获取目的地的评论"""
+        """获取目的地的评论（游标分页，支持 ?min_rating= ?max_rating= ?since= ?until= 过滤）"""
         destination = self.get_object()
-        comments = destination.comments.all()
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        return self.paginate_related(
+            comment_queryset().filter(destination=destination), CommentSerializer
+        )
 
-class AttractionViewSet(viewsets.ModelViewSet):
+class AttractionViewSet(ConditionalRetrieveMixin, MultiGetMixin, NearbyMixin, RelatedListMixin,
+                        ListSerializerMixin, viewsets.ModelViewSet):
     """景点视图集"""
     queryset = Attraction.objects.all()
     serializer_class = AttractionSerializer
+    list_serializer_class = AttractionListSerializer
+    list_actions = ['list', 'nearby']
+    related_actions = ['comments']
+    view_buffer = attraction_views
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'description', 'location', 'category', 'tags__name']
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = [AttractionSearchFilter]
+
+    def get_cursor_ordering(self):
+        """检索时按相关度排序，?ordering=rating 时按预先汇总的平均分排序"""
+        # 与 search_attractions 一致按切分出的词条判断，只有标点的检索词不会标注 search_score
+        if query_tokens(self.request.query_params.get('search', '')):
+            return ('-search_score', '-id')
+        if self.request.query_params.get('ordering') == 'rating':
+            return ('-rating', '-id')
+        return None
 
     def get_queryset(self):
-        queryset = Attraction.objects.all()
+        queryset = attraction_queryset(expand=self.get_expand())
         destination_id = self.request.query_params.get('destination', None)
         category = self.request.query_params.get('category', None)
         tag = self.request.query_params.get('tag', None)
@@ -105,33 +447,86 @@ class AttractionViewSet(viewsets.ModelViewSet):
 
         return queryset
 
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        # 增加浏览量
-        instance.views_count = F('views_count') + 1
-        instance.save()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+    @action(detail=False)
+    def clusters(self, request):
+        """
+        获取地图视口内的景点聚合
+        ?bbox=西经,南纬,东经,北纬&zoom=缩放级别，每个网格返回数量、中心点和评分最高的景点
+        """
+        try:
+            west, south, east, north = [float(v) for v in request.query_params['bbox'].split(',')]
+            zoom = int(request.query_params.get('zoom', 10))
+        except (KeyError, ValueError):
+            raise ValidationError({'detail': '请提供 bbox=西经,南纬,东经,北纬 和 zoom 参数'})
+        if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+            raise ValidationError({'bbox': '视口范围不正确'})
+
+        data = []
+        for cell in visible_cells(west, south, east, north, zoom):
+            top = cell.top_attraction
+            data.append({
+                'cell': cell.cell,
+                'count': cell.count,
+                'latitude': cell.latitude,
+                'longitude': cell.longitude,
+                'top': top and {
+                    'id': top.id,
+                    'name': top.name,
+                    'rating': top.rating,
+                    'cover_image': ImageSerializer(top.cover_image).data if top.cover_image else None,
+                },
+            })
+        return Response(data)
 
     @action(detail=True)
     def comments(self, request, pk=None):
-        """获取景点的评论"""
+        """获取景点的评论（游标分页，支持 ?min_rating= ?max_rating= ?since= ?until= 过滤）"""
         attraction = self.get_object()
-        comments = attraction.comments.all()
-        serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        return self.paginate_related(
+            comment_queryset().filter(attraction=attraction), CommentSerializer
+        )
 
 class ItineraryViewSet(viewsets.ModelViewSet):
     """行程视图集"""
     serializer_class = ItinerarySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CreatedAtCursorPagination
+
+    def use_snapshots(self):
+        """列表和详情读取行程快照；裁剪字段的请求仍实时序列化"""
+        params = self.request.query_params
+        return (
+            self.action in ('list', 'retrieve')
+            and 'fields' not in params and 'expand' not in params
+        )
 
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            return Itinerary.objects.filter(
-                user=self.request.user
-            ) | Itinerary.objects.filter(is_public=True)
-        return Itinerary.objects.filter(is_public=True)
+        queryset = Itinerary.objects.visible_to(self.request.user)
+        if self.use_snapshots():
+            return queryset.select_related('snapshot')
+        return itinerary_queryset(
+            queryset, expand=split_query_param(self.request, 'expand')
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_snapshots():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([get_snapshot(i).data for i in page])
+        return Response([get_snapshot(i).data for i in queryset])
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_snapshots():
+            return super().retrieve(request, *args, **kwargs)
+        snapshot = get_snapshot(self.get_object())
+        etag = f'W/"{snapshot.itinerary_id}-{snapshot.version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(snapshot.data)
+        response['ETag'] = etag
+        return response
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -142,7 +537,9 @@ class ItineraryDayViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return ItineraryDay.objects.filter(
+        return itinerary_day_queryset(
+            expand=split_query_param(self.request, 'expand')
+        ).filter(
             itinerary__user=self.request.user
         )
 
@@ -154,13 +551,15 @@ class ItineraryDayViewSet(viewsets.ModelViewSet):
         )
         serializer.save(itinerary=itinerary)
 
-class ItineraryItemViewSet(viewsets.ModelViewSet):
+class ItineraryItemViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     """行程项目视图集"""
     serializer_class = ItineraryItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return ItineraryItem.objects.filter(
+        return itinerary_item_queryset(
+            expand=split_query_param(self.request, 'expand')
+        ).filter(
             day__itinerary__user=self.request.user
         )
 
@@ -172,16 +571,138 @@ class ItineraryItemViewSet(viewsets.ModelViewSet):
         )
         serializer.save(day=day)
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+    def get_bulk_day(self, day_id):
+        return get_object_or_404(ItineraryDay, id=day_id, itinerary__user=self.request.user)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        """
+        批量写入行程项目（bulk_create / bulk_update 不触发信号，快照在最后按日程刷新）
+        - POST {"day": 日程ID, "items": [{...}, ...]} 批量添加到同一天
+        - PATCH [{"id": 项目ID, ...}, ...] 批量部分更新
+        - DELETE {"ids": [项目ID, ...]} 批量删除
+        """
+        if request.method == 'DELETE':
+            items = self.get_bulk_objects(self.get_bulk_ids(self.get_bulk_body(request.data).get('ids')))
+            with self.bulk_atomic(), deferred_snapshot_refresh():
+                ItineraryItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+            return Response(status=204)
+
+        if request.method == 'POST':
+            body = self.get_bulk_body(request.data)
+            day = self.get_bulk_day(body.get('day'))
+            rows = self.validate_bulk(self.get_bulk_rows(body.get('items')))
+            with self.bulk_atomic():
+                items = ItineraryItem.objects.bulk_create([ItineraryItem(day=day, **row) for row in rows])
+                refresh_snapshot_day(day.itinerary_id, day.pk)
+            return self.bulk_response([item.pk for item in items], status=201)
+
+        rows = self.get_bulk_rows(request.data)
+        items = self.get_bulk_objects(self.get_bulk_ids([row.get('id') for row in rows]))
+        if len(items) != len(rows):
+            raise ValidationError({'detail': '同一项目不能出现多次'})
+        fields = self.apply_bulk_update(items, self.validate_bulk(rows, items))
+        with self.bulk_atomic():
+            if fields:
+                ItineraryItem.objects.bulk_update(items, fields)
+                self.refresh_days(items)
+        return self.bulk_response([item.pk for item in items])
+
+    def refresh_days(self, items):
+        days = ItineraryDay.objects.filter(
+            pk__in={item.day_id for item in items}
+        ).values_list('itinerary_id', 'pk')
+        for itinerary_id, day_id in days:
+            refresh_snapshot_day(itinerary_id, day_id)
+
+    @action(detail=False, methods=['post'])
+    def reorder(self, request):
+        """
+        调整一天内项目的顺序：POST {"day": 日程ID, "items": [项目ID, ...]}
+        项目按 start_time 排序，新顺序中的项目依次占用原有的时间段
+        """
+        body = self.get_bulk_body(request.data)
+        day = self.get_bulk_day(body.get('day'))
+        ids = self.get_bulk_ids(body.get('items'))
+        items = {item.pk: item for item in ItineraryItem.objects.filter(day=day)}
+        if set(ids) != set(items) or len(ids) != len(body['items']):
+            raise ValidationError({'items': '须恰好列出该日程的全部项目，且每个只出现一次'})
+
+        slots = sorted((item.start_time, item.end_time) for item in items.values())
+        ordered = [items[pk] for pk in ids]
+        for item, (start_time, end_time) in zip(ordered, slots):
+            item.start_time, item.end_time = start_time, end_time
+        with self.bulk_atomic():
+            ItineraryItem.objects.bulk_update(ordered, ['start_time', 'end_time'])
+            refresh_snapshot_day(day.itinerary_id, day.pk)
+        return self.bulk_response(ids)
+
+class FavoriteViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     serializer_class = FavoriteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user)
+        return favorite_queryset(
+            expand=split_query_param(self.request, 'expand')
+        ).filter(user=self.request.user)
 
+    # 收藏与收藏数在同一事务中写入（见 api.signals）
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        """
+        批量写入收藏（bulk_create / bulk_update 不触发信号，收藏数在最后按景点批量调整）
+        - POST [{"attraction": 景点ID, "note": ...}, ...] 批量收藏，已收藏的景点跳过
+        - PATCH [{"id": 收藏ID, "note": ...}, ...] 批量修改
+        - DELETE {"ids": [收藏ID, ...]} 批量取消收藏
+        """
+        if request.method == 'DELETE':
+            favorites = self.get_bulk_objects(self.get_bulk_ids(self.get_bulk_body(request.data).get('ids')))
+            with self.bulk_atomic(), deferred_favorites_counts():
+                Favorite.objects.filter(pk__in=[favorite.pk for favorite in favorites]).delete()
+            return Response(status=204)
+
+        if request.method == 'POST':
+            rows = self.validate_bulk(self.get_bulk_rows(request.data))
+            existing = set(Favorite.objects.filter(
+                user=request.user, attraction__in=[row['attraction'] for row in rows]
+            ).values_list('attraction_id', flat=True))
+            favorites = {}
+            for row in rows:
+                if row['attraction'].pk not in existing:
+                    favorites.setdefault(row['attraction'].pk, Favorite(user=request.user, **row))
+            with self.bulk_atomic():
+                created = Favorite.objects.bulk_create(list(favorites.values()))
+                adjust_favorites_counts({favorite.attraction_id: 1 for favorite in created})
+            return self.bulk_response([favorite.pk for favorite in created], status=201)
+
+        rows = self.get_bulk_rows(request.data)
+        favorites = self.get_bulk_objects(self.get_bulk_ids([row.get('id') for row in rows]))
+        if len(favorites) != len(rows):
+            raise ValidationError({'detail': '同一收藏不能出现多次'})
+        old_attractions = [favorite.attraction_id for favorite in favorites]
+        fields = self.apply_bulk_update(favorites, self.validate_bulk(rows, favorites))
+        with self.bulk_atomic(), deferred_favorites_counts() as deltas:
+            if fields:
+                Favorite.objects.bulk_update(favorites, fields)
+            for old, favorite in zip(old_attractions, favorites):
+                if old != favorite.attraction_id:
+                    deltas[old] -= 1
+                    deltas[favorite.attraction_id] += 1
+        return self.bulk_response([favorite.pk for favorite in favorites])
+
 # 测试视图
 class TestView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -55,6 +55,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     # 添加 CORS 中间件，注意要放在最前面
     "corsheaders.middleware.CorsMiddleware",
+    # 压缩 API 响应，见 api/middleware.py
+    "api.middleware.APICompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     # 添加本地化中间件
     'django.middleware.locale.LocaleMiddleware',
@@ -217,10 +219,48 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',  # 安装了 orjson 时使用，见 api/renderers.py
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10
 }
 
+# 缓存：default 为进程内缓存，其余两个须为各进程共享的缓存，多台机器部署时换成 Redis/Memcached
+# - shared：接口响应缓存及其重建锁（见 api/caching.py），数据库缓存的 add 为唯一键插入，锁对所有 worker 生效；
+#   缓存表由迁移 0022 创建
+# - view_counts：暂存写库失败的浏览量，flush_view_counts 命令才能取到其他进程暂存的计数；
+#   文件缓存在同一台机器上共享，且不依赖数据库
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "api_cache",
+    },
+    "view_counts": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "view_counts"),
+    },
+}
+
+# 浏览量缓冲写回间隔（秒），见 api/counters.py
+VIEW_COUNT_FLUSH_INTERVAL = 10
+# 暂存浏览量使用的缓存
+VIEW_COUNT_CACHE = "view_counts"
+# 热门排序使用的独立访客统计窗口（天）
+UNIQUE_VISITOR_WINDOW_DAYS = 30
+# 应用前面的可信反向代理层数；为 0 时不信任 X-Forwarded-For，按 REMOTE_ADDR 识别访客，见 api/counters.py
+TRUSTED_PROXY_COUNT = 0
+# 接口响应缓存使用的缓存
+RESPONSE_CACHE = "shared"
+# 热门目的地缓存的刷新间隔（秒），见 api/caching.py
+POPULAR_DESTINATIONS_CACHE_TIMEOUT = 300
+# API 响应压缩的最小字节数，见 api/middleware.py
+API_COMPRESSION_MIN_SIZE = 1024
+
 # JWT设置
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -298,3 +338,10 @@ CSRF_COOKIE_SAMESITE = 'Lax'  # 允许跨站请求
 
 # 高德地图API配置
 AMAP_API_KEY = '421fb6b7f66308b350e986904a2a8724'  # 请替换为您的实际API密钥
+# 高德接口的每秒请求配额和采集并发线程数
+AMAP_QPS = 3
+AMAP_MAX_WORKERS = 8
+
+# 采集图片的下载大小上限和像素数上限，超过时放弃该图片
+IMAGE_DOWNLOAD_MAX_BYTES = 15 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
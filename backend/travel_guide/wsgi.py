@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "travel_guide.settings.dev")
 
 application = get_wsgi_application()
+
+# 浏览量由后台线程定时写回，见 api/counters.py
+from api.counters import enable_background_flush  # noqa: E402
+
+enable_background_flush()
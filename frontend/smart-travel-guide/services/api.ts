@@ -49,6 +49,26 @@ export interface Itinerary {
   // 添加其他必要字段
 }
 
+// 游标分页的列表响应，?count=true 时才有 count
+export interface Paginated<T> {
+  count?: number;
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+// 沿 next 链接取完全部分页（next 为完整 URL）
+const getAllPages = async <T>(url: string, params?: Record<string, unknown>) => {
+  const results: T[] = [];
+  let response = await axiosInstance.get<Paginated<T>>(url, { params });
+  results.push(...response.data.results);
+  while (response.data.next) {
+    response = await axiosInstance.get<Paginated<T>>(response.data.next);
+    results.push(...response.data.results);
+  }
+  return results;
+};
+
 // API服务
 export const api = {
   // 认证相关
@@ -77,12 +97,26 @@ export const api = {
       const response = await axiosInstance.get<Destination>(`/destinations/${id}/`);
       return response.data;
     },
+    // 批量获取，按 ids 的顺序返回，一次最多 100 个
+    getByIds: async (ids: number[]) => {
+      const response = await axiosInstance.get<Destination[]>('/destinations/', {
+        params: { ids: ids.join(',') },
+      });
+      return response.data;
+    },
     getPopular: async () => {
       const response = await axiosInstance.get<Destination[]>('/destinations/popular/');
       return response.data;
     },
+    // 目的地下的景点按游标分页，这里取完全部分页
     getAttractions: async (id: number) => {
-      const response = await axiosInstance.get<Attraction[]>(`/destinations/${id}/attractions/`);
+      return getAllPages<Attraction>(`/destinations/${id}/attractions/`, { page_size: 100 });
+    },
+    // 单页景点，cursor 为上一页响应中的 next 链接
+    getAttractionsPage: async (id: number, cursor?: string | null) => {
+      const response = cursor
+        ? await axiosInstance.get<Paginated<Attraction>>(cursor)
+        : await axiosInstance.get<Paginated<Attraction>>(`/destinations/${id}/attractions/`);
       return response.data;
     },
   },
@@ -97,6 +131,13 @@ export const api = {
       const response = await axiosInstance.get<Attraction>(`/attractions/${id}/`);
       return response.data;
     },
+    // 批量获取，按 ids 的顺序返回，一次最多 100 个
+    getByIds: async (ids: number[]) => {
+      const response = await axiosInstance.get<Attraction[]>('/attractions/', {
+        params: { ids: ids.join(',') },
+      });
+      return response.data;
+    },
   },
 
   // 行程相关